@@ -1,68 +1,191 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
 from .models import (
     Country, League, Team, Fixture,
     HeadToHead, TeamStat, PredictionType,
     Prediction, Gambler, System_User, PasswordResetToken,
-    Player, SuspendedPlayer, InjuredPlayer, TeamForm, PredictedResult
+    Player, SuspendedPlayer, InjuredPlayer, TeamForm, TeamFormSnapshot, PredictedResult, ParameterSet,
+    OutboundEmail,
 )
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import rolling
+from .database import estimated_count
+from .store import resolve_predictions, save_predictions
+from .utils import model_registry
+
+# Fixtures one "Refresh predictions" may run inference for inside a request.
+REFRESH_LIMIT = 1000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Take an unfiltered changelist's size from the database's statistics
+    once they put the table above PROPHET_ADMIN_EXACT_COUNT_LIMIT rows;
+    filtered lists, and smaller tables, are counted exactly."""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > getattr(settings, 'PROPHET_ADMIN_EXACT_COUNT_LIMIT', 100000):
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # Changelists of tables that grow to millions of rows: no COUNT(*) over
+    # the whole table, and no "N total" next to filtered counts.
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class LeagueListFilter(admin.RelatedFieldListFilter):
+    """League choices in one query; League.__str__ would fetch each country."""
+
+    def field_choices(self, field, request, model_admin):
+        leagues = League.objects.select_related('country').order_by('country__name', 'name')
+        return [(league.pk, str(league)) for league in leagues]
+
 
 @admin.register(Country)
 class CountryAdmin(admin.ModelAdmin):
     list_display = ('id', 'name')
+    search_fields = ('name',)
 
 @admin.register(League)
 class LeagueAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'country')
     list_filter = ('country',)
-    search_fields = ('name',)
+    list_select_related = ('country',)
+    search_fields = ('name', 'country__name')
+    autocomplete_fields = ('country',)
+
+    def get_queryset(self, request):
+        # Joined here rather than only in the changelist so the autocomplete
+        # widgets, which show League.__str__, get the country too.
+        return super().get_queryset(request).select_related(*self.list_select_related)
 
 @admin.register(Team)
 class TeamAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'league')
-    list_filter = ('league',)
+    list_display = ('id', 'name', 'league', 'current_form')
+    list_filter = (('league', LeagueListFilter),)
+    list_select_related = ('league__country',)
     search_fields = ('name',)
+    autocomplete_fields = ('league',)
+    actions = ['rebuild_form_snapshots']
+
+    def get_queryset(self, request):
+        # Last-five W-D-L from the newest snapshot, one indexed subquery per row.
+        latest = TeamFormSnapshot.objects.filter(
+            team=OuterRef('pk'), as_of__lte=timezone.localdate(),
+        ).order_by('-as_of').annotate(
+            wdl=Concat(
+                Cast('last5_wins', CharField()), Value('-'),
+                Cast('last5_draws', CharField()), Value('-'),
+                Cast('last5_losses', CharField()),
+                output_field=CharField(),
+            )
+        ).values('wdl')[:1]
+        return super().get_queryset(request).annotate(current_form=Subquery(latest))
+
+    @admin.display(description='Form (last 5 W-D-L)')
+    def current_form(self, obj):
+        return obj.current_form or '-'
+
+    @admin.action(description='Rebuild form snapshots of selected teams')
+    def rebuild_form_snapshots(self, request, queryset):
+        team_ids = list(queryset.values_list('pk', flat=True))
+        rolling.rebuild(team_ids)
+        self.message_user(request, f'Rebuilt form snapshots of {len(team_ids)} teams.')
 
 @admin.register(Fixture)
-class FixtureAdmin(admin.ModelAdmin):
-    list_display = ('id', 'league', 'home_team', 'away_team', 'date', 'time')
-    list_filter = ('league',)
-    search_fields = ('home_team', 'away_team')
+class FixtureAdmin(LargeTableAdmin):
+    list_display = ('id', 'league', 'home_team', 'away_team', 'date', 'time', 'home_goals', 'away_goals')
+    list_filter = (('league', LeagueListFilter),)
+    list_select_related = ('league__country', 'home_team', 'away_team')
+    date_hierarchy = 'date'
+    search_fields = ('home_team__name', 'away_team__name')
+    autocomplete_fields = ('league', 'home_team', 'away_team')
+    actions = ['refresh_predictions']
+
+    def get_queryset(self, request):
+        # As in LeagueAdmin: the autocomplete widgets show Fixture.__str__.
+        return super().get_queryset(request).select_related(*self.list_select_related)
+
+    @admin.action(description='Refresh stored predictions of selected fixtures')
+    def refresh_predictions(self, request, queryset):
+        if queryset.count() > REFRESH_LIMIT:
+            self.message_user(
+                request, f'Select at most {REFRESH_LIMIT} fixtures, or run manage.py precompute_predictions.',
+                messages.WARNING,
+            )
+            return
+        compiled = model_registry.get()
+        predictions, recomputed = resolve_predictions(queryset, compiled, force=True)
+        save_predictions(recomputed, compiled.version)
+        self.message_user(request, f'Refreshed predictions of {len(predictions)} fixtures.')
 
 @admin.register(HeadToHead)
-class HeadToHeadAdmin(admin.ModelAdmin):
-    list_display = ('id', 'fixture', 'match_date', 'result')
-    list_filter = ('fixture',)
-    search_fields = ('match_date', 'result')
+class HeadToHeadAdmin(LargeTableAdmin):
+    list_display = ('id', 'team_a', 'team_a_goals', 'team_b_goals', 'team_b', 'venue', 'match_date')
+    list_filter = ('venue', 'match_date')
+    list_select_related = ('team_a', 'team_b')
+    search_fields = ('team_a__name', 'team_b__name')
+    autocomplete_fields = ('team_a', 'team_b')
 
 @admin.register(TeamStat)
-class TeamStatAdmin(admin.ModelAdmin):
+class TeamStatAdmin(LargeTableAdmin):
     list_display = ('id', 'fixture', 'team')
-    list_filter = ('fixture',)
-    search_fields = ('team',)
-    
+    list_filter = ('fixture__date',)
+    list_select_related = ('team', 'fixture__home_team', 'fixture__away_team')
+    search_fields = ('team__name',)
+    autocomplete_fields = ('fixture', 'team')
+
 @admin.register(Player)
-class PlayerAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name')
-    list_filter = ('name',)
-    search_fields = ('name',)
+class PlayerAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'player_code', 'team', 'position', 'effect')
+    list_filter = ('position', 'effect')
+    list_select_related = ('team',)
+    search_fields = ('name', 'player_code')
+    autocomplete_fields = ('team',)
 
 @admin.register(SuspendedPlayer)
 class SuspendedPlayerAdmin(admin.ModelAdmin):
     list_display = ('player',)
-    list_filter = ('player',)
-    search_fields = ('player',)
-    
+    list_select_related = ('player',)
+    search_fields = ('player__name', 'player__player_code')
+    autocomplete_fields = ('player',)
+
 @admin.register(InjuredPlayer)
 class InjuredPlayerAdmin(admin.ModelAdmin):
     list_display = ('player',)
-    list_filter = ('player',)
-    search_fields = ('player',)
+    list_select_related = ('player',)
+    search_fields = ('player__name', 'player__player_code')
+    autocomplete_fields = ('player',)
 
 @admin.register(TeamForm)
-class TeamFormAdmin(admin.ModelAdmin):
-    list_display = ('team', 'fixture', 'game_number', 'result', 'over_under', 'gg')
-    list_filter = ('team', 'fixture')
-    search_fields = ('team', 'fixture')
+class TeamFormAdmin(LargeTableAdmin):
+    list_display = ('team', 'fixture', 'game_number', 'result', 'over_under', 'gg', 'venue')
+    list_filter = ('result', 'over_under', 'gg', 'venue', 'fixture__date')
+    list_select_related = ('team', 'fixture__home_team', 'fixture__away_team')
+    search_fields = ('team__name',)
+    autocomplete_fields = ('team', 'fixture')
+
+@admin.register(TeamFormSnapshot)
+class TeamFormSnapshotAdmin(LargeTableAdmin):
+    list_display = (
+        'team', 'as_of', 'last5_wins', 'last5_draws', 'last5_losses', 'last10_wins', 'last10_draws',
+        'last10_losses', 'over_rate', 'gg_rate', 'home_wins', 'home_played', 'away_wins', 'away_played',
+    )
+    list_filter = ('as_of',)
+    list_select_related = ('team',)
+    search_fields = ('team__name',)
+    readonly_fields = [field.name for field in TeamFormSnapshot._meta.fields]
 
 @admin.register(PredictionType)
 class PredictionTypeAdmin(admin.ModelAdmin):
@@ -71,31 +194,62 @@ class PredictionTypeAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 @admin.register(Prediction)
-class PredictionAdmin(admin.ModelAdmin):
+class PredictionAdmin(LargeTableAdmin):
     list_display = ('id', 'fixture', 'prediction_type', 'value', 'prediction_site', 'site_accuracy', 'team_effort')
-    list_filter = ('fixture', 'team_effort')
-    search_fields = ('prediction_site', 'site_accuracy', 'team_effort')
+    list_filter = ('prediction_type', 'team_effort', 'fixture__date')
+    list_select_related = ('fixture__home_team', 'fixture__away_team', 'prediction_type')
+    search_fields = ('prediction_site', 'fixture__home_team__name', 'fixture__away_team__name')
+    autocomplete_fields = ('fixture',)
 
 @admin.register(PredictedResult)
-class PredictedResultAdmin(admin.ModelAdmin):
+class PredictedResultAdmin(LargeTableAdmin):
     list_display = ('id', 'fixture', 'home_team', 'away_team', 'prediction_type', 'predicted_result', 'created_at')
-    list_filter = ('fixture', 'home_team', 'away_team', 'prediction_type')
-    search_fields = ('predicted_result',)
+    list_filter = ('prediction_type', 'fixture__date')
+    list_select_related = ('fixture__home_team', 'fixture__away_team', 'home_team', 'away_team', 'prediction_type')
+    search_fields = ('predicted_result', 'home_team__name', 'away_team__name')
+    autocomplete_fields = ('fixture', 'home_team', 'away_team')
+    actions = ['mark_stale']
+
+    @admin.action(description='Mark selected predictions stale')
+    def mark_stale(self, request, queryset):
+        # A blank fingerprint never matches, so the next read or precompute run recomputes them.
+        updated = queryset.update(evidence_fingerprint='')
+        self.message_user(request, f'{updated} predictions will be recomputed.')
+
+@admin.register(ParameterSet)
+class ParameterSetAdmin(admin.ModelAdmin):
+    list_display = ('version', 'alpha', 'fixtures', 'is_active', 'created_at')
+    list_filter = ('is_active',)
+    exclude = ('cpds',)
+    readonly_fields = ('version', 'alpha', 'fixtures', 'is_active', 'created_at')
 
 @admin.register(Gambler)
 class GamblerAdmin(admin.ModelAdmin):
     list_display = ('id', 'first_name', 'last_name', 'email_address', 'phone_number')
-    list_filter = ('email_address',)
     search_fields = ('email_address', 'phone_number')
 
 @admin.register(System_User)
 class System_UserAdmin(admin.ModelAdmin):
     list_display = ('username',)
-    list_filter = ('username',)
     search_fields = ('username',)
 
 @admin.register(PasswordResetToken)
 class PasswordResetTokenAdmin(admin.ModelAdmin):
-    list_display = ('username', 'token')
-    list_filter = ('username', 'token',)
-    search_fields = ('username', 'token', 'created_at')
+    list_display = ('username', 'created_at', 'expires_at')
+    list_filter = ('expires_at',)
+    list_select_related = ('username',)
+    search_fields = ('username__username',)
+    readonly_fields = ('token_hash', 'created_at', 'expires_at')
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(LargeTableAdmin):
+    list_display = ('to', 'subject', 'kind', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('to',)
+    readonly_fields = ('attempts', 'lease', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected messages now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f'{updated} messages queued for retry.')
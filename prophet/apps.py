@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ProphetConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'prophet'
+
+    def ready(self):
+        from . import database, profiles, rolling, stats
+        database.connect_signals()
+        profiles.connect_signals()
+        rolling.connect_signals()
+        stats.connect_signals()
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+
+from .models import Fixture
+from .training import counts_before, cpd_values
+from .utils import (
+    EVIDENCE_VARIABLES, MARKETS, TensorInference, build_evidence_batch, build_model, market_outcomes,
+    model_registry,
+)
+
+LOG_LOSS_FLOOR = 1e-15
+INJURY_COLUMNS = [EVIDENCE_VARIABLES.index('HomeInjuries'), EVIDENCE_VARIABLES.index('AwayInjuries')]
+
+
+def season_start_month():
+    return getattr(settings, 'PROPHET_SEASON_START_MONTH', 7)
+
+
+def season_of(day, start_month=None):
+    """(label, first day, first day of the next season) of the season containing ``day``."""
+    start_month = start_month or season_start_month()
+    year = day.year if day.month >= start_month else day.year - 1
+    if start_month == 1:
+        return str(year), date(year, 1, 1), date(year + 1, 1, 1)
+    return f'{year}/{str(year + 1)[-2:]}', date(year, start_month, 1), date(year + 1, start_month, 1)
+
+
+def finished_fixtures(leagues=(), date_from=None, date_to=None):
+    fixtures = Fixture.objects.filter(home_goals__isnull=False, away_goals__isnull=False)
+    if leagues:
+        fixtures = fixtures.filter(league_id__in=leagues)
+    if date_from:
+        fixtures = fixtures.filter(date__gte=date_from)
+    if date_to:
+        fixtures = fixtures.filter(date__lte=date_to)
+    return fixtures
+
+
+def seasons(fixtures):
+    """Distinct seasons of ``fixtures``, oldest first."""
+    found = {season_of(day) for day in fixtures.order_by().values_list('date', flat=True).distinct()}
+    return sorted(found, key=lambda season: season[1])
+
+
+class Scoreboard:
+    """Running accuracy, log-loss and Brier sums per (league, season, market)."""
+
+    def __init__(self, totals=None):
+        # key -> [fixtures, correct, log loss sum, brier sum]
+        self.totals = defaultdict(lambda: [0, 0, 0.0, 0.0])
+        for key, values in (totals or {}).items():
+            self.totals[key] = list(values)
+
+    def add(self, league_id, season, variable, answer, probabilities, outcome):
+        entry = self.totals[league_id, season, variable]
+        entry[0] += 1
+        entry[1] += int(answer == outcome)
+        entry[2] -= float(np.log(max(probabilities[outcome], LOG_LOSS_FLOOR)))
+        target = np.zeros(len(probabilities))
+        target[outcome] = 1
+        entry[3] += float(np.sum((probabilities - target) ** 2))
+
+    def merge(self, other):
+        for key, values in other.totals.items():
+            entry = self.totals[key]
+            for position, value in enumerate(values):
+                entry[position] += value
+        return self
+
+    def summary(self, group):
+        """Rows of (group value, market, fixtures, accuracy, log loss, brier); ``group``
+        picks the key parts to keep, e.g. ``lambda league, season: league``."""
+        grouped = defaultdict(lambda: [0, 0, 0.0, 0.0])
+        for (league_id, season, variable), values in self.totals.items():
+            entry = grouped[group(league_id, season), variable]
+            for position, value in enumerate(values):
+                entry[position] += value
+        return [
+            (name, variable, n, correct / n, log_loss / n, brier / n)
+            for (name, variable), (n, correct, log_loss, brier) in sorted(
+                grouped.items(), key=lambda item: (str(item[0][0]), MARKETS.index(item[0][1]))
+            )
+            if n
+        ]
+
+    def as_dict(self):
+        return {key: tuple(values) for key, values in self.totals.items()}
+
+
+def season_tensor(start, walk_forward, alpha, injuries=True):
+    """Inference for a season: fitted on earlier seasons only, or the served model."""
+    if not walk_forward:
+        return model_registry.get().tensor
+    return TensorInference(build_model(cpd_values(counts_before(start, injuries), alpha)))
+
+
+def backtest_season(
+    season, leagues=(), date_from=None, date_to=None, walk_forward=True, alpha=1.0, injuries=False,
+):
+    """Score every finished fixture of one season; returns Scoreboard.as_dict().
+
+    Evidence is rebuilt as of kickoff (form and head-to-head before the
+    fixture date, the fixture's own external predictions) and, with
+    ``walk_forward``, the CPDs are fitted from fixtures before the season
+    started. Injuries are not dated, so both injury variables are held at
+    "no critical injury", in the walk-forward counts too; ``injuries``
+    reads today's injury list instead, which leaks the present into every
+    season scored.
+    """
+    label, start, end = season
+    fixtures = finished_fixtures(leagues, date_from, date_to).filter(date__gte=start, date__lt=end)
+    batch = build_evidence_batch(fixtures)
+    if not injuries:
+        batch.matrix[:, INJURY_COLUMNS] = 0
+    scoreboard = Scoreboard()
+    if not len(batch.fixtures):
+        return scoreboard.as_dict()
+
+    tensor = season_tensor(start, walk_forward, alpha, injuries)
+    answers = tensor.answer_matrix(batch.matrix)
+    posteriors = tensor.posterior_matrices(batch.matrix)
+    for row, fixture in enumerate(batch.fixtures):
+        outcomes = market_outcomes(fixture.home_goals, fixture.away_goals)
+        for position, variable in enumerate(MARKETS):
+            if outcomes[variable] is None:
+                continue  # a score the CorrectScore market has no state for
+            scoreboard.add(
+                fixture.league_id, label, variable, answers[row, position], posteriors[variable][row],
+                outcomes[variable],
+            )
+    return scoreboard.as_dict()
@@ -0,0 +1,170 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import instrumentation
+from .instrumentation import ServerTimingMiddleware
+from .models import Fixture, League, PredictedResult
+from .synthetic import generate
+from .utils import ModelRegistry, PredictionEngine, build_evidence_batch, model_registry, predict_batch
+from .views import LeagueFixturesPredictionView
+
+
+def timed(func, *args, **kwargs):
+    """(result, seconds, queries) of one call."""
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+    return result, elapsed, len(queries)
+
+
+def metric(seconds, queries, fixtures=None):
+    values = {'seconds': round(seconds, 6), 'queries': queries}
+    if fixtures:
+        values['fixtures'] = fixtures
+        values['fixtures_per_second'] = round(fixtures / max(seconds, 1e-9), 1)
+    return values
+
+
+def per_fixture(fixtures, func):
+    """Run ``func(fixture)`` for each fixture; one metric for the whole loop."""
+    def loop():
+        for fixture in fixtures:
+            func(fixture)
+    _, seconds, queries = timed(loop)
+    return metric(seconds, queries, len(fixtures))
+
+
+def cheapest(func, repeat=5, number=20000):
+    """Seconds per call of ``func``: the best of ``repeat`` timed loops."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - started)
+    return best / number
+
+
+def instrumentation_overhead(url, page_seconds):
+    """Upper bound on what ServerTimingMiddleware adds to one request of ``url``.
+
+    A wall-clock A/B of a few-millisecond page cannot resolve 1%, so the
+    bound is built from parts: the middleware's fixed cost around a view
+    that does nothing, plus the cost of one timed call or query (the
+    larger of the two) for every timer the page starts, counted from the
+    instrumentation's own perf_counter calls.
+    """
+    response = HttpResponse()
+    middleware = ServerTimingMiddleware.__new__(ServerTimingMiddleware)
+    middleware.get_response = lambda request: response
+    middleware.is_async = False
+    request = RequestFactory().get(url)
+    fixed = cheapest(lambda: middleware(request), number=2000) - cheapest(lambda: response)
+
+    def noop():
+        pass
+
+    def execute(sql, params, many, context):
+        pass
+
+    wrapped = instrumentation.timed('render')(noop)
+    token = instrumentation.current.set(instrumentation.RequestTimings())
+    try:
+        per_timer = max(
+            cheapest(wrapped) - cheapest(noop),
+            cheapest(lambda: instrumentation.time_query(execute, '', (), False, {})) - cheapest(
+                lambda: execute('', (), False, {}),
+            ),
+        )
+    finally:
+        instrumentation.current.reset(token)
+
+    with override_settings(PROPHET_INSTRUMENTATION=True), mock.patch.object(
+        instrumentation, 'perf_counter', wraps=time.perf_counter,
+    ) as clock:
+        Client().get(url)  # a new client, so its handler loads the middleware with the setting on
+    timers = max(clock.call_count - 2, 0) // 2  # two reads per timer, one each for the request total
+    seconds = max(fixed, 0) + timers * max(per_timer, 0)
+    return {
+        **metric(seconds, 0), 'timers': timers,
+        'share': round(seconds / page_seconds, 6) if page_seconds else 0.0,
+    }
+
+
+def run_scale(scale, seed=0, sample=200, pgmpy_sample=20):
+    """Generate ``scale`` into the current database and measure every stage.
+
+    Single-fixture stages run over the first ``sample`` upcoming fixtures
+    (``pgmpy_sample`` for live pgmpy inference); batch stages and the league
+    page cover all upcoming fixtures. Returns {'rows': ..., 'metrics': ...}.
+    """
+    rows, seconds, queries = timed(generate, scale, seed=seed)
+    metrics = {'generate': metric(seconds, queries)}
+
+    registry = ModelRegistry(with_table=True)
+    compiled, seconds, queries = timed(registry.get)
+    metrics['compile'] = metric(seconds, queries)
+
+    upcoming = Fixture.objects.filter(date__gte=timezone.localdate())
+    count = upcoming.count()
+    singles = list(upcoming.select_related('home_team', 'away_team').order_by('pk')[:sample])
+
+    metrics['evidence_single'] = per_fixture(
+        singles, lambda fixture: PredictionEngine(fixture=fixture, compiled=compiled).get_evidence(),
+    )
+    _, seconds, queries = timed(build_evidence_batch, upcoming)
+    metrics['evidence_batch'] = metric(seconds, queries, count)
+
+    metrics['inference_single'] = per_fixture(
+        singles, lambda fixture: PredictionEngine(fixture=fixture, compiled=compiled).predict_all(),
+    )
+    metrics['inference_single_pgmpy'] = per_fixture(
+        singles[:pgmpy_sample],
+        lambda fixture: PredictionEngine(fixture=fixture, compiled=compiled, use_table=False).predict_all(),
+    )
+    _, seconds, queries = timed(predict_batch, upcoming, compiled)
+    metrics['inference_batch'] = metric(seconds, queries, count)
+
+    # The page stores what it predicts, so the first request is cold and the
+    # second warm; the served model is compiled beforehand in both cases.
+    model_registry.get()
+    league = League.objects.order_by('pk').first()
+    url = reverse('league-fixtures', args=[league.pk])
+    client = Client()
+    PredictedResult.objects.all().delete()
+    page_fixtures = min(upcoming.filter(league=league).count(), LeagueFixturesPredictionView.paginate_by)
+    for name in ('league_page_cold', 'league_page_warm'):
+        response, seconds, queries = timed(client.get, url)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} answered {response.status_code}.')
+        metrics[name] = metric(seconds, queries, page_fixtures)
+    metrics['instrumentation_overhead'] = instrumentation_overhead(url, metrics['league_page_warm']['seconds'])
+    cache.clear()
+    return {'rows': rows, 'metrics': metrics}
+
+
+def compare(previous, current):
+    """Rows of (scale, metric, old seconds, new seconds, change, old queries, new queries)
+    for every metric present in both reports."""
+    old = {result['scale']: result['metrics'] for result in previous['results']}
+    rows = []
+    for result in current['results']:
+        for name, values in result['metrics'].items():
+            before = old.get(result['scale'], {}).get(name)
+            if before is None:
+                continue
+            change = values['seconds'] / before['seconds'] - 1 if before['seconds'] else 0.0
+            rows.append((
+                result['scale'], name, before['seconds'], values['seconds'], change,
+                before['queries'], values['queries'],
+            ))
+    return rows
@@ -0,0 +1,142 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.backends.signals import connection_created
+
+# Models whose reads serve the prediction pages, the API and the dashboard.
+REPLICA_MODELS = {
+    'country', 'league', 'team', 'fixture', 'headtohead', 'teamform', 'teamformsnapshot', 'player',
+    'injuredplayer', 'suspendedplayer', 'predictiontype', 'prediction', 'predictedresult',
+    'dashboardcounter', 'gambler',
+}
+# Served models that the read path fills in itself: stored predictions (checked
+# against the evidence they were computed from), their market types and the
+# dashboard counters. Writing them while serving a GET must not pin the client
+# to the primary.
+DERIVED_MODELS = {'predictedresult', 'predictiontype', 'dashboardcounter'}
+PIN_COOKIE = 'prophet_primary'
+
+pin_state = ContextVar('prophet_replica_pin', default=None)
+
+
+class PinState:
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def replicas():
+    return getattr(settings, 'PROPHET_READ_REPLICAS', [])
+
+
+def pins_reads(model):
+    # Writes to models never read from a replica (sessions, the cache table,
+    # accounts) cannot be missing from one, so they do not pin either.
+    name = model._meta.model_name
+    return model._meta.app_label == 'prophet' and name in REPLICA_MODELS and name not in DERIVED_MODELS
+
+
+class ReplicaRouter:
+    """Send prediction and dashboard reads made while serving a request to
+    a read replica; everything else, and every write, goes to the primary.
+
+    A request is pinned to the primary once it writes a replica-served model
+    other than the DERIVED_MODELS, when it is not a safe method, inside a
+    transaction, or for PROPHET_REPLICA_PIN_SECONDS after the same client's
+    last such write (see ReplicaPinningMiddleware). Outside a request
+    (management commands, workers) all reads use the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = pin_state.get()
+        aliases = replicas()
+        if state is None or state.pinned or not aliases:
+            return None
+        if model._meta.app_label != 'prophet' or model._meta.model_name not in REPLICA_MODELS:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        state = pin_state.get()
+        if state is not None and pins_reads(model):
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """Scope replica routing to the request and carry a client's writes
+    over to its next requests with a short-lived cookie."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = PinState(pinned=request.method not in ('GET', 'HEAD', 'OPTIONS') or PIN_COOKIE in request.COOKIES)
+        token = pin_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            pin_state.reset(token)
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'PROPHET_REPLICA_PIN_SECONDS', 15),
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+def estimated_count(model, using=DEFAULT_DB_ALIAS):
+    """The database's own row estimate for ``model``'s table, or None.
+
+    Reads planner statistics instead of counting, so it costs the same on
+    any table size but is only as fresh as the last ANALYZE.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)'
+    elif connection.vendor == 'mysql':
+        sql = 'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s'
+    elif connection.vendor == 'sqlite':
+        # ANALYZE stores "<rows> <rows per key>..." for each index of the table.
+        sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1'
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:  # sqlite_stat1 only exists after the first ANALYZE
+        return None
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None  # PostgreSQL reports -1 before the first ANALYZE
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'PROPHET_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def connect_signals():
+    connection_created.connect(configure_sqlite, dispatch_uid='prophet.database.configure_sqlite')
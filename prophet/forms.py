@@ -1,4 +1,5 @@
 from django import forms
+from .importers import FILE_EXTENSIONS, IMPORT_KINDS
 from .models import (
     Country, League, Team, Fixture,
     HeadToHead, TeamStat, PredictionType,
@@ -92,4 +93,11 @@ class ResetForm(forms.Form):  # Use forms.Form instead of ModelForm
         return user
 
 class UploadFileForm(forms.Form):
-    file = forms.FileField(label='Select a CSV or Excel file')
+    kind = forms.ChoiceField(
+        label='Import', choices=IMPORT_KINDS,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    file = forms.FileField(
+        label='Select a CSV or Excel file',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': ','.join(FILE_EXTENSIONS)})
+    )
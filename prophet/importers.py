@@ -0,0 +1,522 @@
+import codecs
+import csv
+import time as clock
+from datetime import date, time
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+
+from . import rolling, stats, training
+from .models import Country, League, Team, Fixture, TeamForm, HeadToHead, Player, InjuredPlayer
+
+
+class ImportReport:
+    max_errors = 200
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.errors = []  # (row number, message)
+        self.error_count = 0
+        self.started = clock.monotonic()
+        self.elapsed = 0.0
+
+    def add_error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((row_number, message))
+
+    def finish(self):
+        self.elapsed = clock.monotonic() - self.started
+        self.errors.sort(key=lambda error: error[0])
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f'{self.rows} {self.kind} rows in {self.elapsed:.2f}s ({self.rows_per_second:.0f} rows/sec): '
+            f'{self.created} created, {self.updated} updated, {self.error_count} errors'
+        )
+
+
+def read_csv(uploaded_file):
+    """Yield one dict per CSV row, decoding the upload as it is read."""
+    uploaded_file.seek(0)
+    reader = csv.DictReader(codecs.iterdecode(uploaded_file, 'utf-8-sig'))
+    for row in reader:
+        yield {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+
+
+def read_excel(uploaded_file):
+    """Yield one dict per worksheet row using openpyxl's streaming reader."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValidationError('Excel imports need the openpyxl package; upload a CSV file instead.')
+
+    uploaded_file.seek(0)
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip().lower() if cell is not None else '' for cell in next(rows, ())]
+        for values in rows:
+            yield {
+                key: '' if value is None else str(value).strip()
+                for key, value in zip(header, values) if key
+            }
+    finally:
+        workbook.close()
+
+
+FILE_EXTENSIONS = ('.csv', '.xlsx', '.xlsm')
+
+
+def read_rows(uploaded_file):
+    name = uploaded_file.name.lower()
+    if name.endswith('.csv'):
+        return read_csv(uploaded_file)
+    if name.endswith(('.xlsx', '.xlsm')):
+        return read_excel(uploaded_file)
+    raise ValidationError(f'Unsupported file type; upload a {", ".join(FILE_EXTENSIONS)} file.')
+
+
+def parse_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value[:10])
+
+
+def parse_time(value):
+    return time.fromisoformat(value)
+
+
+def parse_score(value):
+    home_goals, away_goals = value.split('-')
+    return int(home_goals), int(away_goals)
+
+
+def parse_choice(value, choices):
+    allowed = {key.lower(): key for key, _ in choices}
+    if value.lower() not in allowed:
+        raise ValueError(f'{value!r} is not one of {", ".join(allowed.values())}')
+    return allowed[value.lower()]
+
+
+class UnknownName(ValueError):
+    pass
+
+
+class NameCache:
+    """Country, league and team ids by name.
+
+    Missing names are created only when ``create`` is set (the importers
+    that introduce teams) and only while a chunk is being written, inside its
+    transaction; other importers reject rows that name unknown teams.
+    """
+
+    def __init__(self, create=False):
+        self.create = create
+        self.created = []  # (cache, key) added in the current chunk
+        self.countries = {name: pk for pk, name in Country.objects.values_list('pk', 'name')}
+        self.leagues = {
+            (country_id, name): pk for pk, country_id, name in League.objects.values_list('pk', 'country_id', 'name')
+        }
+        self.teams = {
+            (league_id, name): pk for pk, league_id, name in Team.objects.values_list('pk', 'league_id', 'name')
+        }
+
+    def add(self, cache, key, make):
+        if not self.create:
+            raise UnknownName()
+        cache[key] = make().pk
+        self.created.append((cache, key))
+        return cache[key]
+
+    def country(self, name):
+        if name in self.countries:
+            return self.countries[name]
+        try:
+            return self.add(self.countries, name, lambda: Country.objects.get_or_create(name=name)[0])
+        except UnknownName:
+            raise UnknownName(f'Unknown country {name!r}.')
+
+    def league(self, country_name, name):
+        key = (self.country(country_name), name)
+        if key in self.leagues:
+            return self.leagues[key]
+        try:
+            return self.add(self.leagues, key, lambda: League.objects.create(country_id=key[0], name=name))
+        except UnknownName:
+            raise UnknownName(f'Unknown league {name!r} in {country_name}.')
+
+    def team(self, country_name, league_name, name):
+        key = (self.league(country_name, league_name), name)
+        if key in self.teams:
+            return self.teams[key]
+        try:
+            return self.add(self.teams, key, lambda: Team.objects.create(league_id=key[0], name=name))
+        except UnknownName:
+            raise UnknownName(f'Unknown team {name!r} in {league_name} ({country_name}).')
+
+    def commit(self):
+        self.created.clear()
+
+    def rollback(self):
+        # The chunk's transaction took the new rows with it.
+        for cache, key in self.created:
+            del cache[key]
+        self.created.clear()
+
+
+class RowImporter:
+    """Base for one import kind: parse rows, then upsert them a chunk at a time.
+
+    ``parse`` keeps country, league and team names as given; ``flush`` runs
+    inside the chunk's transaction and resolves them to ids there.
+    """
+
+    kind = None
+    columns = ()
+    optional_columns = ()
+    counted = ()  # dashboard counters that bulk writes of this kind can change
+    creates_names = False  # whether unknown countries, leagues and teams are created
+
+    def __init__(self, names):
+        self.names = names
+        self.rejected = []  # (row number, message) found while flushing
+
+    def reject(self, row_number, message):
+        self.rejected.append((row_number, message))
+
+    def parse(self, row):
+        raise NotImplementedError
+
+    def flush(self, parsed, row_numbers):
+        """Upsert parsed rows; returns (created, updated)."""
+        raise NotImplementedError
+
+    def resolved(self, parsed, row_numbers, resolve):
+        """Yield (row number, resolve(item)), rejecting rows with unknown names."""
+        for number, item in zip(row_numbers, parsed):
+            try:
+                yield number, resolve(item)
+            except UnknownName as exc:
+                self.reject(number, str(exc))
+
+    def fixture_names(self, row):
+        return row['country'], row['league'], row['home_team'], row['away_team'], parse_date(row['date'])
+
+    def fixture_key(self, names):
+        country, league, home_team, away_team, fixture_date = names
+        return (
+            self.names.league(country, league),
+            self.names.team(country, league, home_team),
+            self.names.team(country, league, away_team),
+            fixture_date,
+        )
+
+    def existing_fixtures(self, keys):
+        leagues = {key[0] for key in keys}
+        dates = {key[3] for key in keys}
+        fixtures = Fixture.objects.filter(league_id__in=leagues, date__in=dates)
+        return {
+            (fixture.league_id, fixture.home_team_id, fixture.away_team_id, fixture.date): fixture
+            for fixture in fixtures
+        }
+
+
+class FixtureImporter(RowImporter):
+    kind = 'fixtures'
+    columns = ('country', 'league', 'home_team', 'away_team', 'date', 'time')
+    counted = ('fixtures',)
+    creates_names = True
+
+    def parse(self, row):
+        return self.fixture_names(row), parse_time(row['time'])
+
+    def flush(self, parsed, row_numbers):
+        rows = dict(
+            resolved for _, resolved in self.resolved(
+                parsed, row_numbers, lambda item: (self.fixture_key(item[0]), item[1]),
+            )
+        )
+        existing = self.existing_fixtures(rows)
+        changed = []
+        new = []
+        for key, kickoff in rows.items():
+            fixture = existing.get(key)
+            if fixture is None:
+                league_id, home_id, away_id, fixture_date = key
+                new.append(Fixture(
+                    league_id=league_id, home_team_id=home_id, away_team_id=away_id,
+                    date=fixture_date, time=kickoff,
+                ))
+            elif fixture.time != kickoff:
+                fixture.time = kickoff
+                changed.append(fixture)
+        Fixture.objects.bulk_create(new)
+        Fixture.objects.bulk_update(changed, ['time'])
+        return len(new), len(changed)
+
+
+class FixtureChildImporter(RowImporter):
+    """Rows that hang off a fixture identified by its natural key."""
+
+    def resolve_key(self, fixture_names, key):
+        return key
+
+    def flush(self, parsed, row_numbers):
+        rows = list(self.resolved(
+            parsed, row_numbers,
+            lambda item: (self.fixture_key(item[0]), self.resolve_key(item[0], item[1]), item[2]),
+        ))
+        fixtures = self.existing_fixtures({fixture_key for _, (fixture_key, _, _) in rows})
+        resolved = []
+        for number, (fixture_key, key, values) in rows:
+            fixture = fixtures.get(fixture_key)
+            if fixture is None:
+                self.reject(number, 'Fixture does not exist; import it first.')
+                continue
+            resolved.append((fixture.pk,) + key + (values,))
+        return self.upsert(resolved)
+
+
+class TeamFormImporter(FixtureChildImporter):
+    kind = 'forms'
+    columns = FixtureImporter.columns[:5] + ('team', 'game_number', 'result', 'over_under', 'gg')
+    optional_columns = ('venue',)
+    fields = ['result', 'over_under', 'gg', 'venue']
+
+    def parse(self, row):
+        values = (
+            parse_choice(row['result'], TeamForm.RESULT_CHOICES),
+            parse_choice(row['over_under'], TeamForm.OVER_UNDER_CHOICES),
+            parse_choice(row['gg'], TeamForm.GG_CHOICES),
+            parse_choice(row['venue'], TeamForm.VENUE_CHOICES) if row.get('venue') else '',
+        )
+        return self.fixture_names(row), (row['team'], int(row['game_number'])), values
+
+    def resolve_key(self, fixture_names, key):
+        team, game_number = key
+        return self.names.team(fixture_names[0], fixture_names[1], team), game_number
+
+    def upsert(self, resolved):
+        existing = {
+            (form.fixture_id, form.team_id, form.game_number): form
+            for form in TeamForm.objects.filter(fixture_id__in={row[0] for row in resolved})
+        }
+        new, changed = [], []
+        for fixture_id, team_id, game_number, values in resolved:
+            form = existing.get((fixture_id, team_id, game_number))
+            if form is None:
+                form = TeamForm(fixture_id=fixture_id, team_id=team_id, game_number=game_number)
+                new.append(form)
+            elif tuple(getattr(form, field) for field in self.fields) != values:
+                changed.append(form)
+            else:
+                continue
+            for field, value in zip(self.fields, values):
+                setattr(form, field, value)
+        TeamForm.objects.bulk_create(new)
+        TeamForm.objects.bulk_update(changed, self.fields)
+        # bulk writes skip the signals; changed rows keep their ordering key.
+        rolling.apply_forms(new + changed)
+        return len(new), len(changed)
+
+
+class ResultImporter(FixtureChildImporter):
+    kind = 'results'
+    columns = FixtureImporter.columns[:5] + ('result',)
+
+    def parse(self, row):
+        return self.fixture_names(row), (), parse_score(row['result'])
+
+    def upsert(self, resolved):
+        scores = dict(resolved)
+        fixtures = Fixture.objects.filter(pk__in=scores).only('pk', 'home_goals', 'away_goals')
+        recorded, corrected = [], []
+        for fixture in fixtures:
+            if (fixture.home_goals, fixture.away_goals) == scores[fixture.pk]:
+                continue
+            (recorded if fixture.home_goals is None else corrected).append(fixture)
+            fixture.home_goals, fixture.away_goals = scores[fixture.pk]
+        Fixture.objects.bulk_update(recorded + corrected, ['home_goals', 'away_goals'])
+        # Counted fixtures are recounted with the corrected score by the next update_counts.
+        if corrected:
+            training.retract([fixture.pk for fixture in corrected])
+        return len(recorded), len(corrected)
+
+
+class HeadToHeadImporter(RowImporter):
+    kind = 'head_to_head'
+    columns = ('country', 'league', 'home_team', 'away_team', 'match_date', 'result')
+    optional_columns = ('neutral',)
+
+    creates_names = True
+
+    def parse(self, row):
+        home_goals, away_goals = parse_score(row['result'])
+        return (
+            (row['country'], row['league'], row['home_team'], row['away_team']),
+            (parse_date(row['match_date']), home_goals, away_goals),
+            row.get('neutral', '').lower() in ('1', 'yes', 'true'),
+        )
+
+    def meeting(self, item):
+        (country, league, home_team, away_team), (match_date, home_goals, away_goals), neutral = item
+        return HeadToHead(**HeadToHead.fields_for(
+            self.names.team(country, league, home_team), self.names.team(country, league, away_team),
+            match_date, home_goals, away_goals, neutral=neutral,
+        ))
+
+    def flush(self, parsed, row_numbers):
+        meetings = {}
+        for number, meeting in self.resolved(parsed, row_numbers, self.meeting):
+            if meeting.team_a_id == meeting.team_b_id:
+                self.reject(number, 'A team cannot meet itself.')
+                continue
+            meetings[meeting.team_a_id, meeting.team_b_id, meeting.match_date] = meeting
+        known = {
+            key for key in HeadToHead.objects.filter(
+                team_a_id__in={key[0] for key in meetings}, match_date__in={key[2] for key in meetings},
+            ).values_list('team_a_id', 'team_b_id', 'match_date')
+            if key in meetings
+        }
+        HeadToHead.objects.bulk_create(
+            meetings.values(),
+            update_conflicts=True,
+            unique_fields=['team_a', 'team_b', 'match_date'],
+            update_fields=['team_a_goals', 'team_b_goals', 'venue'],
+        )
+        return len(meetings) - len(known), len(known)
+
+
+class PlayerImporter(RowImporter):
+    kind = 'players'
+    columns = ('country', 'league', 'team', 'player_code', 'name', 'position', 'effect', 'rating')
+
+    creates_names = True
+
+    def parse(self, row):
+        return (row['country'], row['league'], row['team']), Player(
+            player_code=row['player_code'],
+            name=row['name'],
+            position=parse_choice(row['position'], Player.POSITION_CHOICES),
+            effect=parse_choice(row['effect'], Player.EFFECT_CHOICES),
+            rating=int(row['rating'] or 0),
+        )
+
+    def with_team(self, item):
+        team_names, player = item
+        player.team_id = self.names.team(*team_names)
+        return player
+
+    def flush(self, parsed, row_numbers):
+        players = {player.player_code: player for _, player in self.resolved(parsed, row_numbers, self.with_team)}
+        known = set(Player.objects.filter(player_code__in=players).values_list('player_code', flat=True))
+        Player.objects.bulk_create(
+            players.values(),
+            update_conflicts=True,
+            unique_fields=['player_code'],
+            update_fields=['team', 'name', 'position', 'effect', 'rating'],
+        )
+        return len(players) - len(known), len(known)
+
+
+class InjuryImporter(RowImporter):
+    kind = 'injuries'
+    columns = ('player_code',)
+
+    def parse(self, row):
+        return row['player_code']
+
+    def flush(self, parsed, row_numbers):
+        players = dict(Player.objects.filter(player_code__in=parsed).values_list('player_code', 'pk'))
+        for number, code in zip(row_numbers, parsed):
+            if code not in players:
+                self.reject(number, f'Unknown player code {code}.')
+        already = set(InjuredPlayer.objects.filter(player_id__in=players.values()).values_list('player_id', flat=True))
+        InjuredPlayer.objects.bulk_create(
+            [InjuredPlayer(player_id=pk) for pk in players.values() if pk not in already],
+            ignore_conflicts=True,
+        )
+        return len(set(players.values()) - already), 0
+
+
+IMPORTERS = {
+    importer.kind: importer
+    for importer in (
+        FixtureImporter, ResultImporter, TeamFormImporter, HeadToHeadImporter, PlayerImporter, InjuryImporter,
+    )
+}
+
+IMPORT_KINDS = [
+    ('fixtures', 'Fixtures'),
+    ('results', 'Results'),
+    ('forms', 'Team forms'),
+    ('head_to_head', 'Head to head'),
+    ('players', 'Players'),
+    ('injuries', 'Injuries'),
+]
+
+
+def import_rows(kind, rows, chunk_size=2000):
+    """Stream ``rows`` (dicts) into the tables for ``kind``.
+
+    Rows are parsed one at a time and upserted in chunks, each chunk in its
+    own transaction. Rows that fail to parse or refer to missing fixtures,
+    teams or players are reported by row number and skipped; a chunk that
+    fails to write is rolled back and reported against its row range.
+    """
+    report = ImportReport(kind)
+    importer_class = IMPORTERS[kind]
+    importer = importer_class(NameCache(create=importer_class.creates_names))
+    chunk = []
+    chunk_rows = []
+
+    def flush():
+        try:
+            with transaction.atomic():
+                created, updated = importer.flush(chunk, chunk_rows)
+        except (ValidationError, ValueError, DatabaseError) as exc:
+            importer.names.rollback()
+            message = '; '.join(exc.messages) if isinstance(exc, ValidationError) else str(exc)
+            report.add_error(chunk_rows[0], f'Rows {chunk_rows[0]}-{chunk_rows[-1]} not imported: {message}')
+        else:
+            importer.names.commit()
+            report.created += created
+            report.updated += updated
+        for number, message in importer.rejected:
+            report.add_error(number, message)
+        importer.rejected.clear()
+        chunk.clear()
+        chunk_rows.clear()
+
+    for number, row in enumerate(rows, start=2):  # row 1 is the header
+        report.rows += 1
+        missing = [column for column in importer.columns if not row.get(column)]
+        if missing:
+            report.add_error(number, f'Missing {", ".join(missing)}.')
+            continue
+        try:
+            chunk.append(importer.parse(row))
+        except (ValidationError, ValueError, KeyError) as exc:
+            report.add_error(number, '; '.join(exc.messages) if isinstance(exc, ValidationError) else str(exc))
+            continue
+        chunk_rows.append(number)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    if report.created and importer.counted:
+        # bulk_create skips the post_save signals that keep these current.
+        stats.reconcile(importer.counted)
+
+    report.finish()
+    return report
+
+
+def import_file(kind, uploaded_file, chunk_size=2000):
+    return import_rows(kind, read_rows(uploaded_file), chunk_size=chunk_size)
@@ -0,0 +1,241 @@
+import functools
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, PermissionDenied
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.template.backends.django import Template as DjangoTemplate
+
+current = ContextVar('prophet_request_timings', default=None)
+
+
+class RequestTimings:
+    """What one request spent on SQL, inference and rendering, in seconds.
+
+    The async views hand work to several threads that share one instance,
+    so updates take a lock and time spent in parallel threads adds up.
+    """
+
+    __slots__ = ('started', 'queries', 'sql', 'inference', 'render', 'lock', 'threads')
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.sql = self.inference = self.render = 0.0
+        self.lock = threading.Lock()
+        self.threads = threading.local()
+
+    def running(self):
+        """Categories this thread is timing, so nested calls count once."""
+        try:
+            return self.threads.running
+        except AttributeError:
+            running = self.threads.running = set()
+            return running
+
+    def add(self, category, seconds, queries=0):
+        with self.lock:
+            setattr(self, category, getattr(self, category) + seconds)
+            self.queries += queries
+
+
+def timed(category):
+    """Add the wrapped call's duration to the current request's ``category``.
+
+    Outside an instrumented request this is one context variable lookup.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = current.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            running = timings.running()
+            if category in running:
+                return func(*args, **kwargs)
+            running.add(category)
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.add(category, perf_counter() - started)
+                running.discard(category)
+        return wrapper
+    return decorator
+
+
+def time_query(execute, sql, params, many, context):
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('sql', perf_counter() - started, queries=1)
+
+
+def install_render_timer():
+    # Every Django template render goes through the backend's Template.render,
+    # whether from TemplateResponse or the render() shortcut; includes and
+    # extends run inside it and are counted once.
+    if not getattr(DjangoTemplate.render, 'prophet_timed', False):
+        DjangoTemplate.render = timed('render')(DjangoTemplate.render)
+        DjangoTemplate.render.prophet_timed = True
+
+
+def add_query_timer(sender=None, connection=None, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def install_query_timer():
+    # Connections opened later get the wrapper when they connect, including
+    # the per-thread ones behind sync_to_async and the inference pool.
+    for connection in connections.all(initialized_only=True):
+        add_query_timer(connection=connection)
+    connection_created.connect(add_query_timer, dispatch_uid='prophet.instrumentation.time_query')
+
+
+class Histogram:
+    """A Prometheus histogram with one label, kept in this process's memory."""
+
+    def __init__(self, name, help_text, buckets, label='view'):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label = label
+        self.series = {}  # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [0] * len(self.buckets) + [0.0, 0]
+            if position < len(self.buckets):
+                series[position] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: list(values) for key, values in self.series.items()}
+        for label_value, values in sorted(series.items()):
+            label = f'{self.label}="{escape_label(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values[-1]}')
+            lines.append(f'{self.name}_sum{{{label}}} {values[-2]:.6f}')
+            lines.append(f'{self.name}_count{{{label}}} {values[-1]}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self.series.clear()
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+HISTOGRAMS = {
+    'total': Histogram('prophet_request_seconds', 'Time to build the response.', SECONDS),
+    'sql': Histogram('prophet_request_sql_seconds', 'Time spent in SQL queries.', SECONDS),
+    'queries': Histogram('prophet_request_sql_queries', 'SQL queries run.', QUERIES),
+    'inference': Histogram('prophet_request_inference_seconds', 'Time spent in model inference.', SECONDS),
+    'render': Histogram('prophet_request_render_seconds', 'Time spent rendering templates.', SECONDS),
+}
+
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS.values():
+        lines += histogram.render()
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this process's request histograms.
+
+    Open to staff and to the scrapers listed in PROPHET_METRICS_ALLOWED_IPS.
+    """
+    if not getattr(settings, 'PROPHET_INSTRUMENTATION', False):
+        raise Http404()
+    allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'PROPHET_METRICS_ALLOWED_IPS', ())
+    if not (allowed or request.user.is_active and request.user.is_staff):
+        raise PermissionDenied()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ServerTimingMiddleware:
+    """Time SQL, inference and template rendering per request.
+
+    The figures go out as a Server-Timing header and into the /metrics
+    histograms, labelled by URL name. Streaming bodies are produced after
+    the middleware returns, so only the work before the first byte counts.
+    With PROPHET_INSTRUMENTATION off the middleware removes itself.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROPHET_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_query_timer()
+        install_render_timer()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        total = perf_counter() - timings.started
+        response['Server-Timing'] = ', '.join([
+            f'sql;dur={timings.sql * 1000:.3f};desc="{timings.queries} queries"',
+            f'inference;dur={timings.inference * 1000:.3f}',
+            f'render;dur={timings.render * 1000:.3f}',
+            f'total;dur={total * 1000:.3f}',
+        ])
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unmatched'
+        for name, value in (
+            ('total', total), ('sql', timings.sql), ('queries', timings.queries),
+            ('inference', timings.inference), ('render', timings.render),
+        ):
+            HISTOGRAMS[name].observe(view, value)
+        return response
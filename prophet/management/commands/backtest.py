@@ -0,0 +1,106 @@
+import json
+import os
+import time
+from concurrent.futures import as_completed
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prophet.backtest import Scoreboard, backtest_season, finished_fixtures, seasons
+from prophet.models import League
+from prophet.training import update_counts
+from prophet.utils import model_registry, worker_pool
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay finished fixtures with the data available before kickoff and score '
+        'every market (accuracy, log loss, Brier) by league and season. Injuries are '
+        'not dated, so injury evidence is held at "no critical injury" unless '
+        '--injuries is given. Seasons are scored in parallel, one worker task each.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', type=int, action='append', default=[], help='League id (repeatable).')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='First fixture date.')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last fixture date.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (1 runs inline).')
+        parser.add_argument('--alpha', type=float, default=1.0, help='Dirichlet pseudo-count for walk-forward fits.')
+        parser.add_argument(
+            '--parameters', choices=['walk-forward', 'current'], default='walk-forward',
+            help='Fit each season on earlier seasons only, or score the currently served model.',
+        )
+        parser.add_argument(
+            '--injuries', action='store_true',
+            help='Use the current injury list as evidence for every fixture (leaks the present into past seasons).',
+        )
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['alpha'] <= 0:
+            raise CommandError('--workers and --alpha must be positive.')
+
+        fixtures = finished_fixtures(options['league'], options['date_from'], options['date_to'])
+        selected = seasons(fixtures)
+        if not selected:
+            self.stdout.write('No finished fixtures selected.')
+            return
+
+        walk_forward = options['parameters'] == 'walk-forward'
+        if walk_forward:
+            update_counts()  # every finished fixture needs its kickoff evidence recorded
+        else:
+            model_registry.get()  # compile before forking so every worker inherits it
+        task = {
+            'leagues': options['league'], 'date_from': options['date_from'], 'date_to': options['date_to'],
+            'walk_forward': walk_forward, 'alpha': options['alpha'], 'injuries': options['injuries'],
+        }
+
+        started = time.monotonic()
+        scoreboard = Scoreboard()
+        for totals in self.run_seasons(selected, task, options['workers']):
+            scoreboard.merge(Scoreboard(totals))
+        elapsed = time.monotonic() - started
+
+        leagues = dict(League.objects.values_list('pk', 'name'))
+        by_season = scoreboard.summary(lambda league_id, season: (leagues.get(league_id, league_id), season))
+        overall = scoreboard.summary(lambda league_id, season: 'all')
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'parameters': options['parameters'],
+                'injuries': 'current' if options['injuries'] else 'none',
+                'seconds': round(elapsed, 3),
+                'results': [self.as_json(row, league=name, season=season) for (name, season), *row in by_season],
+                'overall': [self.as_json(row) for _, *row in overall],
+            }, indent=2))
+            return
+
+        self.stdout.write(f'{"League":<24} {"Season":<8} {"Market":<16} {"N":>7} {"Acc":>6} {"LogLoss":>8} {"Brier":>6}')
+        for (name, season), variable, n, accuracy, log_loss, brier in by_season:
+            self.stdout.write(f'{name:<24.24} {season:<8} {variable:<16} {n:>7} {accuracy:>6.3f} {log_loss:>8.3f} {brier:>6.3f}')
+        for _, variable, n, accuracy, log_loss, brier in overall:
+            self.stdout.write(self.style.SUCCESS(
+                f'{"All":<24} {"":<8} {variable:<16} {n:>7} {accuracy:>6.3f} {log_loss:>8.3f} {brier:>6.3f}'
+            ))
+        self.stdout.write(f'{len(selected)} season(s) in {elapsed:.2f}s.')
+        if options['injuries']:
+            self.stdout.write(self.style.WARNING(
+                'Injury evidence is the current injury list, not the list at kickoff: past seasons see it too.'
+            ))
+        else:
+            self.stdout.write('Injury evidence held at "no critical injury": injuries are not dated.')
+
+    def as_json(self, row, **group):
+        variable, n, accuracy, log_loss, brier = row
+        return {**group, 'market': variable, 'fixtures': n, 'accuracy': accuracy, 'log_loss': log_loss, 'brier': brier}
+
+    def run_seasons(self, selected, task, workers):
+        if workers == 1 or len(selected) == 1:
+            for season in selected:
+                yield backtest_season(season, **task)
+            return
+
+        with worker_pool(min(workers, len(selected))) as pool:
+            futures = [pool.submit(backtest_season, season, **task) for season in selected]
+            for future in as_completed(futures):
+                yield future.result()
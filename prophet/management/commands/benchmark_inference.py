@@ -0,0 +1,54 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from prophet.utils import EVIDENCE_CARD, EVIDENCE_VARIABLES, infer_markets, model_registry
+
+
+def random_evidence(size, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.stack([rng.integers(0, card, size) for card in EVIDENCE_CARD], axis=1).astype(np.int8)
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the NumPy tensor backend against pgmpy VariableElimination on random '
+        'evidence matrices. pgmpy is timed on a sample of rows and extrapolated.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixtures', type=int, nargs='+', default=[10_000, 1_000_000], help='Batch sizes.')
+        parser.add_argument('--pgmpy-sample', type=int, default=200, help='Rows answered by pgmpy per batch size.')
+        parser.add_argument('--chunk-size', type=int, default=250_000, help='Rows per tensor gather.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['pgmpy_sample'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--pgmpy-sample and --chunk-size must be positive.')
+
+        started = time.perf_counter()
+        compiled = model_registry.get()
+        self.stdout.write(f'Compiled model {compiled.version} in {time.perf_counter() - started:.2f}s.')
+
+        for size in options['fixtures']:
+            matrix = random_evidence(size, options['seed'])
+
+            started = time.perf_counter()
+            for start in range(0, size, options['chunk_size']):
+                chunk = matrix[start:start + options['chunk_size']]
+                compiled.tensor.answer_matrix(chunk)
+                compiled.tensor.posterior_matrices(chunk)
+            tensor_rate = size / max(time.perf_counter() - started, 1e-9)
+
+            sample = matrix[:options['pgmpy_sample']]
+            started = time.perf_counter()
+            for row in sample:
+                infer_markets(compiled.inference, dict(zip(EVIDENCE_VARIABLES, (int(value) for value in row))))
+            pgmpy_rate = len(sample) / max(time.perf_counter() - started, 1e-9)
+
+            self.stdout.write(
+                f'{size} fixtures: tensor {tensor_rate:,.0f} fixtures/sec ({size / tensor_rate:.3f}s), '
+                f'pgmpy {pgmpy_rate:,.0f} fixtures/sec (~{size / pgmpy_rate:,.0f}s), '
+                f'{tensor_rate / pgmpy_rate:,.0f}x'
+            )
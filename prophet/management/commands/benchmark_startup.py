@@ -0,0 +1,56 @@
+import re
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+HEAVY_MODULES = ('pgmpy', 'torch', 'pandas', 'networkx', 'scipy')
+
+
+def parse_importtime(output):
+    """[(cumulative microseconds, module)] for top-level imports, and the set of all modules."""
+    top, modules = [], set()
+    for line in output.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, module = match.groups()
+        modules.add(module)
+        if len(indent) == 1:
+            top.append((int(cumulative), module))
+    return sorted(top, reverse=True), modules
+
+
+class Command(BaseCommand):
+    help = (
+        'Time a fresh `python -X importtime manage.py <command>` process and list the '
+        'slowest top-level imports, to keep heavy libraries out of process start-up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--command', default='check', help='manage.py command to start (default: check).')
+        parser.add_argument('--runs', type=int, default=3, help='Processes to start; the fastest is reported.')
+        parser.add_argument('--top', type=int, default=10, help='Slowest top-level imports to list.')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs must be positive.')
+
+        argv = [sys.executable, '-X', 'importtime', str(settings.BASE_DIR / 'manage.py'), options['command']]
+        timings = []
+        for _ in range(options['runs']):
+            started = time.perf_counter()
+            result = subprocess.run(argv, capture_output=True, text=True)
+            timings.append(time.perf_counter() - started)
+            if result.returncode:
+                raise CommandError(f'{" ".join(argv[3:])} failed:\n{result.stderr[-2000:]}')
+
+        top, modules = parse_importtime(result.stderr)
+        self.stdout.write(f'manage.py {options["command"]}: best {min(timings):.2f}s of {len(timings)} run(s).')
+        for cumulative, module in top[:options['top']]:
+            self.stdout.write(f'  {cumulative / 1e6:8.3f}s  {module}')
+        loaded = [module for module in HEAVY_MODULES if module in modules]
+        self.stdout.write(f'Heavy modules imported at start-up: {", ".join(loaded) or "none"}.')
@@ -0,0 +1,88 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from prophet.benchmarks import compare, run_scale
+from prophet.synthetic import SCALES
+from prophet.utils import warm_up
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic leagues at each scale in a throwaway test database and measure '
+        'evidence extraction, single and batch inference and the league fixtures page '
+        '(time and SQL queries). Writes a JSON report that --compare can diff against.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', action='append', choices=list(SCALES), help='Scale to run (repeatable; default small).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--sample', type=int, default=200, help='Fixtures for the single-fixture stages.')
+        parser.add_argument('--pgmpy-sample', type=int, default=20, help='Fixtures for live pgmpy inference.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--compare', help='A previous JSON report to compare against.')
+
+    def handle(self, *args, **options):
+        if options['sample'] < 1 or options['pgmpy_sample'] < 1:
+            raise CommandError('--sample and --pgmpy-sample must be positive.')
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as handle:
+                previous = json.load(handle)
+
+        report = {
+            'commit': current_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'results': [],
+        }
+        # Never touch the configured database: build a test one, as the test runner does.
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            warm_up()  # keep the pgmpy import out of the first scale's compile time
+            for name in options['scale'] or ['small']:
+                call_command('flush', interactive=False, verbosity=0)
+                result = run_scale(SCALES[name], options['seed'], options['sample'], options['pgmpy_sample'])
+                report['results'].append({'scale': name, **result})
+                self.stderr.write(f'{name}: {result["rows"]["fixtures"]} fixtures measured.')
+                overhead = result['metrics']['instrumentation_overhead']['share']
+                if overhead >= 0.01:
+                    self.stderr.write(f'{name}: instrumentation would add {overhead:.2%} to the league page.')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if previous:
+            self.stderr.write(f'Compared with {previous.get("commit")}:')
+            for scale, name, before, after, change, old_queries, new_queries in compare(previous, report):
+                self.stderr.write(
+                    f'  {scale:<7} {name:<24} {before:>9.4f}s -> {after:>9.4f}s ({change:+.0%}), '
+                    f'queries {old_queries} -> {new_queries}'
+                )
@@ -0,0 +1,21 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from prophet.outbox import enqueue_digests
+
+
+class Command(BaseCommand):
+    help = "Queue the matchday prediction digest for every gambler; send_emails delivers it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help='Matchday (default: today).')
+
+    def handle(self, *args, **options):
+        day = options['date'] or timezone.localdate()
+        queued = enqueue_digests(day)
+        if not queued:
+            self.stdout.write(f'No fixtures or no gamblers on {day}; nothing queued.')
+            return
+        self.stdout.write(self.style.SUCCESS(f'Queued {queued} digests for {day}.'))
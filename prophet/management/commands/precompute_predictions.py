@@ -0,0 +1,98 @@
+import os
+import time
+from concurrent.futures import as_completed
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from prophet.models import Fixture
+from prophet.store import resolve_predictions, save_predictions
+from prophet.utils import model_registry, worker_pool
+
+
+def precompute_chunk(fixture_ids, write=True, force=False, batch_size=500):
+    """Predict one chunk of fixtures; returns (fixtures, recomputed)."""
+    compiled = model_registry.get()
+    fixtures = Fixture.objects.filter(pk__in=fixture_ids)
+    predictions, recomputed = resolve_predictions(fixtures, compiled, force=force)
+    if write and recomputed:
+        save_predictions(recomputed, compiled.version, batch_size=batch_size)
+    return len(predictions), len(recomputed)
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresh stored predictions for the selected fixtures. Fixtures whose stored '
+        'rows already match their evidence and the current model are skipped, so an '
+        'interrupted run can simply be started again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', type=int, action='append', default=[], help='League id (repeatable).')
+        parser.add_argument('--country', type=int, action='append', default=[], help='Country id (repeatable).')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='First fixture date (default: today).')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last fixture date.')
+        parser.add_argument('--all-dates', action='store_true', help='Include past fixtures when --from is not given.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (1 runs inline).')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Fixtures per worker task.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk upsert.')
+        parser.add_argument('--force', action='store_true', help='Recompute fresh predictions too.')
+        parser.add_argument('--dry-run', action='store_true', help='Predict but do not write anything.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers and --chunk-size must be positive.')
+
+        fixtures = Fixture.objects.all()
+        if options['league']:
+            fixtures = fixtures.filter(league_id__in=options['league'])
+        if options['country']:
+            fixtures = fixtures.filter(league__country_id__in=options['country'])
+        if options['date_from']:
+            fixtures = fixtures.filter(date__gte=options['date_from'])
+        elif not options['all_dates']:
+            fixtures = fixtures.filter(date__gte=timezone.localdate())
+        if options['date_to']:
+            fixtures = fixtures.filter(date__lte=options['date_to'])
+
+        fixture_ids = list(fixtures.order_by('pk').values_list('pk', flat=True))
+        chunk_size = options['chunk_size']
+        chunks = [fixture_ids[i:i + chunk_size] for i in range(0, len(fixture_ids), chunk_size)]
+        if not chunks:
+            self.stdout.write('No fixtures selected.')
+            return
+
+        task = {'write': not options['dry_run'], 'force': options['force'], 'batch_size': options['batch_size']}
+        # Compile before forking so every worker inherits the network.
+        version = model_registry.get().version
+        self.stdout.write(
+            f'Predicting {len(fixture_ids)} fixtures in {len(chunks)} chunks '
+            f'with model {version} on {options["workers"]} worker(s).'
+        )
+
+        started = time.monotonic()
+        done = recomputed = 0
+        for chunk_done, chunk_recomputed in self.run_chunks(chunks, task, options['workers']):
+            done += chunk_done
+            recomputed += chunk_recomputed
+            elapsed = max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f'  {done}/{len(fixture_ids)} fixtures ({done / elapsed:.1f} fixtures/sec)')
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        verb = 'would recompute' if options['dry_run'] else 'recomputed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{done} fixtures in {elapsed:.2f}s ({done / elapsed:.1f} fixtures/sec); '
+            f'{verb} {recomputed}, {done - recomputed} already fresh.'
+        ))
+
+    def run_chunks(self, chunks, task, workers):
+        if workers == 1 or len(chunks) == 1:
+            for chunk in chunks:
+                yield precompute_chunk(chunk, **task)
+            return
+
+        with worker_pool(workers) as pool:
+            futures = [pool.submit(precompute_chunk, chunk, **task) for chunk in chunks]
+            for future in as_completed(futures):
+                yield future.result()
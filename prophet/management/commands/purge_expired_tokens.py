@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from prophet.models import PasswordResetToken
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired password reset tokens in bounded batches, each in its own '
+        'short transaction, so the purge never holds a long write lock.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per DELETE.')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to wait between batches.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['pause'] < 0:
+            raise CommandError('--batch-size must be positive and --pause not negative.')
+        deleted = PasswordResetToken.objects.purge_expired(batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired reset tokens.'))
@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from prophet.outbox import claim, deliver
+
+
+class Command(BaseCommand):
+    help = (
+        'Send queued outbound email in batches, each batch over one SMTP connection. '
+        'Failed messages are retried with exponential backoff. Runs until stopped, '
+        'or until the queue is empty with --once.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=getattr(settings, 'PROPHET_EMAIL_BATCH_SIZE', 100),
+            help='Messages leased and sent per connection.',
+        )
+        parser.add_argument('--poll', type=float, default=5, help='Seconds to wait when nothing is due.')
+        parser.add_argument('--once', action='store_true', help='Exit once no message is due.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['poll'] < 0:
+            raise CommandError('--batch-size must be positive and --poll not negative.')
+
+        started = time.monotonic()
+        sent = attempted = 0
+        try:
+            while True:
+                messages = claim(options['batch_size'])
+                if not messages:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+                batch_started = time.monotonic()
+                batch_sent = deliver(messages)
+                sent += batch_sent
+                attempted += len(messages)
+                elapsed = max(time.monotonic() - batch_started, 1e-9)
+                self.stdout.write(
+                    f'  sent {batch_sent}/{len(messages)} in {elapsed:.2f}s ({batch_sent / elapsed:.1f} messages/sec)'
+                )
+        except KeyboardInterrupt:
+            pass
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {sent} messages in {elapsed:.2f}s ({sent / elapsed:.1f} messages/sec); '
+            f'{attempted - sent} to retry or failed.'
+        ))
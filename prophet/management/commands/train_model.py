@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prophet.training import fit, reset_counts, update_counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold newly finished fixtures into the stored count tables and fit a parameter '
+        'set from them. Only fixtures not counted before are read unless --full is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alpha', type=float, default=1.0, help='Dirichlet pseudo-count per CPD cell.')
+        parser.add_argument('--activate', action='store_true', help='Serve the fitted set (PROPHET_PARAMETER_SET = "active").')
+        parser.add_argument('--full', action='store_true', help='Drop the counts and recount every finished fixture.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Fixtures per counting transaction.')
+
+    def handle(self, *args, **options):
+        if options['alpha'] <= 0 or options['chunk_size'] < 1:
+            raise CommandError('--alpha and --chunk-size must be positive.')
+
+        if options['full']:
+            reset_counts()
+        started = time.monotonic()
+        added = update_counts(chunk_size=options['chunk_size'])
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(f'Counted {added} new fixtures in {elapsed:.2f}s ({added / elapsed:.1f} fixtures/sec).')
+
+        parameters = fit(alpha=options['alpha'], activate=options['activate'])
+        state = 'active' if parameters.is_active else 'inactive'
+        self.stdout.write(self.style.SUCCESS(
+            f'Parameter set {parameters.version} ({state}) from {parameters.fixtures} fixtures, alpha={parameters.alpha}.'
+        ))
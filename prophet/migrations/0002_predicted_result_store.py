@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-17 21:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prophet', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictedresult',
+            name='evidence_fingerprint',
+            field=models.CharField(default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='predictedresult',
+            name='model_version',
+            field=models.CharField(default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='predictedresult',
+            name='probabilities',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='predictedresult',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='predictiontype',
+            name='name',
+            field=models.CharField(choices=[('1X2', '1X2'), ('GG', 'GG'), ('Over', 'Over'), ('Under', 'Under'), ('Over/Under', 'Over/Under'), ('Handicap', 'Handicap'), ('Correct Score', 'Correct Score')], max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='predictedresult',
+            constraint=models.UniqueConstraint(fields=('fixture', 'prediction_type'), name='unique_fixture_prediction_type'),
+        ),
+    ]
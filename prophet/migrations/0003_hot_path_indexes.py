@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-17 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prophet', '0002_predicted_result_store'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fixture',
+            index=models.Index(fields=['league', 'date', 'time'], name='fixture_league_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='headtohead',
+            index=models.Index(fields=['fixture', 'match_date'], name='h2h_fixture_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['team', 'effect'], name='player_team_effect_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prediction',
+            index=models.Index(fields=['fixture', 'prediction_type', 'site_accuracy'], name='prediction_fixture_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teamform',
+            index=models.Index(fields=['team', 'game_number'], name='teamform_team_game_idx'),
+        ),
+    ]
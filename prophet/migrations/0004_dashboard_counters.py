@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-17 21:27
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    DashboardCounter = apps.get_model('prophet', 'DashboardCounter')
+    counted = {'countries': 'Country', 'teams': 'Team', 'fixtures': 'Fixture'}
+    DashboardCounter.objects.bulk_create([
+        DashboardCounter(name=name, value=apps.get_model('prophet', model).objects.count())
+        for name, model in counted.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prophet', '0003_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 4.2 on 2026-10-17 21:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import defaultdict
+
+
+# The snapshot computation as it stood when this migration was written, kept
+# here so later changes to prophet.rolling cannot change what it produces.
+# Form entries are [game_number, id, result, over_under, gg, venue].
+
+def merge(recent, entries):
+    ids = {entry[1] for entry in entries}
+    merged = [entry for entry in recent if entry[1] not in ids] + list(entries)
+    merged.sort(key=lambda entry: (-entry[0], -entry[1]))
+    return merged[:10]
+
+
+def summarise(recent):
+    last5, last10 = recent[:5], recent[:10]
+    results5 = [entry[2] for entry in last5]
+    results10 = [entry[2] for entry in last10]
+    home = [entry for entry in last10 if entry[5] == 'H']
+    away = [entry for entry in last10 if entry[5] == 'A']
+    played = len(last10)
+    return {
+        'recent': last10,
+        'played': played,
+        'last5_wins': results5.count('W'),
+        'last5_draws': results5.count('D'),
+        'last5_losses': results5.count('L'),
+        'last10_wins': results10.count('W'),
+        'last10_draws': results10.count('D'),
+        'last10_losses': results10.count('L'),
+        'over_rate': sum(entry[3] == 'Over' for entry in last10) / played if played else 0,
+        'gg_rate': sum(entry[4] == 'gg' for entry in last10) / played if played else 0,
+        'home_played': len(home),
+        'home_wins': sum(entry[2] == 'W' for entry in home),
+        'away_played': len(away),
+        'away_wins': sum(entry[2] == 'W' for entry in away),
+    }
+
+
+def walk(dated_entries):
+    recent = []
+    day, entries = None, []
+    for entry_date, entry in dated_entries:
+        if entry_date != day and entries:
+            recent = merge(recent, entries)
+            yield day, summarise(recent)
+            entries = []
+        day = entry_date
+        entries.append(entry)
+    if entries:
+        yield day, summarise(merge(recent, entries))
+
+
+def build_snapshots(apps, schema_editor):
+    TeamForm = apps.get_model('prophet', 'TeamForm')
+    TeamFormSnapshot = apps.get_model('prophet', 'TeamFormSnapshot')
+    rows = TeamForm.objects.order_by('team_id', 'fixture__date').values_list(
+        'team_id', 'fixture__date', 'game_number', 'pk', 'result', 'over_under', 'gg', 'venue'
+    )
+    by_team = defaultdict(list)
+    for team_id, fixture_date, *entry in rows.iterator():
+        by_team[team_id].append((fixture_date, entry))
+    TeamFormSnapshot.objects.bulk_create(
+        (
+            TeamFormSnapshot(team_id=team_id, as_of=as_of, **summary)
+            for team_id, dated_entries in by_team.items()
+            for as_of, summary in walk(dated_entries)
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prophet', '0004_dashboard_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teamform',
+            name='venue',
+            field=models.CharField(blank=True, choices=[('H', 'Home'), ('A', 'Away')], default='', max_length=1),
+        ),
+        migrations.CreateModel(
+            name='TeamFormSnapshot',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('as_of', models.DateField()),
+                ('recent', models.JSONField(default=list)),
+                ('played', models.PositiveSmallIntegerField(default=0)),
+                ('last5_wins', models.PositiveSmallIntegerField(default=0)),
+                ('last5_draws', models.PositiveSmallIntegerField(default=0)),
+                ('last5_losses', models.PositiveSmallIntegerField(default=0)),
+                ('last10_wins', models.PositiveSmallIntegerField(default=0)),
+                ('last10_draws', models.PositiveSmallIntegerField(default=0)),
+                ('last10_losses', models.PositiveSmallIntegerField(default=0)),
+                ('over_rate', models.FloatField(default=0)),
+                ('gg_rate', models.FloatField(default=0)),
+                ('home_played', models.PositiveSmallIntegerField(default=0)),
+                ('home_wins', models.PositiveSmallIntegerField(default=0)),
+                ('away_played', models.PositiveSmallIntegerField(default=0)),
+                ('away_wins', models.PositiveSmallIntegerField(default=0)),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='form_snapshots', to='prophet.team')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='teamformsnapshot',
+            constraint=models.UniqueConstraint(fields=('team', 'as_of'), name='unique_team_form_as_of'),
+        ),
+        migrations.RunPython(build_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_meetings(apps, schema_editor):
+    # Each old row hangs off a fixture and reads "home-away" from that
+    # fixture's point of view; the same meeting is repeated for every fixture
+    # of the pair, so only the first copy per pair and date is kept. Rows
+    # whose result is not a "2-1" style score cannot be carried over. The old
+    # rows never recorded where a meeting was played, so its venue is left
+    # unknown ('').
+    HeadToHead = apps.get_model('prophet', 'HeadToHead')
+    HeadToHeadMeeting = apps.get_model('prophet', 'HeadToHeadMeeting')
+    meetings = {}
+    rows = HeadToHead.objects.order_by('pk').values_list(
+        'fixture__home_team_id', 'fixture__away_team_id', 'match_date', 'result'
+    )
+    for home_id, away_id, match_date, result in rows.iterator():
+        try:
+            home_goals, away_goals = (int(goals) for goals in result.split('-'))
+        except ValueError:
+            continue
+        if home_id == away_id:
+            continue
+        if home_id < away_id:
+            key = (home_id, away_id, match_date)
+            values = (home_goals, away_goals)
+        else:
+            key = (away_id, home_id, match_date)
+            values = (away_goals, home_goals)
+        meetings.setdefault(key, values)
+    HeadToHeadMeeting.objects.bulk_create(
+        (
+            HeadToHeadMeeting(
+                team_a_id=team_a, team_b_id=team_b, match_date=match_date,
+                team_a_goals=team_a_goals, team_b_goals=team_b_goals, venue='',
+            )
+            for (team_a, team_b, match_date), (team_a_goals, team_b_goals) in meetings.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prophet', '0005_rolling_team_form'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeadToHeadMeeting',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('match_date', models.DateField()),
+                ('team_a_goals', models.PositiveSmallIntegerField()),
+                ('team_b_goals', models.PositiveSmallIntegerField()),
+                ('venue', models.CharField(choices=[('A', 'Team A at home'), ('B', 'Team B at home'), ('N', 'Neutral ground')], max_length=1)),
+                ('team_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='head_to_heads_as_a', to='prophet.team')),
+                ('team_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='head_to_heads_as_b', to='prophet.team')),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('team_a', 'team_b', 'match_date'), name='unique_h2h_pair_date'),
+                    models.CheckConstraint(check=models.Q(('team_a__lt', models.F('team_b'))), name='h2h_pair_ordered'),
+                ],
+            },
+        ),
+        migrations.RunPython(copy_meetings, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='HeadToHead',
+        ),
+        migrations.RenameModel(
+            old_name='HeadToHeadMeeting',
+            new_name='HeadToHead',
+        ),
+    ]
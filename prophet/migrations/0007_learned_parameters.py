@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-17 21:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prophet', '0006_pair_indexed_head_to_head'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterSet',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('version', models.CharField(max_length=32, unique=True)),
+                ('alpha', models.FloatField()),
+                ('fixtures', models.PositiveIntegerField()),
+                ('cpds', models.JSONField()),
+                ('is_active', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrainingCount',
+            fields=[
+                ('variable', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('counts', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrainingRecord',
+            fields=[
+                ('fixture', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='training_record', serialize=False, to='prophet.fixture')),
+                ('states', models.CharField(max_length=16)),
+                ('counted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fixture',
+            name='away_goals',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fixture',
+            name='home_goals',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
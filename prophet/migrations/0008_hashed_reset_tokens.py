@@ -0,0 +1,50 @@
+import hashlib
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def hash_tokens(apps, schema_editor):
+    # Existing plaintext tokens keep working until they expire: store their
+    # hash and the expiry the old five-minute rule gave them.
+    PasswordResetToken = apps.get_model('prophet', 'PasswordResetToken')
+    tokens = list(PasswordResetToken.objects.all())
+    for token in tokens:
+        token.token_hash = hashlib.sha256(token.token.encode()).hexdigest()
+        token.expires_at = token.created_at + timedelta(minutes=5)
+    PasswordResetToken.objects.bulk_update(tokens, ['token_hash', 'expires_at'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prophet', '0007_learned_parameters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passwordresettoken',
+            name='token_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='passwordresettoken',
+            name='expires_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(hash_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='passwordresettoken',
+            name='token',
+        ),
+        migrations.AlterField(
+            model_name='passwordresettoken',
+            name='token_hash',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='passwordresettoken',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-17 22:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prophet', '0009_outbound_email_queue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fixture',
+            index=models.Index(fields=['date'], name='fixture_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prophet', '0011_cache_table'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='headtohead',
+            name='venue',
+            field=models.CharField(blank=True, choices=[('A', 'Team A at home'), ('B', 'Team B at home'), ('N', 'Neutral ground')], default='', max_length=1),
+        ),
+    ]
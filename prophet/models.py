@@ -1,4 +1,9 @@
-from django.db import models
+import hashlib
+from time import sleep
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from datetime import date
 from django.utils import timezone
 import random
@@ -6,11 +11,45 @@ import string
 from datetime import timedelta
 from django.core.exceptions import ValidationError
 from django.contrib.auth.hashers import make_password, check_password
+from django.utils.crypto import get_random_string
 from .validators import validate_kenyan_phone_number
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
-class Country(models.Model):
+class CountedQuerySet(models.QuerySet):
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            deleted = super().delete()
+            report_deletions(deleted[1])
+        return deleted
+
+
+class CountedModel(models.Model):
+    """Base for the tables behind the dashboard counters and showcase.
+
+    Deletes, cascades included, are reported to prophet.stats in bulk
+    rather than through post_delete, which would stop Django from deleting
+    the cascaded rows with one query per table.
+    """
+
+    objects = CountedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def delete(self, using=None, keep_parents=False):
+        with transaction.atomic(using=using or self._state.db):
+            deleted = super().delete(using=using, keep_parents=keep_parents)
+            report_deletions(deleted[1])
+        return deleted
+
+
+def report_deletions(counts):
+    from .stats import record_deletions  # prophet.stats imports the models
+    record_deletions(counts)
+
+
+class Country(CountedModel):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100, unique=True)
 
@@ -18,7 +57,7 @@ class Country(models.Model):
         return self.name
 
 
-class League(models.Model):
+class League(CountedModel):
     id = models.AutoField(primary_key=True)
     country = models.ForeignKey(Country, on_delete=models.CASCADE, related_name='leagues')
     name = models.CharField(max_length=100)
@@ -27,7 +66,7 @@ class League(models.Model):
         return f"{self.name} ({self.country.name})"
 
 
-class Team(models.Model):
+class Team(CountedModel):
     id = models.AutoField(primary_key=True)
     league = models.ForeignKey(League, on_delete=models.CASCADE, related_name='teams')
     name = models.CharField(max_length=100)
@@ -36,26 +75,109 @@ class Team(models.Model):
         return self.name
 
 
-class Fixture(models.Model):
+class Fixture(CountedModel):
     id = models.AutoField(primary_key=True)
     league = models.ForeignKey(League, on_delete=models.CASCADE, related_name='fixtures')
     home_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='home_fixtures')
     away_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='away_fixtures')
     date = models.DateField()
     time = models.TimeField()
+    home_goals = models.PositiveSmallIntegerField(null=True, blank=True)  # final score, once played
+    away_goals = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['league', 'date', 'time'], name='fixture_league_date_idx'),
+            models.Index(fields=['date'], name='fixture_date_idx'),  # admin date hierarchy
+        ]
 
     def __str__(self):
         return f"{self.home_team.name} vs {self.away_team.name} - {self.date}"
 
 
+class HeadToHeadQuerySet(models.QuerySet):
+    def between(self, team, other):
+        """Meetings of two teams, whichever hosted."""
+        team_a, team_b = sorted((getattr(team, 'pk', team), getattr(other, 'pk', other)))
+        return self.filter(team_a_id=team_a, team_b_id=team_b)
+
+    def before(self, match_date, last=None):
+        """Meetings before ``match_date``, newest first, optionally only the ``last`` few."""
+        meetings = self.filter(match_date__lt=match_date).order_by('-match_date')
+        return meetings[:last] if last else meetings
+
+    def summary(self, team):
+        """Totals from ``team``'s side, aggregated in the database."""
+        team_id = getattr(team, 'pk', team)
+        as_a = models.Q(team_a_id=team_id)
+        goals_for = models.Case(models.When(as_a, then='team_a_goals'), default='team_b_goals')
+        goals_against = models.Case(models.When(as_a, then='team_b_goals'), default='team_a_goals')
+        a_won = models.Q(team_a_goals__gt=models.F('team_b_goals'))
+        b_won = models.Q(team_b_goals__gt=models.F('team_a_goals'))
+        both_scored = models.Q(team_a_goals__gt=0, team_b_goals__gt=0)
+        return self.aggregate(
+            meetings=models.Count('pk'),
+            wins=models.Count('pk', filter=(as_a & a_won) | (~as_a & b_won)),
+            draws=models.Count('pk', filter=models.Q(team_a_goals=models.F('team_b_goals'))),
+            losses=models.Count('pk', filter=(as_a & b_won) | (~as_a & a_won)),
+            goals_for=Coalesce(models.Sum(goals_for), 0),
+            goals_against=Coalesce(models.Sum(goals_against), 0),
+            gg_rate=Coalesce(models.Avg(models.Case(
+                models.When(both_scored, then=models.Value(1.0)), default=models.Value(0.0),
+            )), 0.0),
+        )
+
+    def record(self, home_team, away_team, match_date, home_goals, away_goals, neutral=False):
+        return self.create(**HeadToHead.fields_for(home_team, away_team, match_date, home_goals, away_goals, neutral))
+
+
 class HeadToHead(models.Model):
+    # One row per meeting of an unordered team pair; team_a always has the lower id.
+    VENUE_CHOICES = [
+        ('A', 'Team A at home'),
+        ('B', 'Team B at home'),
+        ('N', 'Neutral ground'),
+    ]
+
     id = models.AutoField(primary_key=True)
-    fixture = models.ForeignKey(Fixture, on_delete=models.CASCADE, related_name='head_to_heads')
+    team_a = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='head_to_heads_as_a')
+    team_b = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='head_to_heads_as_b')
     match_date = models.DateField()
-    result = models.CharField(max_length=50)  # example: "2-1", "1-1"
+    team_a_goals = models.PositiveSmallIntegerField()
+    team_b_goals = models.PositiveSmallIntegerField()
+    venue = models.CharField(max_length=1, choices=VENUE_CHOICES, blank=True, default='')  # '' when not known
+
+    objects = HeadToHeadQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['team_a', 'team_b', 'match_date'], name='unique_h2h_pair_date'),
+            models.CheckConstraint(check=models.Q(team_a__lt=models.F('team_b')), name='h2h_pair_ordered'),
+        ]
+
+    @staticmethod
+    def fields_for(home_team, away_team, match_date, home_goals, away_goals, neutral=False):
+        """Model field values for a meeting given the usual home/away view of it."""
+        home_id, away_id = getattr(home_team, 'pk', home_team), getattr(away_team, 'pk', away_team)
+        if home_id < away_id:
+            fields = {'team_a_id': home_id, 'team_b_id': away_id, 'team_a_goals': home_goals,
+                      'team_b_goals': away_goals, 'venue': 'A'}
+        else:
+            fields = {'team_a_id': away_id, 'team_b_id': home_id, 'team_a_goals': away_goals,
+                      'team_b_goals': home_goals, 'venue': 'B'}
+        if neutral:
+            fields['venue'] = 'N'
+        fields['match_date'] = match_date
+        return fields
+
+    def goals(self, team):
+        """(scored, conceded) for ``team``."""
+        if getattr(team, 'pk', team) == self.team_a_id:
+            return self.team_a_goals, self.team_b_goals
+        return self.team_b_goals, self.team_a_goals
 
     def __str__(self):
-        return f"H2H {self.fixture}: {self.result}"
+        return f"H2H {self.team_a.name} {self.team_a_goals}-{self.team_b_goals} {self.team_b.name} ({self.match_date})"
 
 
 class TeamStat(models.Model):
@@ -92,6 +214,11 @@ class Player(models.Model):
     effect = models.CharField(max_length=20, choices=EFFECT_CHOICES)
     rating = models.PositiveIntegerField(default=0)  # Rating out of 100
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['team', 'effect'], name='player_team_effect_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.position}) - {self.player_code}"
 
@@ -124,6 +251,11 @@ class TeamForm(models.Model):
         ('no gg', 'No GG'),
     ]
 
+    VENUE_CHOICES = [
+        ('H', 'Home'),
+        ('A', 'Away'),
+    ]
+
     id = models.AutoField(primary_key=True)
     team = models.ForeignKey('Team', on_delete=models.CASCADE, related_name='forms')
     fixture = models.ForeignKey('Fixture', on_delete=models.CASCADE, related_name='forms')
@@ -131,16 +263,63 @@ class TeamForm(models.Model):
     result = models.CharField(max_length=1, choices=RESULT_CHOICES)
     over_under = models.CharField(max_length=5, choices=OVER_UNDER_CHOICES)
     gg = models.CharField(max_length=5, choices=GG_CHOICES)
+    venue = models.CharField(max_length=1, choices=VENUE_CHOICES, blank=True, default='')  # where the game was played
+
+    # (team_id, fixture_id) as stored, kept so prophet.rolling can take an
+    # edited form out of the snapshots it was in before the edit.
+    stored_key = None
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['team', 'game_number'], name='teamform_team_game_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if 'team_id' in loaded and 'fixture_id' in loaded:
+            instance.stored_key = (loaded['team_id'], loaded['fixture_id'])
+        return instance
 
     def __str__(self):
         return f"Form {self.game_number} - {self.team.name}"
 
+class TeamFormSnapshot(models.Model):
+    # A team's rolling form as of a date, maintained by prophet.rolling from TeamForm rows.
+    id = models.AutoField(primary_key=True)
+    team = models.ForeignKey('Team', on_delete=models.CASCADE, related_name='form_snapshots')
+    as_of = models.DateField()  # covers forms of fixtures on or before this date
+    recent = models.JSONField(default=list)  # newest first: [game_number, form id, result, over_under, gg, venue]
+    played = models.PositiveSmallIntegerField(default=0)  # games in the last-10 window
+    last5_wins = models.PositiveSmallIntegerField(default=0)
+    last5_draws = models.PositiveSmallIntegerField(default=0)
+    last5_losses = models.PositiveSmallIntegerField(default=0)
+    last10_wins = models.PositiveSmallIntegerField(default=0)
+    last10_draws = models.PositiveSmallIntegerField(default=0)
+    last10_losses = models.PositiveSmallIntegerField(default=0)
+    over_rate = models.FloatField(default=0)  # share of the last 10 that went over
+    gg_rate = models.FloatField(default=0)  # share of the last 10 where both teams scored
+    home_played = models.PositiveSmallIntegerField(default=0)
+    home_wins = models.PositiveSmallIntegerField(default=0)
+    away_played = models.PositiveSmallIntegerField(default=0)
+    away_wins = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['team', 'as_of'], name='unique_team_form_as_of'),
+        ]
+
+    def __str__(self):
+        return f"Form of {self.team.name} as of {self.as_of}: {self.last5_wins}-{self.last5_draws}-{self.last5_losses}"
+
 class PredictionType(models.Model):
     PREDICTION_CHOICES = [
         ('1X2', '1X2'),
         ('GG', 'GG'),
         ('Over', 'Over'),
         ('Under', 'Under'),
+        ('Over/Under', 'Over/Under'),
         ('Handicap', 'Handicap'),
         ('Correct Score', 'Correct Score'),
     ]
@@ -171,6 +350,11 @@ class Prediction(models.Model):
     site_accuracy = models.DecimalField(max_digits=5, decimal_places=2)  # e.g., 85.75%
     team_effort = models.CharField(max_length=20, choices=EFFORT_CHOICES, default='none')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['fixture', 'prediction_type', 'site_accuracy'], name='prediction_fixture_type_idx'),
+        ]
+
     def __str__(self):
         return f"{self.fixture}: {self.prediction_type} - {self.value} ({self.team_effort}) from {self.prediction_site}"
 
@@ -181,11 +365,64 @@ class PredictedResult(models.Model):
     away_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='away_predictions')
     prediction_type = models.ForeignKey(PredictionType, on_delete=models.CASCADE)
     predicted_result = models.CharField(max_length=100)  # e.g., "1", "2-1", "GG", "Over 2.5"
+    probabilities = models.JSONField(default=dict)  # e.g., {"1": 0.5, "X": 0.3, "2": 0.2}
+    evidence_fingerprint = models.CharField(max_length=32, default='')  # evidence states the prediction was made from
+    model_version = models.CharField(max_length=32, default='')  # version key of the compiled network
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fixture', 'prediction_type'], name='unique_fixture_prediction_type'),
+        ]
 
     def __str__(self):
         return f"{self.fixture}: {self.prediction_type} - {self.predicted_result}"
 
+
+class TrainingCount(models.Model):
+    # Sufficient statistics for one CPD: counts shaped like the CPD's factor (variable, *parents).
+    variable = models.CharField(primary_key=True, max_length=50)
+    counts = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Counts for {self.variable}"
+
+
+class TrainingRecord(models.Model):
+    # A finished fixture already folded into TrainingCount, with the states it added.
+    fixture = models.OneToOneField(Fixture, on_delete=models.CASCADE, primary_key=True, related_name='training_record')
+    states = models.CharField(max_length=16)  # evidence then market states, "-" for a score outside CorrectScore
+    counted_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Trained on {self.fixture_id}: {self.states}"
+
+
+class ParameterSet(models.Model):
+    # Learned CPD values the engine can load; version matches the compiled model's.
+    id = models.AutoField(primary_key=True)
+    version = models.CharField(max_length=32, unique=True)
+    alpha = models.FloatField()  # Dirichlet pseudo-count added to every cell
+    fixtures = models.PositiveIntegerField()  # finished fixtures the counts covered
+    cpds = models.JSONField()  # {variable: 2-D values as TabularCPD takes them}
+    is_active = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Parameters {self.version}{' (active)' if self.is_active else ''}"
+
+
+class DashboardCounter(models.Model):
+    # Row counts shown on the dashboard, kept current by prophet.stats signals.
+    name = models.CharField(primary_key=True, max_length=50)  # e.g., "fixtures"
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
     
 class Gambler(models.Model):
     id = models.AutoField(primary_key=True)
@@ -218,14 +455,80 @@ class System_User(models.Model):
     def __str__(self):
         return self.username   
 
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class PasswordResetTokenQuerySet(models.QuerySet):
+    def issue(self, user, lifetime=None):
+        """Replace ``user``'s tokens with a new one; returns the raw token, which is never stored."""
+        lifetime = lifetime or timedelta(minutes=getattr(settings, 'PROPHET_RESET_TOKEN_MINUTES', 5))
+        token = get_random_string(length=32)
+        self.filter(username=user).delete()
+        self.create(username=user, token_hash=hash_token(token), expires_at=timezone.now() + lifetime)
+        return token
+
+    def usable(self, token):
+        """The unexpired row for a raw ``token``, or None: one probe of the token_hash index."""
+        return self.filter(token_hash=hash_token(token), expires_at__gt=timezone.now()).first()
+
+    def purge_expired(self, batch_size=1000, pause=0, now=None):
+        """Delete expired tokens ``batch_size`` rows per statement, each its own
+        short transaction, so writers are never locked out for long."""
+        now = now or timezone.now()
+        deleted = 0
+        while True:
+            batch = list(self.filter(expires_at__lte=now).order_by('expires_at').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                return deleted
+            deleted += self.filter(pk__in=batch).delete()[0]
+            if pause:
+                sleep(pause)
+
+
 class PasswordResetToken(models.Model):
     username = models.ForeignKey(System_User, on_delete=models.CASCADE)
-    token = models.CharField(max_length=32)
+    token_hash = models.CharField(max_length=64, unique=True)  # sha256 of the token sent by email
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = PasswordResetTokenQuerySet.as_manager()
 
     def __str__(self):
         return f"Token for {self.username}"
 
     def is_expired(self):
-        expiration_time = self.created_at + timedelta(minutes=5)
-        return timezone.now() > expiration_time
+        return timezone.now() >= self.expires_at
+
+
+class OutboundEmail(models.Model):
+    # One queued message to one recipient; prophet.outbox sends them from a worker.
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),  # leased to a worker until next_attempt_at
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),  # gave up after PROPHET_EMAIL_MAX_ATTEMPTS
+    ]
+
+    id = models.AutoField(primary_key=True)
+    kind = models.CharField(max_length=20, blank=True)  # e.g., "reset", "digest"
+    to = models.EmailField(max_length=200)
+    from_email = models.CharField(max_length=200, blank=True)  # blank sends from DEFAULT_FROM_EMAIL
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    lease = models.CharField(max_length=32, blank=True)  # the claiming worker's batch
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+            models.Index(fields=['lease'], name='outbound_email_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.to} ({self.status})"
@@ -0,0 +1,157 @@
+import smtplib
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import Fixture, Gambler, OutboundEmail, PasswordResetToken, System_User
+from .store import MARKET_PREDICTION_TYPES, load_predictions
+
+DUE_STATUSES = ('pending', 'sending')  # a 'sending' row whose lease ran out is due again
+RESET_TOKEN = '{token}'  # stands in for the reset token in a queued 'reset' body
+
+
+def enqueue(subject, body, recipients, from_email='', kind='', batch_size=500):
+    """Queue one message per recipient; returns the saved rows."""
+    return OutboundEmail.objects.bulk_create([
+        OutboundEmail(kind=kind, to=recipient, from_email=from_email or '', subject=subject, body=body)
+        for recipient in recipients
+    ], batch_size=batch_size)
+
+
+def claim(batch_size, now=None):
+    """Lease up to ``batch_size`` due messages to the calling worker.
+
+    The conditional UPDATE only takes rows that are still due, so two
+    workers never lease the same message; a worker that dies mid-batch
+    loses its lease after PROPHET_EMAIL_LEASE_SECONDS and the messages are
+    sent again (delivery is at least once).
+    """
+    now = now or timezone.now()
+    due = OutboundEmail.objects.filter(status__in=DUE_STATUSES, next_attempt_at__lte=now)
+    pks = list(due.order_by('next_attempt_at').values_list('pk', flat=True)[:batch_size])
+    if not pks:
+        return []
+    lease = uuid4().hex
+    due.filter(pk__in=pks).update(
+        status='sending', lease=lease,
+        next_attempt_at=now + timedelta(seconds=getattr(settings, 'PROPHET_EMAIL_LEASE_SECONDS', 300)),
+    )
+    return list(OutboundEmail.objects.filter(lease=lease, status='sending').order_by('pk'))
+
+
+def retry_delay(attempts):
+    """Exponential backoff after the ``attempts``-th failure, capped."""
+    base = getattr(settings, 'PROPHET_EMAIL_RETRY_SECONDS', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), getattr(settings, 'PROPHET_EMAIL_RETRY_MAX_SECONDS', 3600)))
+
+
+def mark_failed(message, error, now):
+    message.attempts += 1
+    message.last_error = f'{type(error).__name__}: {error}'[:1000]
+    if message.attempts >= getattr(settings, 'PROPHET_EMAIL_MAX_ATTEMPTS', 5):
+        message.status = 'failed'
+    else:
+        message.status = 'pending'
+        message.next_attempt_at = now + retry_delay(message.attempts)
+
+
+def message_body(message):
+    """The text to send for ``message``.
+
+    A reset email's token is issued here, as it is sent, and goes out only in
+    the mail: the queued row holds a placeholder, and the tokens table only
+    its hash. Each attempt issues a fresh token, replacing the last.
+    """
+    if message.kind != 'reset':
+        return message.body
+    user = System_User.objects.get(username=message.to)
+    return message.body.replace(RESET_TOKEN, PasswordResetToken.objects.issue(user))
+
+
+def connection_lost(error):
+    # smtplib's errors are OSErrors too; only a dropped connection needs a new one.
+    return isinstance(error, smtplib.SMTPServerDisconnected) or (
+        isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+    )
+
+
+def deliver(messages, connection=None):
+    """Send claimed ``messages`` over one connection and record each outcome.
+
+    A refused message is retried later without affecting the rest of the
+    batch, which reconnects if the server dropped it; if the server cannot
+    be reached at all, the whole batch is retried.
+    Returns the number sent.
+    """
+    connection = connection or get_connection(fail_silently=False)
+    now = timezone.now()
+    sent = 0
+    try:
+        connection.open()
+    except Exception as error:
+        for message in messages:
+            mark_failed(message, error, now)
+    else:
+        try:
+            for position, message in enumerate(messages):
+                try:
+                    connection.send_messages([
+                        EmailMessage(message.subject, message_body(message), message.from_email or None, [message.to]),
+                    ])
+                except Exception as error:
+                    mark_failed(message, error, now)
+                    if not connection_lost(error):
+                        continue
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception as error:
+                        for rest in messages[position + 1:]:
+                            mark_failed(rest, error, now)
+                        break
+                else:
+                    message.status = 'sent'
+                    message.attempts += 1
+                    message.sent_at = timezone.now()
+                    sent += 1
+        finally:
+            connection.close()
+    for message in messages:
+        message.lease = ''
+    OutboundEmail.objects.bulk_update(
+        messages, ['status', 'attempts', 'next_attempt_at', 'lease', 'last_error', 'sent_at'], batch_size=500,
+    )
+    return sent
+
+
+def matchday_digest(day):
+    """Subject and body listing the stored predictions for ``day``'s fixtures, or None."""
+    fixtures = Fixture.objects.filter(date=day).select_related('league', 'home_team', 'away_team')
+    predictions = load_predictions(fixtures)  # in fixture id order
+    if not predictions:
+        return None
+    predictions.sort(key=lambda prediction: (prediction.fixture.time, prediction.fixture.pk))
+    lines = [f'Predictions for {day:%A %d %B %Y}:', '']
+    for prediction in predictions:
+        fixture = prediction.fixture
+        kickoff = f' {fixture.time:%H:%M}' if fixture.time else ''
+        lines.append(f'{fixture.home_team.name} vs {fixture.away_team.name} ({fixture.league.name}){kickoff}')
+        for market, name in MARKET_PREDICTION_TYPES.items():
+            answer = prediction.markets[market].answer
+            probability = prediction.markets[market].probabilities.get(answer, 0)
+            lines.append(f'  {name}: {answer} ({probability:.0%})')
+        lines.append('')
+    return f'Matchday predictions for {day:%d %b %Y}', '\n'.join(lines)
+
+
+def enqueue_digests(day):
+    """Queue ``day``'s digest for every gambler; returns the number queued."""
+    digest = matchday_digest(day)
+    if digest is None:
+        return 0
+    subject, body = digest
+    recipients = Gambler.objects.order_by('email_address').values_list('email_address', flat=True).distinct()
+    return len(enqueue(subject, body, recipients, from_email=settings.EMAIL_HOST_USER, kind='digest'))
@@ -0,0 +1,95 @@
+from collections import namedtuple
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.utils.functional import SimpleLazyObject
+
+from .models import Gambler, System_User
+
+SESSION_KEY = 'prophet_profile'
+
+
+class Profile(namedtuple('Profile', ['username', 'email_address', 'first_name', 'last_name', 'phone_number', 'version'])):
+    """Snapshot of a logged-in gambler, kept in the session.
+
+    ``version`` is the profile version current when the snapshot was taken;
+    saving or deleting the Gambler or System_User moves it on, so every
+    session holding an older snapshot reloads it on its next request.
+    """
+
+    __slots__ = ()
+
+
+def version_key(username):
+    return f'prophet:profile:version:{username}'
+
+
+def current_version(username):
+    key = version_key(username)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def load_profile(username):
+    """A fresh Profile from the database, or None if either account is missing."""
+    gambler = Gambler.objects.filter(username=username).first()
+    if gambler is None or not System_User.objects.filter(username=username).exists():
+        return None
+    return Profile(
+        gambler.username, gambler.email_address, gambler.first_name, gambler.last_name, gambler.phone_number,
+        current_version(username),
+    )
+
+
+def remember(session, profile):
+    session['username'] = profile.username
+    session[SESSION_KEY] = list(profile)
+
+
+def request_profile(request):
+    """The logged-in gambler's Profile, or None.
+
+    Served from the session; the database is only read when the snapshot is
+    missing (sessions from before profiles) or out of date.
+    """
+    stored = request.session.get(SESSION_KEY)
+    profile = Profile(*stored) if stored else None
+    if profile is not None and profile.version == current_version(profile.username):
+        return profile
+
+    username = profile.username if profile else request.session.get('username')
+    if not username:
+        return None
+    profile = load_profile(username)
+    if profile is None:
+        request.session.pop(SESSION_KEY, None)
+        request.session.pop('username', None)
+        return None
+    remember(request.session, profile)
+    return profile
+
+
+class GamblerMiddleware:
+    """Attach ``request.gambler``: the logged-in Profile, falsy for anonymous
+    requests, resolved on first use."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.gambler = SimpleLazyObject(lambda: request_profile(request))
+        return self.get_response(request)
+
+
+def forget_profile(sender, instance, **kwargs):
+    cache.set(version_key(instance.username), uuid4().hex, None)
+
+
+def connect_signals():
+    for model in (Gambler, System_User):
+        post_save.connect(forget_profile, sender=model, dispatch_uid=f'prophet.profiles.save.{model.__name__}')
+        post_delete.connect(forget_profile, sender=model, dispatch_uid=f'prophet.profiles.delete.{model.__name__}')
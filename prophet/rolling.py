@@ -0,0 +1,223 @@
+from collections import defaultdict
+
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import Fixture, TeamForm, TeamFormSnapshot
+
+WINDOW = 10  # longest window a snapshot summarises
+SHORT_WINDOW = 5
+
+SUMMARY_FIELDS = [
+    'recent', 'played',
+    'last5_wins', 'last5_draws', 'last5_losses', 'last10_wins', 'last10_draws', 'last10_losses',
+    'over_rate', 'gg_rate', 'home_played', 'home_wins', 'away_played', 'away_wins',
+]
+
+
+def form_entry(form):
+    return [form.game_number, form.pk, form.result, form.over_under, form.gg, form.venue]
+
+
+def entry_order(entry):
+    # Same order PredictionEngine used on the raw rows: game_number, then id, newest first.
+    return (-entry[0], -entry[1])
+
+
+def merge(recent, entries):
+    """``recent`` with ``entries`` added (replacing any with the same form id), trimmed to WINDOW."""
+    ids = {entry[1] for entry in entries}
+    merged = [entry for entry in recent if entry[1] not in ids] + list(entries)
+    merged.sort(key=entry_order)
+    return merged[:WINDOW]
+
+
+def summarise(recent):
+    """Snapshot field values for a newest-first list of form entries."""
+    last5, last10 = recent[:SHORT_WINDOW], recent[:WINDOW]
+    results5 = [entry[2] for entry in last5]
+    results10 = [entry[2] for entry in last10]
+    home = [entry for entry in last10 if entry[5] == 'H']
+    away = [entry for entry in last10 if entry[5] == 'A']
+    played = len(last10)
+    return {
+        'recent': last10,
+        'played': played,
+        'last5_wins': results5.count('W'),
+        'last5_draws': results5.count('D'),
+        'last5_losses': results5.count('L'),
+        'last10_wins': results10.count('W'),
+        'last10_draws': results10.count('D'),
+        'last10_losses': results10.count('L'),
+        'over_rate': sum(entry[3] == 'Over' for entry in last10) / played if played else 0,
+        'gg_rate': sum(entry[4] == 'gg' for entry in last10) / played if played else 0,
+        'home_played': len(home),
+        'home_wins': sum(entry[2] == 'W' for entry in home),
+        'away_played': len(away),
+        'away_wins': sum(entry[2] == 'W' for entry in away),
+    }
+
+
+def set_recent(snapshot, recent):
+    for field, value in summarise(recent).items():
+        setattr(snapshot, field, value)
+
+
+def recent_forms(team_id, as_of):
+    """The WINDOW newest form entries for a team as of a date, read from TeamForm."""
+    forms = TeamForm.objects.filter(team_id=team_id, fixture__date__lte=as_of).order_by('-game_number', '-pk')
+    return [form_entry(form) for form in forms[:WINDOW]]
+
+
+def fixture_dates(forms):
+    return dict(Fixture.objects.filter(pk__in={form.fixture_id for form in forms}).values_list('pk', 'date'))
+
+
+def apply_forms(forms):
+    """Fold new or changed TeamForm rows into the snapshots they affect.
+
+    A form dated D touches the team's snapshot at D (created from the one
+    before it if needed) and every later snapshot; nothing is recounted
+    from TeamForm. Forms whose ordering key (team, fixture or game_number)
+    changed must go through discard_forms first.
+    """
+    forms = [form for form in forms if form.pk]
+    if not forms:
+        return
+    dates = fixture_dates(forms)
+    by_team = defaultdict(list)
+    for form in forms:
+        by_team[form.team_id].append((dates[form.fixture_id], form_entry(form)))
+
+    new, changed = [], []
+    for team_id, entries in by_team.items():
+        first = min(entry_date for entry_date, _ in entries)
+        snapshots = list(TeamFormSnapshot.objects.filter(team_id=team_id, as_of__gte=first).order_by('as_of'))
+        earlier = TeamFormSnapshot.objects.filter(team_id=team_id, as_of__lt=first).order_by('-as_of').first()
+
+        known = {snapshot.as_of for snapshot in snapshots}
+        for as_of in sorted({entry_date for entry_date, _ in entries} - known):
+            base = max(
+                (snapshot for snapshot in snapshots if snapshot.as_of < as_of),
+                key=lambda snapshot: snapshot.as_of, default=earlier,
+            )
+            snapshot = TeamFormSnapshot(team_id=team_id, as_of=as_of, recent=list(base.recent) if base else [])
+            snapshots.append(snapshot)
+            new.append(snapshot)
+
+        for snapshot in snapshots:
+            recent = merge(snapshot.recent, [entry for entry_date, entry in entries if entry_date <= snapshot.as_of])
+            if snapshot.pk is None or recent != snapshot.recent:
+                set_recent(snapshot, recent)
+                if snapshot.pk is not None:
+                    changed.append(snapshot)
+
+    TeamFormSnapshot.objects.bulk_create(new)
+    TeamFormSnapshot.objects.bulk_update(changed, SUMMARY_FIELDS)
+
+
+def discard_forms(forms):
+    """Take TeamForm rows out of the snapshots that hold them.
+
+    A snapshot that was full is topped up from TeamForm, since the row that
+    now belongs in its window was trimmed earlier; only those snapshots are
+    reread. A date left with no forms loses its snapshot, as in rebuild().
+    """
+    dates = fixture_dates(forms)
+    by_team = defaultdict(list)
+    for form in forms:
+        by_team[form.team_id].append((form.pk, dates.get(form.fixture_id)))
+
+    changed = []
+    for team_id, removed in by_team.items():
+        ids = {pk for pk, _ in removed}
+        snapshots = TeamFormSnapshot.objects.filter(team_id=team_id)
+        if all(form_date is not None for _, form_date in removed):
+            snapshots = snapshots.filter(as_of__gte=min(form_date for _, form_date in removed))
+        for snapshot in snapshots:
+            recent = [entry for entry in snapshot.recent if entry[1] not in ids]
+            if len(recent) == len(snapshot.recent):
+                continue
+            if len(snapshot.recent) == WINDOW:
+                recent = [entry for entry in recent_forms(team_id, snapshot.as_of) if entry[1] not in ids]
+            set_recent(snapshot, recent)
+            changed.append(snapshot)
+        emptied = {form_date for _, form_date in removed if form_date is not None}
+        emptied -= set(
+            TeamForm.objects.filter(team_id=team_id, fixture__date__in=emptied).exclude(pk__in=ids)
+            .values_list('fixture__date', flat=True)
+        )
+        if emptied:
+            TeamFormSnapshot.objects.filter(team_id=team_id, as_of__in=emptied).delete()
+            changed = [snapshot for snapshot in changed if snapshot.team_id != team_id or snapshot.as_of not in emptied]
+    TeamFormSnapshot.objects.bulk_update(changed, SUMMARY_FIELDS)
+
+
+def walk(dated_entries):
+    """Yield (as_of, summary) per date for one team's (date, entry) pairs sorted by date."""
+    recent = []
+    day, entries = None, []
+    for entry_date, entry in dated_entries:
+        if entry_date != day and entries:
+            recent = merge(recent, entries)
+            yield day, summarise(recent)
+            entries = []
+        day = entry_date
+        entries.append(entry)
+    if entries:
+        yield day, summarise(merge(recent, entries))
+
+
+def rebuild(team_ids=None, batch_size=1000):
+    """Recreate snapshots from TeamForm in one pass, for existing data or repairs."""
+    snapshots = TeamFormSnapshot.objects.all()
+    forms = TeamForm.objects.order_by('team_id', 'fixture__date')
+    if team_ids is not None:
+        snapshots = snapshots.filter(team_id__in=team_ids)
+        forms = forms.filter(team_id__in=team_ids)
+    snapshots.delete()
+
+    rows = forms.values_list('team_id', 'fixture__date', 'game_number', 'pk', 'result', 'over_under', 'gg', 'venue')
+    by_team = defaultdict(list)
+    for team_id, fixture_date, *entry in rows.iterator():
+        by_team[team_id].append((fixture_date, entry))
+    TeamFormSnapshot.objects.bulk_create(
+        (
+            TeamFormSnapshot(team_id=team_id, as_of=as_of, **summary)
+            for team_id, dated_entries in by_team.items()
+            for as_of, summary in walk(dated_entries)
+        ),
+        batch_size=batch_size,
+    )
+
+
+def latest_snapshot(team, before):
+    """The team's snapshot covering forms dated before ``before``, or None."""
+    return TeamFormSnapshot.objects.filter(team=team, as_of__lt=before).order_by('-as_of').first()
+
+
+def form_saving(sender, instance, raw=False, **kwargs):
+    # Forms loaded from the database already know where they were stored.
+    if raw or instance.pk is None or instance.stored_key is not None:
+        return
+    instance.stored_key = TeamForm.objects.filter(pk=instance.pk).values_list('team_id', 'fixture_id').first()
+
+
+def form_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created and instance.stored_key is not None:
+        # Discard from where the form was, which an edit may have moved.
+        team_id, fixture_id = instance.stored_key
+        discard_forms([TeamForm(pk=instance.pk, team_id=team_id, fixture_id=fixture_id)])
+    apply_forms([instance])
+    instance.stored_key = (instance.team_id, instance.fixture_id)
+
+
+def form_deleted(sender, instance, **kwargs):
+    discard_forms([instance])
+
+
+def connect_signals():
+    pre_save.connect(form_saving, sender=TeamForm, dispatch_uid='prophet.rolling.form_saving')
+    post_save.connect(form_saved, sender=TeamForm, dispatch_uid='prophet.rolling.form_saved')
+    post_delete.connect(form_deleted, sender=TeamForm, dispatch_uid='prophet.rolling.form_deleted')
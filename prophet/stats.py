@@ -0,0 +1,95 @@
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.signals import post_save
+
+from .models import Country, DashboardCounter, Fixture, League, Team
+
+COUNTED_MODELS = {
+    'countries': Country,
+    'teams': Team,
+    'fixtures': Fixture,
+}
+
+SHOWCASE_CACHE_TIMEOUT = 60 * 60
+SHOWCASE_CACHE_KEY = 'prophet:dashboard:showcase'
+
+
+def counters():
+    """Current totals in one query; counters that are missing are rebuilt."""
+    values = dict(DashboardCounter.objects.values_list('name', 'value'))
+    missing = [name for name in COUNTED_MODELS if name not in values]
+    if missing:
+        values.update(reconcile(missing))
+    return values
+
+
+def reconcile(names=None):
+    """Recount from the tables, e.g. after bulk_create/bulk_update imports
+    which bypass the signals. Returns {name: value}."""
+    values = {name: COUNTED_MODELS[name].objects.count() for name in names or COUNTED_MODELS}
+    DashboardCounter.objects.bulk_create(
+        [DashboardCounter(name=name, value=value) for name, value in values.items()],
+        update_conflicts=True,
+        unique_fields=['name'],
+        update_fields=['value', 'updated_at'],
+    )
+    return values
+
+
+def bump(name, delta):
+    # A single UPDATE in the writer's transaction: concurrent writers cannot
+    # lose updates and a rollback takes the bump with it. A counter row that
+    # does not exist yet is left to counters() to rebuild.
+    DashboardCounter.objects.filter(name=name).update(value=F('value') + delta)
+
+
+def showcase():
+    """The teams and leagues listed on the dashboard, cached until either table changes."""
+    lists = cache.get(SHOWCASE_CACHE_KEY)
+    if lists is None:
+        lists = {'teams': list(Team.objects.all()[:5]), 'leagues': list(League.objects.all()[:5])}
+        cache.set(SHOWCASE_CACHE_KEY, lists, SHOWCASE_CACHE_TIMEOUT)
+    return lists
+
+
+def dashboard_context(profile):
+    """Context for dashboard.html for a logged-in Profile."""
+    totals = counters()
+    context = {
+        'last_name': profile.last_name,
+        'gambler': profile,
+        'total_countries': totals['countries'],
+        'total_teams': totals['teams'],
+        'total_fixtures': totals['fixtures'],
+    }
+    context.update(showcase())
+    return context
+
+
+def count_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump(COUNTED_NAMES[sender], 1)
+
+
+def record_deletions(counts):
+    """Apply a delete's per-model counts ({label: rows}, as Model.delete and
+    QuerySet.delete return them): one UPDATE per counter, not per row."""
+    for name, model in COUNTED_MODELS.items():
+        if counts.get(model._meta.label):
+            bump(name, -counts[model._meta.label])
+    if counts.get(Team._meta.label) or counts.get(League._meta.label):
+        cache.delete(SHOWCASE_CACHE_KEY)
+
+
+def forget_showcase(sender, instance, **kwargs):
+    cache.delete(SHOWCASE_CACHE_KEY)
+
+
+COUNTED_NAMES = {model: name for name, model in COUNTED_MODELS.items()}
+
+
+def connect_signals():
+    for model in COUNTED_MODELS.values():
+        post_save.connect(count_created, sender=model, dispatch_uid=f'prophet.stats.count_created.{model.__name__}')
+    for model in (Team, League):
+        post_save.connect(forget_showcase, sender=model, dispatch_uid=f'prophet.stats.showcase_save.{model.__name__}')
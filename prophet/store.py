@@ -0,0 +1,140 @@
+import hashlib
+
+from django.db import router
+
+from .models import PredictedResult, PredictionType
+from .utils import (
+    EVIDENCE_VARIABLES, MARKETS, FixturePrediction, MarketPrediction,
+    build_evidence_batch, model_registry, predict_evidence,
+)
+
+MARKET_PREDICTION_TYPES = {
+    'MatchResult': '1X2',
+    'OverUnderResult': 'Over/Under',
+    'GGResult': 'GG',
+    'HandicapResult': 'Handicap',
+    'CorrectScore': 'Correct Score',
+}
+
+
+def evidence_fingerprint(evidence):
+    return ''.join(str(evidence[variable]) for variable in EVIDENCE_VARIABLES)
+
+
+def predictions_etag(batch, model_version):
+    """Validator for predictions of ``batch``: changes with the evidence, the model or the fixtures."""
+    digest = hashlib.sha1(model_version.encode())
+    for fixture, row in zip(batch.fixtures, batch.matrix):
+        digest.update(
+            f'{fixture.pk}:{fixture.date}:{fixture.time}:{fixture.home_team.name}:{fixture.away_team.name}:'.encode()
+        )
+        digest.update(row.tobytes())
+    return digest.hexdigest()
+
+
+def market_prediction_types():
+    names = list(MARKET_PREDICTION_TYPES.values())
+    by_name = {}
+    # Read where they are created, so a lagging replica cannot cause duplicates.
+    types = PredictionType.objects.db_manager(router.db_for_write(PredictionType))
+    for prediction_type in types.filter(name__in=names).order_by('-pk'):
+        by_name[prediction_type.name] = prediction_type
+    missing = [PredictionType(name=name) for name in names if name not in by_name]
+    if missing:
+        for prediction_type in types.bulk_create(missing):
+            by_name[prediction_type.name] = prediction_type
+    return {market: by_name[name] for market, name in MARKET_PREDICTION_TYPES.items()}
+
+
+def save_predictions(predictions, model_version, batch_size=500):
+    """Upsert one PredictedResult per fixture and market."""
+    prediction_types = market_prediction_types()
+    rows = []
+    for prediction in predictions:
+        fixture = prediction.fixture
+        fingerprint = evidence_fingerprint(prediction.evidence)
+        for market in MARKETS:
+            rows.append(PredictedResult(
+                fixture=fixture,
+                home_team_id=fixture.home_team_id,
+                away_team_id=fixture.away_team_id,
+                prediction_type=prediction_types[market],
+                predicted_result=prediction.markets[market].answer,
+                probabilities=prediction.markets[market].probabilities,
+                evidence_fingerprint=fingerprint,
+                model_version=model_version,
+            ))
+    PredictedResult.objects.bulk_create(
+        rows,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['fixture', 'prediction_type'],
+        update_fields=[
+            'home_team', 'away_team', 'predicted_result', 'probabilities',
+            'evidence_fingerprint', 'model_version', 'updated_at',
+        ],
+    )
+    return len(rows)
+
+
+def stored_predictions(fixture_ids):
+    """Stored rows grouped as {fixture_id: {market: PredictedResult}}."""
+    markets_by_type = {name: market for market, name in MARKET_PREDICTION_TYPES.items()}
+    stored = {}
+    rows = PredictedResult.objects.filter(
+        fixture_id__in=fixture_ids, prediction_type__name__in=markets_by_type,
+    ).select_related('prediction_type')
+    for row in rows:
+        stored.setdefault(row.fixture_id, {})[markets_by_type[row.prediction_type.name]] = row
+    return stored
+
+
+def is_fresh(rows, fingerprint, model_version):
+    return len(rows) == len(MARKETS) and all(
+        row.evidence_fingerprint == fingerprint and row.model_version == model_version
+        for row in rows.values()
+    )
+
+
+def resolve_predictions(fixtures, compiled, force=False, batch=None):
+    """Return ``(predictions, recomputed)`` for ``fixtures``.
+
+    Evidence is always gathered in bulk because it is cheap. Inference only
+    runs for fixtures whose stored rows are missing, were made from other
+    evidence, or were made by another model version (or for all of them
+    with ``force``); those predictions are also returned in ``recomputed``.
+    A ``batch`` already built for ``fixtures`` is reused.
+    """
+    if batch is None:
+        batch = build_evidence_batch(fixtures)
+    stored = {} if force else stored_predictions([int(fixture_id) for fixture_id in batch.fixture_ids])
+
+    predictions = []
+    recomputed = []
+    answered = {}
+    for fixture in batch.fixtures:
+        evidence = batch.evidence(fixture.pk)
+        rows = stored.get(fixture.pk, {})
+        if is_fresh(rows, evidence_fingerprint(evidence), compiled.version):
+            markets = {
+                market: MarketPrediction(rows[market].predicted_result, rows[market].probabilities)
+                for market in MARKETS
+            }
+            predictions.append(FixturePrediction(fixture, evidence, markets))
+        else:
+            prediction = predict_evidence(fixture, evidence, compiled, answered=answered)
+            predictions.append(prediction)
+            recomputed.append(prediction)
+    return predictions, recomputed
+
+
+def load_predictions(fixtures, compiled=None, refresh=True, batch=None):
+    """FixturePredictions for ``fixtures``, served from PredictedResult where possible.
+
+    Recomputed predictions are written back when ``refresh`` is set.
+    """
+    compiled = compiled or model_registry.get()
+    predictions, recomputed = resolve_predictions(fixtures, compiled, batch=batch)
+    if refresh and recomputed:
+        save_predictions(recomputed, compiled.version)
+    return predictions
@@ -0,0 +1,141 @@
+from collections import namedtuple
+from datetime import date, time, timedelta
+from itertools import combinations
+
+import numpy as np
+
+from . import rolling, stats
+from .models import (
+    Country, League, Team, Fixture, TeamForm, HeadToHead, Player, InjuredPlayer, PredictionType, Prediction,
+)
+
+Scale = namedtuple('Scale', [
+    'countries', 'leagues_per_country', 'teams_per_league', 'rounds',
+    'meetings_per_pair', 'players_per_team', 'injury_rate', 'predictions_per_fixture',
+])
+
+SCALES = {
+    'tiny': Scale(1, 1, 6, 4, 2, 5, 0.1, 2),
+    'small': Scale(1, 2, 20, 38, 3, 11, 0.05, 3),
+    'medium': Scale(4, 3, 20, 38, 3, 18, 0.05, 3),
+    'large': Scale(10, 5, 20, 38, 5, 25, 0.05, 3),
+}
+
+RESULTS = ['W', 'D', 'L']
+EFFECTS = [effect for effect, _ in Player.EFFECT_CHOICES]
+POSITIONS = [position for position, _ in Player.POSITION_CHOICES]
+EXTERNAL_VALUES = ['1', 'X', '2']
+FORMS_PER_TEAM = 5
+
+
+def round_robin(team_ids, rounds):
+    """``rounds`` rounds of (home, away) pairs by the circle method; every team plays once per round."""
+    teams = list(team_ids) + ([None] if len(team_ids) % 2 else [])
+    schedule = []
+    for number in range(rounds):
+        pairs = [(teams[i], teams[-1 - i]) for i in range(len(teams) // 2)]
+        if number % 2:
+            pairs = [(away, home) for home, away in pairs]
+        schedule.append([pair for pair in pairs if None not in pair])
+        teams = [teams[0], teams[-1]] + teams[1:-1]
+    return schedule
+
+
+def generate(scale, seed=0, today=None, batch_size=2000):
+    """Bulk-create a synthetic data set of ``scale`` (a Scale) and return row counts per model.
+
+    The same scale and seed give the same rows. Half of each league's rounds
+    are played before ``today`` (with scores), the rest are upcoming. Bulk
+    writes skip the model signals, so form snapshots and dashboard counters
+    are rebuilt once at the end.
+    """
+    rng = np.random.default_rng(seed)
+    today = today or date.today()
+    first_round = today - timedelta(weeks=scale.rounds // 2)
+
+    countries = Country.objects.bulk_create(
+        [Country(name=f'Synthetic {seed}-{c}') for c in range(scale.countries)]
+    )
+    leagues = League.objects.bulk_create([
+        League(country=country, name=f'League {c}.{l}')
+        for c, country in enumerate(countries) for l in range(scale.leagues_per_country)
+    ])
+    teams = Team.objects.bulk_create([
+        Team(league=league, name=f'Team {l}.{t}')
+        for l, league in enumerate(leagues) for t in range(scale.teams_per_league)
+    ], batch_size=batch_size)
+    teams_by_league = {}
+    for team in teams:
+        teams_by_league.setdefault(team.league_id, []).append(team.pk)
+
+    fixtures = []
+    for league in leagues:
+        for number, pairs in enumerate(round_robin(teams_by_league[league.pk], scale.rounds)):
+            kickoff_date = first_round + timedelta(weeks=number)
+            played = kickoff_date < today
+            for home_id, away_id in pairs:
+                goals = rng.poisson((1.5, 1.1)) if played else (None, None)
+                fixtures.append(Fixture(
+                    league=league, home_team_id=home_id, away_team_id=away_id, date=kickoff_date,
+                    time=time(12 + int(rng.integers(0, 9)), 0),
+                    home_goals=None if goals[0] is None else int(goals[0]),
+                    away_goals=None if goals[1] is None else int(goals[1]),
+                ))
+    fixtures = Fixture.objects.bulk_create(fixtures, batch_size=batch_size)
+
+    forms = [
+        TeamForm(
+            fixture=fixture, team_id=team_id, game_number=game_number,
+            result=RESULTS[int(rng.integers(0, 3))],
+            over_under='Over' if rng.random() < 0.5 else 'Under',
+            gg='gg' if rng.random() < 0.5 else 'no gg',
+            venue='H' if rng.random() < 0.5 else 'A',
+        )
+        for fixture in fixtures
+        for team_id in (fixture.home_team_id, fixture.away_team_id)
+        for game_number in range(1, FORMS_PER_TEAM + 1)
+    ]
+    TeamForm.objects.bulk_create(forms, batch_size=batch_size)
+
+    meetings = [
+        HeadToHead(**HeadToHead.fields_for(
+            *(pair if number % 2 else pair[::-1]), first_round - timedelta(days=120 * (number + 1)),
+            int(rng.poisson(1.4)), int(rng.poisson(1.2)),
+        ))
+        for team_ids in teams_by_league.values()
+        for pair in combinations(team_ids, 2)
+        for number in range(scale.meetings_per_pair)
+    ]
+    HeadToHead.objects.bulk_create(meetings, batch_size=batch_size)
+
+    players = Player.objects.bulk_create([
+        Player(
+            player_code=f'S{seed}-{t}-{p}', team=team, name=f'Player {t}.{p}',
+            position=POSITIONS[int(rng.integers(0, len(POSITIONS)))],
+            effect=EFFECTS[int(rng.integers(0, len(EFFECTS)))],
+            rating=int(rng.integers(40, 100)),
+        )
+        for t, team in enumerate(teams) for p in range(scale.players_per_team)
+    ], batch_size=batch_size)
+    injured = InjuredPlayer.objects.bulk_create(
+        [InjuredPlayer(player=player) for player in players if rng.random() < scale.injury_rate],
+        batch_size=batch_size,
+    )
+
+    one_x_two, _ = PredictionType.objects.get_or_create(name='1X2')
+    predictions = Prediction.objects.bulk_create([
+        Prediction(
+            fixture=fixture, prediction_type=one_x_two,
+            value=EXTERNAL_VALUES[int(rng.integers(0, 3))],
+            prediction_site=f'site-{site}', site_accuracy=round(float(rng.uniform(40, 90)), 2),
+        )
+        for fixture in fixtures for site in range(scale.predictions_per_fixture)
+    ], batch_size=batch_size)
+
+    rolling.rebuild([team.pk for team in teams], batch_size=batch_size)
+    stats.reconcile()
+    return {
+        'countries': len(countries), 'leagues': len(leagues), 'teams': len(teams), 'fixtures': len(fixtures),
+        'forms': len(forms), 'head_to_heads': len(meetings), 'players': len(players),
+        'injuries': len(injured), 'predictions': len(predictions),
+    }
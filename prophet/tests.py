@@ -1,3 +1,1863 @@
-from django.test import TestCase
+from datetime import date, time, timedelta
 
-# Create your tests here.
+import asyncio
+import contextvars
+import json
+import os
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from importlib import import_module
+from io import StringIO
+from time import monotonic, sleep
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.cache.backends import locmem
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+from django.test import (
+    AsyncRequestFactory, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.http import HttpResponse, QueryDict
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Country, League, Team, Fixture, HeadToHead, TeamForm, TeamFormSnapshot, Player, InjuredPlayer, PredictionType, Prediction,
+    PredictedResult, Gambler, System_User, DashboardCounter, TrainingCount, TrainingRecord, ParameterSet, TeamStat,
+    SuspendedPlayer,
+    PasswordResetToken, OutboundEmail, hash_token,
+)
+from . import rolling
+from .backtest import backtest_season, season_of
+from .benchmarks import run_scale
+from .database import PIN_COOKIE, PinState, ReplicaPinningMiddleware, ReplicaRouter, pin_state
+from .importers import import_file, import_rows
+from .outbox import claim, deliver, enqueue, enqueue_digests, matchday_digest
+from .instrumentation import HISTOGRAMS, RequestTimings, current, time_query, timed
+from .management.commands.benchmark_startup import parse_importtime
+from .profiles import SESSION_KEY, Profile, request_profile
+from .stats import SHOWCASE_CACHE_KEY, counters, reconcile
+from .synthetic import SCALES, generate, round_robin
+from .store import load_predictions
+from .training import fit, load_model, retract, update_counts
+from .views import AsyncDashboardView, AsyncLeagueFixturesPredictionView, BoundedExecutor
+from .utils import (
+    EVIDENCE_CARD, EVIDENCE_VARIABLES, MARKETS, AnswerTable, infer_markets, ModelRegistry, PredictionEngine,
+    build_evidence_batch, build_model, market_outcomes, model_registry, predict_batch,
+)
+
+
+def create_fixture(fixture_date=date(2025, 5, 10)):
+    country = Country.objects.create(name='Kenya')
+    league = League.objects.create(country=country, name='Premier League')
+    home = Team.objects.create(league=league, name='Gor Mahia')
+    away = Team.objects.create(league=league, name='AFC Leopards')
+    return Fixture.objects.create(
+        league=league, home_team=home, away_team=away, date=fixture_date, time=time(15, 0)
+    )
+
+
+def add_history(fixture):
+    earlier = Fixture.objects.create(
+        league=fixture.league, home_team=fixture.home_team, away_team=fixture.away_team,
+        date=date(2025, 1, 4), time=time(15, 0),
+    )
+    for number, result in enumerate('WWDWL', start=1):
+        TeamForm.objects.create(
+            team=fixture.home_team, fixture=earlier, game_number=number,
+            result=result, over_under='Over', gg='gg',
+        )
+        TeamForm.objects.create(
+            team=fixture.away_team, fixture=earlier, game_number=number,
+            result='L', over_under='Under', gg='no gg',
+        )
+    for day, (home_goals, away_goals) in enumerate([(2, 1), (1, 0), (0, 0)], start=1):
+        HeadToHead.objects.record(fixture.home_team, fixture.away_team, date(2024, 3, day), home_goals, away_goals)
+    striker = Player.objects.create(
+        player_code=f'PLY{fixture.pk:03d}', team=fixture.away_team, name='Striker', position='ST', effect='best',
+    )
+    InjuredPlayer.objects.create(player=striker)
+    one_x_two, _ = PredictionType.objects.get_or_create(name='1X2')
+    Prediction.objects.create(
+        fixture=fixture, prediction_type=one_x_two, value='X', prediction_site='site-a', site_accuracy=61,
+    )
+    Prediction.objects.create(
+        fixture=fixture, prediction_type=one_x_two, value='1', prediction_site='site-b', site_accuracy=74,
+    )
+
+
+class ModelRegistryTests(SimpleTestCase):
+    def test_builds_network_once(self):
+        calls = []
+
+        def builder():
+            calls.append(1)
+            return build_model()
+
+        registry = ModelRegistry(builder)
+        first = registry.get()
+        second = registry.get()
+        self.assertIs(first, second)
+        self.assertEqual(len(calls), 1)
+
+    def test_compiled_cpds_are_read_only(self):
+        compiled = ModelRegistry().get()
+        cpd = compiled.model.get_cpds('MatchResult')
+        with self.assertRaises(ValueError):
+            cpd.values[0] = 1.0
+
+    def test_install_swaps_version(self):
+        registry = ModelRegistry()
+        original = registry.get()
+        self.assertIs(registry.install(build_model()), original)
+
+        changed = build_model()
+        changed.get_cpds('HandicapResult').values[:] = changed.get_cpds('HandicapResult').values[::-1]
+        swapped = registry.install(changed)
+        self.assertNotEqual(swapped.version, original.version)
+        self.assertIs(registry.get(), swapped)
+
+
+class AnswerTableTests(SimpleTestCase):
+    def test_table_covers_every_evidence_combination(self):
+        table = model_registry.get().table
+        self.assertEqual(table.answers.shape, EVIDENCE_CARD + (len(MARKETS),))
+
+    def test_table_matches_live_inference(self):
+        compiled = model_registry.get()
+        self.assertEqual(compiled.table.verify(compiled.inference), [])
+
+    def test_verify_reports_disagreement(self):
+        compiled = model_registry.get()
+        answers = compiled.table.answers.copy()
+        answers[0, 0, 0, 0, 0, 0, 0] = 2
+        mismatches = AnswerTable(answers, compiled.table.probabilities).verify(compiled.inference)
+        self.assertEqual(mismatches, [((0, 0, 0, 0, 0, 0), 'MatchResult', 2, 0)])
+
+
+class TensorInferenceTests(SimpleTestCase):
+    def test_posteriors_match_variable_elimination(self):
+        compiled = model_registry.get()
+        matrix = np.array(list(np.ndindex(*EVIDENCE_CARD)), dtype=np.int8)
+        answers = compiled.tensor.answer_matrix(matrix)
+        posteriors = compiled.tensor.posterior_matrices(matrix)
+        for row, key in enumerate(matrix):
+            live_answers, live_probabilities = infer_markets(compiled.inference, dict(zip(EVIDENCE_VARIABLES, key)))
+            for position, variable in enumerate(MARKETS):
+                self.assertEqual(answers[row, position], live_answers[variable])
+                np.testing.assert_allclose(posteriors[variable][row], live_probabilities[variable], atol=1e-12)
+
+    def test_informative_network_matches_variable_elimination(self):
+        # The shipped CPDs ignore their parents; random ones make every
+        # evidence combination, and the CorrectScore parents, matter.
+        model = build_model()
+        rng = np.random.default_rng(7)
+        for cpd in model.get_cpds():
+            values = rng.random(cpd.values.shape) + 0.05
+            cpd.values = values / values.sum(axis=0, keepdims=True)
+        registry = ModelRegistry(builder=lambda: model, with_table=True)
+        compiled = registry.get()
+        self.assertEqual(compiled.table.verify(compiled.inference), [])
+        for key in [(0, 0, 0, 0, 0, 0), (1, 0, 1, 0, 1, 2), (1, 1, 1, 1, 1, 1)]:
+            _, live = infer_markets(compiled.inference, dict(zip(EVIDENCE_VARIABLES, key)))
+            tensor = compiled.tensor.posterior_matrices(np.array([key]))
+            for variable in MARKETS:
+                np.testing.assert_allclose(tensor[variable][0], live[variable], atol=1e-12)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_inference', '--fixtures', '50', '--pgmpy-sample', '2', stdout=out)
+        self.assertIn('50 fixtures: tensor', out.getvalue())
+
+    def test_rejects_out_of_range_evidence(self):
+        with self.assertRaises(ValueError):
+            model_registry.get().tensor.answer_matrix(np.array([[0, 0, 0, 0, 0, 3]]))
+
+
+class TrainingTests(TestCase):
+    def setUp(self):
+        self.fixture = create_fixture()
+        add_history(self.fixture)
+        self.played = [
+            Fixture.objects.create(
+                league=self.fixture.league, home_team=self.fixture.home_team, away_team=self.fixture.away_team,
+                date=date(2025, 4, day), time=time(15, 0), home_goals=home_goals, away_goals=away_goals,
+            )
+            for day, (home_goals, away_goals) in enumerate([(2, 1), (1, 0), (0, 2)], start=1)
+        ]
+
+    def counts(self, variable):
+        return np.array(TrainingCount.objects.get(variable=variable).counts)
+
+    def test_market_outcomes(self):
+        self.assertEqual(market_outcomes(2, 1), {
+            'MatchResult': 0, 'OverUnderResult': 0, 'GGResult': 0, 'HandicapResult': 1, 'CorrectScore': 1,
+        })
+        self.assertEqual(market_outcomes(0, 0), {
+            'MatchResult': 1, 'OverUnderResult': 1, 'GGResult': 1, 'HandicapResult': 2, 'CorrectScore': None,
+        })
+
+    def test_counts_are_incremental(self):
+        self.assertEqual(update_counts(), 3)
+        self.assertEqual(update_counts(), 0)
+        Fixture.objects.filter(pk=self.fixture.pk).update(home_goals=3, away_goals=0)
+        self.assertEqual(update_counts(), 1)
+        self.assertEqual(self.counts('MatchResult').sum(), 4)
+        self.assertEqual(self.counts('HomeForm').tolist(), [4, 0])
+        # 3-0 is not a CorrectScore state, so only three rows reach that table.
+        self.assertEqual(self.counts('CorrectScore').sum(), 3)
+
+    def test_retract_corrected_result(self):
+        update_counts()
+        Fixture.objects.filter(pk=self.played[2].pk).update(home_goals=2, away_goals=0)
+        self.assertEqual(retract([self.played[2].pk]), 1)
+        update_counts()
+        self.assertEqual(self.counts('MatchResult').sum(axis=tuple(range(1, 7))).tolist(), [3, 0, 0])
+
+    def test_fit_smooths_maximum_likelihood(self):
+        update_counts()
+        parameters = fit(alpha=1.0)
+        # All three played fixtures share the add_history evidence: two home wins, one away win.
+        match_result = np.array(parameters.cpds['MatchResult'])
+        column = np.ravel_multi_index((0, 1, 0, 1, 1, 0), EVIDENCE_CARD)
+        np.testing.assert_allclose(match_result[:, column], [3 / 6, 1 / 6, 2 / 6])
+        np.testing.assert_allclose(match_result[:, -1], [1 / 3] * 3)
+        for values in parameters.cpds.values():
+            np.testing.assert_allclose(np.array(values).sum(axis=0), 1.0)
+        self.assertEqual(fit(alpha=1.0).pk, parameters.pk)
+
+    def test_engine_serves_active_parameters(self):
+        update_counts()
+        parameters = fit(alpha=0.5, activate=True)
+        with self.settings(PROPHET_PARAMETER_SET='active'):
+            compiled = ModelRegistry().get()
+        self.assertEqual(compiled.version, parameters.version)
+        self.assertEqual(ModelRegistry(builder=lambda: load_model(parameters.version)).get().version, parameters.version)
+
+    def test_train_command(self):
+        out = StringIO()
+        call_command('train_model', '--activate', stdout=out)
+        self.assertIn('Counted 3 new fixtures', out.getvalue())
+        self.assertTrue(ParameterSet.objects.get().is_active)
+
+
+class BacktestTests(TestCase):
+    def setUp(self):
+        self.fixture = create_fixture()
+        add_history(self.fixture)
+        for fixture_date, (home_goals, away_goals) in [
+            (date(2025, 4, 1), (2, 1)), (date(2025, 4, 2), (1, 0)), (date(2025, 4, 3), (0, 2)),
+            (date(2025, 9, 6), (2, 1)),
+        ]:
+            Fixture.objects.create(
+                league=self.fixture.league, home_team=self.fixture.home_team, away_team=self.fixture.away_team,
+                date=fixture_date, time=time(15, 0), home_goals=home_goals, away_goals=away_goals,
+            )
+
+    def test_season_of(self):
+        self.assertEqual(season_of(date(2025, 4, 1)), ('2024/25', date(2024, 7, 1), date(2025, 7, 1)))
+        self.assertEqual(season_of(date(2025, 7, 1)), ('2025/26', date(2025, 7, 1), date(2026, 7, 1)))
+        self.assertEqual(season_of(date(2025, 4, 1), start_month=1), ('2025', date(2025, 1, 1), date(2026, 1, 1)))
+
+    def test_walk_forward_uses_earlier_seasons_only(self):
+        update_counts()
+        league = self.fixture.league_id
+        # Nothing was played before 2024/25, so its CPDs are uniform.
+        first = backtest_season(season_of(date(2025, 4, 1)))
+        n, correct, log_loss, brier = first[league, '2024/25', 'MatchResult']
+        self.assertEqual(n, 3)
+        self.assertAlmostEqual(log_loss / n, np.log(3))
+        self.assertAlmostEqual(brier / n, 2 / 3)
+        # 2025/26 is fitted on the three 2024/25 results: two home wins of three.
+        second = backtest_season(season_of(date(2025, 9, 6)))
+        n, correct, log_loss, brier = second[league, '2025/26', 'MatchResult']
+        self.assertEqual((n, correct), (1, 1))
+        self.assertAlmostEqual(log_loss, -np.log(3 / 6))
+
+    def test_current_injuries_stay_out_unless_asked_for(self):
+        update_counts()
+        season = season_of(date(2025, 9, 6))
+        held = backtest_season(season)
+        leaked = backtest_season(season, injuries=True)
+        InjuredPlayer.objects.all().delete()
+        self.assertEqual(backtest_season(season), held)
+        self.assertNotEqual(backtest_season(season, injuries=True), leaked)
+
+    def test_backtest_command_json(self):
+        out = StringIO()
+        call_command('backtest', '--workers', '1', '--json', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['injuries'], 'none')
+        seasons = {(row['season'], row['market']): row['fixtures'] for row in report['results']}
+        self.assertEqual(seasons['2024/25', 'MatchResult'], 3)
+        self.assertEqual(seasons['2025/26', 'MatchResult'], 1)
+        overall = {row['market']: row for row in report['overall']}
+        self.assertEqual(overall['MatchResult']['fixtures'], 4)
+        self.assertEqual(set(overall), set(MARKETS))
+
+    def test_results_import_retracts_corrected_scores(self):
+        update_counts()
+        header = 'country,league,home_team,away_team,date,result'
+        report = import_file('results', csv_upload(
+            header,
+            'Kenya,Premier League,Gor Mahia,AFC Leopards,2025-05-10,1-1',
+            'Kenya,Premier League,Gor Mahia,AFC Leopards,2025-04-03,1-2',
+            'Kenya,Premier League,Gor Mahia,AFC Leopards,2025-04-01,2-1',
+            'Kenya,Premier League,AFC Leopards,Gor Mahia,2025-04-01,0-0',
+        ))
+        self.assertEqual((report.created, report.updated), (1, 1))
+        self.assertEqual([number for number, _ in report.errors], [5])
+        self.fixture.refresh_from_db()
+        self.assertEqual((self.fixture.home_goals, self.fixture.away_goals), (1, 1))
+        self.assertFalse(TrainingRecord.objects.filter(fixture__date=date(2025, 4, 3)).exists())
+        self.assertEqual(update_counts(), 2)
+
+
+class StartupTests(SimpleTestCase):
+    def test_url_loading_does_not_import_pgmpy(self):
+        script = (
+            'import sys, django; django.setup(); '
+            'from django.urls import get_resolver; get_resolver().url_patterns; '
+            'import prophet.views, prophet.importers, prophet.training; '
+            'print(sorted(m for m in ("pgmpy", "torch", "pandas") if m in sys.modules))'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'soccer.settings'},
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_parse_importtime(self):
+        top, modules = parse_importtime(
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       10 |         10 |     numpy.core\n'
+            'import time:      200 |        210 | numpy\n'
+            'import time:       50 |       5000 | prophet.views\n'
+        )
+        self.assertEqual(top, [(5000, 'prophet.views'), (210, 'numpy')])
+        self.assertIn('numpy.core', modules)
+
+
+class SyntheticDataTests(TestCase):
+    def test_round_robin_plays_every_team_once_per_round(self):
+        schedule = round_robin(range(5), rounds=5)
+        for pairs in schedule:
+            playing = [team for pair in pairs for team in pair]
+            self.assertEqual(len(playing), len(set(playing)))
+            self.assertEqual(len(pairs), 2)
+        meetings = {frozenset(pair) for pairs in schedule for pair in pairs}
+        self.assertEqual(len(meetings), 10)
+
+    def test_generate_is_deterministic(self):
+        rows = generate(SCALES['tiny'], seed=3, today=date(2025, 5, 10))
+        self.assertEqual(rows['fixtures'], 12)
+        self.assertEqual(rows['forms'], 12 * 2 * 5)
+        first = list(Fixture.objects.order_by('pk').values_list('date', 'home_goals', 'away_goals'))
+        self.assertEqual(sum(goals is not None for _, goals, _ in first), 6)
+        self.assertEqual(TeamFormSnapshot.objects.values('team').distinct().count(), 6)
+        self.assertEqual(counters()['fixtures'], 12)
+
+        Country.objects.all().delete()
+        generate(SCALES['tiny'], seed=3, today=date(2025, 5, 10))
+        second = list(Fixture.objects.order_by('pk').values_list('date', 'home_goals', 'away_goals'))
+        self.assertEqual(first, second)
+
+    def test_run_scale_reports_query_counts(self):
+        result = run_scale(SCALES['tiny'], sample=3, pgmpy_sample=1)
+        metrics = result['metrics']
+        self.assertEqual(metrics['evidence_batch']['queries'], 1)
+        self.assertEqual(metrics['inference_batch']['queries'], 1)
+        self.assertEqual(metrics['evidence_single']['fixtures'], 3)
+        self.assertEqual(metrics['league_page_warm']['queries'], 4)
+        self.assertGreater(metrics['league_page_cold']['queries'], metrics['league_page_warm']['queries'])
+        self.assertGreater(metrics['instrumentation_overhead']['timers'], metrics['league_page_warm']['queries'])
+        self.assertLess(metrics['instrumentation_overhead']['share'], 0.01)
+
+
+class PredictionEngineTests(TestCase):
+    def test_engines_share_compiled_model(self):
+        fixture = create_fixture()
+        first = PredictionEngine(fixture.pk)
+        second = PredictionEngine(fixture.pk)
+        self.assertIs(first.compiled, second.compiled)
+        self.assertIs(first.compiled, model_registry.get())
+
+    def test_table_and_live_modes_agree(self):
+        fixture = create_fixture()
+        table_engine = PredictionEngine(fixture.pk)
+        live_engine = PredictionEngine(fixture.pk, use_table=False)
+        self.assertIsNotNone(table_engine.table)
+        for variable in MARKETS:
+            self.assertEqual(table_engine.answer(variable), live_engine.answer(variable))
+
+    def test_evidence_from_history(self):
+        fixture = create_fixture()
+        add_history(fixture)
+        evidence = PredictionEngine(fixture.pk).get_evidence()
+        self.assertEqual(evidence, {
+            'HomeForm': 0, 'AwayForm': 1, 'HomeInjuries': 0, 'AwayInjuries': 1,
+            'H2HResult': 1, 'ExternalPrediction': 0,
+        })
+
+    def test_predict_all_matches_single_market_methods(self):
+        fixture = create_fixture()
+        add_history(fixture)
+        for use_table in (True, False):
+            engine = PredictionEngine(fixture.pk, use_table=use_table)
+            result = engine.predict_all()
+            self.assertEqual(result.prediction_1x2, engine.predict_1x2())
+            self.assertEqual(result.prediction_over_under, engine.predict_over_under())
+            self.assertEqual(result.prediction_gg, engine.predict_gg())
+            self.assertEqual(result.prediction_handicap, engine.predict_handicap())
+            self.assertEqual(result.prediction_correct_score, engine.predict_correct_score())
+            for market in result.markets.values():
+                self.assertAlmostEqual(sum(market.probabilities.values()), 1.0)
+
+    def test_predict_all_gathers_evidence_once(self):
+        fixture = Fixture.objects.select_related('home_team', 'away_team').get(pk=create_fixture().pk)
+        add_history(fixture)
+        model_registry.get()
+        # forms x2, injuries x2, head-to-head, external predictions
+        with self.assertNumQueries(6):
+            PredictionEngine(fixture=fixture).predict_all()
+
+
+class LeagueFixturesPredictionViewTests(TestCase):
+    def setUp(self):
+        self.fixture = create_fixture()
+        add_history(self.fixture)
+        for day in (11, 12, 13):
+            Fixture.objects.create(
+                league=self.fixture.league, home_team=self.fixture.away_team, away_team=self.fixture.home_team,
+                date=date(2025, 5, day), time=time(18, 0),
+            )
+        self.url = reverse('league-fixtures', args=[self.fixture.league.pk])
+        model_registry.get()
+
+    def test_query_count_per_page(self):
+        self.client.get(self.url, {'from': '2025-05-01'})
+        # league, page ids, annotated fixtures and stored predictions
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, {'from': '2025-05-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['fixtures_with_predictions']), 4)
+
+    def test_defaults_to_upcoming_fixtures(self):
+        with mock.patch('django.utils.timezone.localdate', return_value=date(2025, 5, 12)):
+            response = self.client.get(self.url)
+        dates = [item.fixture.date for item in response.context['fixtures_with_predictions']]
+        self.assertEqual(dates, [date(2025, 5, 12), date(2025, 5, 13)])
+
+    def test_date_range(self):
+        response = self.client.get(self.url, {'from': '2025-05-11', 'to': '2025-05-12'})
+        dates = [item.fixture.date for item in response.context['fixtures_with_predictions']]
+        self.assertEqual(dates, [date(2025, 5, 11), date(2025, 5, 12)])
+
+    def test_keyset_pages(self):
+        seen = []
+        params = {'from': '2025-01-01'}
+        with mock.patch('prophet.views.LeagueFixturesPredictionView.paginate_by', 3):
+            while params is not None:
+                response = self.client.get(self.url, params)
+                seen += [item.fixture.date for item in response.context['fixtures_with_predictions']]
+                next_query = response.context['next_query']
+                params = QueryDict(next_query) if next_query else None
+        self.assertEqual(seen, sorted(Fixture.objects.filter(league=self.fixture.league).values_list('date', flat=True)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'after': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_streamed_rows(self):
+        with mock.patch('prophet.views.LeagueFixturesPredictionView.stream_chunk_size', 2):
+            response = self.client.get(self.url, {'from': '2025-01-01', 'stream': '1'})
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body.count('<tr>'), 1 + 5)
+        self.assertIn('</table>', body)
+
+    def test_streamed_empty_window(self):
+        response = self.client.get(self.url, {'from': '2030-01-01', 'stream': '1'})
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('No fixtures available', body)
+        self.assertEqual(body.count('<tr>'), 1 + 1)
+
+
+@override_settings(PROPHET_INSTRUMENTATION=True)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        create_fixture()
+        self.url = reverse('league-fixtures', args=[League.objects.get().pk])
+        for histogram in HISTOGRAMS.values():
+            histogram.reset()
+
+    def server_timing(self, response):
+        return dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+
+    def test_server_timing_header(self):
+        cold = self.server_timing(self.client.get(self.url, {'from': '2025-05-01'}))
+        warm = self.server_timing(self.client.get(self.url, {'from': '2025-05-01'}))
+        self.assertEqual(set(warm), {'sql', 'inference', 'render', 'total'})
+        self.assertIn('desc="4 queries"', warm['sql'])
+        self.assertGreater(float(cold['inference'][4:]), 0)
+        self.assertEqual(warm['inference'], 'dur=0.000')
+
+    async def test_async_requests_are_timed(self):
+        response = await self.async_client.get(self.url, {'from': '2025-05-01'})
+        self.assertIn('queries"', response['Server-Timing'])
+
+    def test_render_shortcut_is_timed(self):
+        timing = self.server_timing(self.client.get(reverse('login')))
+        self.assertGreater(float(timing['render'][4:]), 0)
+
+    def test_metrics_endpoint(self):
+        self.client.get(self.url, {'from': '2025-05-01'})
+        self.client.get(self.url, {'from': '2025-05-01'})
+        self.client.force_login(User.objects.create_user('staff', 'staff@prophet.test', 'x', is_staff=True))
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE prophet_request_seconds histogram', body)
+        self.assertIn('prophet_request_sql_queries_bucket{view="league-fixtures",le="5"} 1', body)
+        self.assertIn('prophet_request_sql_queries_count{view="league-fixtures"} 2', body)
+
+    def test_metrics_endpoint_is_restricted(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        log_in(self.client)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with self.settings(PROPHET_METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(Client().get('/metrics').status_code, 200)
+
+    def test_disabled_removes_middleware(self):
+        with self.settings(PROPHET_INSTRUMENTATION=False):
+            response = self.client.get(self.url, {'from': '2025-05-01'})
+            self.assertNotIn('Server-Timing', response)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 404)
+
+    def test_nested_calls_count_once(self):
+        @timed('inference')
+        def inner():
+            sleep(0.01)
+
+        @timed('inference')
+        def outer():
+            inner()
+            inner()
+
+        outer()  # no request in progress: nothing to record
+        timings = RequestTimings()
+        token = current.set(timings)
+        try:
+            outer()
+        finally:
+            current.reset(token)
+        self.assertGreaterEqual(timings.inference, 0.02)
+        self.assertLess(timings.inference, 0.04)
+
+    def test_threads_sharing_timings_all_count(self):
+        barrier = threading.Barrier(8)
+
+        @timed('inference')
+        def infer():
+            barrier.wait()  # every thread inside the timer at once
+            sleep(0.01)
+            for _ in range(200):
+                time_query(lambda *args: None, '', (), False, {})
+
+        timings = RequestTimings()
+        token = current.set(timings)
+        try:
+            threads = [threading.Thread(target=contextvars.copy_context().run, args=(infer,)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            current.reset(token)
+        self.assertEqual(timings.queries, 8 * 200)
+        self.assertGreaterEqual(timings.inference, 8 * 0.01)
+
+
+@override_settings(PROPHET_READ_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def in_request(self, func, state=None):
+        token = pin_state.set(state or PinState())
+        try:
+            return func()
+        finally:
+            pin_state.reset(token)
+
+    def test_prediction_reads_use_replica_during_requests(self):
+        self.assertIsNone(self.router.db_for_read(Fixture))  # commands and workers stay on the primary
+        self.assertEqual(self.in_request(lambda: self.router.db_for_read(Fixture)), 'replica')
+        self.assertIsNone(self.in_request(lambda: self.router.db_for_read(System_User)))
+        with override_settings(PROPHET_READ_REPLICAS=[]):
+            self.assertIsNone(self.in_request(lambda: self.router.db_for_read(Fixture)))
+
+    def test_writes_pin_the_request(self):
+        def write_then_read():
+            self.assertEqual(self.router.db_for_write(Fixture), 'default')
+            return self.router.db_for_read(PredictedResult)
+        self.assertIsNone(self.in_request(write_then_read))
+
+    def test_derived_and_unserved_writes_do_not_pin(self):
+        def write_then_read():
+            for model in (PredictedResult, DashboardCounter, System_User, Session):
+                self.assertEqual(self.router.db_for_write(model), 'default')
+            return self.router.db_for_read(Fixture)
+        self.assertEqual(self.in_request(write_then_read), 'replica')
+
+    def test_middleware_pins_after_write(self):
+        def view(request):
+            self.assertEqual(self.router.db_for_read(Fixture), 'replica')
+            self.router.db_for_write(Fixture)
+            return HttpResponse()
+
+        response = ReplicaPinningMiddleware(view)(self.factory.get('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        reads = []
+        middleware = ReplicaPinningMiddleware(lambda request: reads.append(self.router.db_for_read(Fixture)) or HttpResponse())
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        middleware(request)
+        middleware(self.factory.post('/'))
+        response = middleware(self.factory.get('/'))
+        self.assertEqual(reads, [None, None, 'replica'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+@override_settings(
+    PROPHET_READ_REPLICAS=['default'], DATABASE_ROUTERS=['prophet.database.ReplicaRouter'],
+    MIDDLEWARE=['prophet.database.ReplicaPinningMiddleware', *settings.MIDDLEWARE],
+)
+class ReplicaPinningTests(TestCase):
+    def test_cold_page_does_not_pin(self):
+        fixture = create_fixture()
+        response = self.client.get(reverse('league-fixtures', args=[fixture.league_id]), {'from': '2025-05-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(PredictedResult.objects.exists())  # the page filled the prediction cache
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class SQLitePragmaTests(TestCase):
+    def test_connection_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def journal_mode(self, directory):
+        path = os.path.join(directory, 'prophet.sqlite3')
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': path}, alias='pragma-test')
+        try:
+            with wrapper.cursor() as cursor:
+                cursor.execute('CREATE TABLE probe (id integer)')
+                cursor.execute('PRAGMA journal_mode')
+                return cursor.fetchone()[0], os.path.exists(path + '-wal')
+        finally:
+            wrapper.close()
+
+    def test_wal_is_opt_in(self):
+        # WAL is written into the database file, so it must not touch the
+        # checked-in db.sqlite3 unless a deployment asks for it.
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(self.journal_mode(directory), ('delete', False))
+        pragmas = {**settings.PROPHET_SQLITE_PRAGMAS, 'journal_mode': 'wal'}
+        with tempfile.TemporaryDirectory() as directory, self.settings(PROPHET_SQLITE_PRAGMAS=pragmas):
+            self.assertEqual(self.journal_mode(directory), ('wal', True))
+
+
+class EvidenceBatchTests(TestCase):
+    def setUp(self):
+        first = create_fixture()
+        add_history(first)
+        second = Fixture.objects.create(
+            league=first.league, home_team=first.away_team, away_team=first.home_team,
+            date=date(2025, 5, 17), time=time(18, 0),
+        )
+        HeadToHead.objects.record(second.home_team, second.away_team, date(2024, 8, 1), 3, 0)
+        self.fixtures = Fixture.objects.filter(league=first.league)
+
+    def test_batch_matches_engine_evidence(self):
+        batch = build_evidence_batch(self.fixtures)
+        self.assertEqual(len(batch.fixture_ids), 3)
+        for fixture in self.fixtures:
+            self.assertEqual(batch.evidence(fixture.pk), PredictionEngine(fixture.pk).get_evidence())
+
+    def test_batch_rejects_fixtures_it_does_not_hold(self):
+        first, second, last = sorted(fixture.pk for fixture in self.fixtures)
+        batch = build_evidence_batch(self.fixtures.exclude(pk=second))
+        self.assertEqual((batch.row(first), batch.row(last)), (0, 1))
+        for missing in (first - 1, second, last + 1):
+            with self.assertRaises(KeyError):
+                batch.evidence(missing)
+
+    def test_head_to_head_counts_only_last_five_meetings(self):
+        fixture = self.fixtures.get(date=date(2025, 5, 17))
+        home, away = fixture.home_team, fixture.away_team
+        HeadToHead.objects.all().delete()
+        for year in (2016, 2017, 2018):  # older home wins, outside the window
+            HeadToHead.objects.record(home, away, date(year, 1, 1), 2, 0)
+        for year, goals in zip(range(2019, 2024), [(1, 0), (1, 0), (0, 0), (0, 1), (0, 2)]):
+            HeadToHead.objects.record(away, home, date(year, 1, 1), *reversed(goals))
+        HeadToHead.objects.record(home, away, date(2025, 6, 1), 4, 0)  # after the fixture
+        batch = build_evidence_batch(self.fixtures.filter(pk=fixture.pk))
+        self.assertEqual(batch.fixtures[0].h2h_home_wins, 2)
+        self.assertEqual(batch.evidence(fixture.pk), PredictionEngine(fixture.pk).get_evidence())
+
+    def test_batch_query_count_is_constant(self):
+        with self.assertNumQueries(1):
+            build_evidence_batch(self.fixtures)
+
+    def test_predict_batch_matches_predict_all(self):
+        for use_table in (True, False):
+            for prediction in predict_batch(self.fixtures, use_table=use_table):
+                expected = PredictionEngine(prediction.fixture.pk, use_table=use_table).predict_all()
+                self.assertEqual(prediction.evidence, expected.evidence)
+                self.assertEqual(prediction.markets, expected.markets)
+
+
+class PredictionStoreTests(TestCase):
+    def setUp(self):
+        self.fixture = create_fixture()
+        add_history(self.fixture)
+        self.fixtures = Fixture.objects.filter(pk=self.fixture.pk)
+        self.compiled = model_registry.get()
+
+    def test_first_load_writes_every_market(self):
+        predictions = load_predictions(self.fixtures)
+        rows = PredictedResult.objects.filter(fixture=self.fixture)
+        self.assertEqual(rows.count(), len(MARKETS))
+        self.assertEqual({row.model_version for row in rows}, {self.compiled.version})
+        self.assertEqual({row.evidence_fingerprint for row in rows}, {'010110'})
+        self.assertEqual(predictions[0].markets, PredictionEngine(self.fixture.pk).predict_all().markets)
+
+    def test_fresh_rows_skip_inference(self):
+        expected = load_predictions(self.fixtures)[0].markets
+        with mock.patch('prophet.store.predict_evidence') as predict:
+            stored = load_predictions(self.fixtures)[0].markets
+        predict.assert_not_called()
+        self.assertEqual(stored, expected)
+
+    def test_changed_evidence_recomputes(self):
+        load_predictions(self.fixtures)
+        HeadToHead.objects.record(self.fixture.home_team, self.fixture.away_team, date(2024, 4, 1), 3, 1)
+        load_predictions(self.fixtures)
+        rows = PredictedResult.objects.filter(fixture=self.fixture)
+        self.assertEqual(rows.count(), len(MARKETS))
+        self.assertEqual({row.evidence_fingerprint for row in rows}, {'010100'})
+
+    def test_other_model_version_recomputes(self):
+        load_predictions(self.fixtures)
+        PredictedResult.objects.update(model_version='retired')
+        load_predictions(self.fixtures)
+        self.assertFalse(PredictedResult.objects.filter(model_version='retired').exists())
+
+
+class PrecomputePredictionsCommandTests(TestCase):
+    def setUp(self):
+        self.fixture = create_fixture()
+        add_history(self.fixture)
+
+    def precompute(self, *args):
+        out = StringIO()
+        call_command('precompute_predictions', '--all-dates', '--workers', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_writes_nothing(self):
+        output = self.precompute('--dry-run')
+        self.assertIn('would recompute 2', output)
+        self.assertFalse(PredictedResult.objects.exists())
+
+    def test_rerun_skips_fresh_fixtures(self):
+        self.assertIn('recomputed 2, 0 already fresh', self.precompute('--chunk-size', '1'))
+        self.assertEqual(PredictedResult.objects.count(), 2 * len(MARKETS))
+        self.assertIn('recomputed 0, 2 already fresh', self.precompute())
+
+    def test_league_and_date_window(self):
+        output = self.precompute('--league', str(self.fixture.league_id), '--from', '2025-05-01', '--to', '2025-05-31')
+        self.assertIn('Predicting 1 fixtures', output)
+
+    def test_default_window_starts_at_local_today(self):
+        out = StringIO()
+        with mock.patch('django.utils.timezone.localdate', return_value=self.fixture.date):
+            call_command('precompute_predictions', '--workers', '1', '--dry-run', stdout=out)
+        self.assertIn('Predicting 1 fixtures', out.getvalue())
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN QUERY PLAN for every hot prediction query must use an index.
+
+    SQLite reports a full table scan as ``SCAN <table>``; probes through an
+    index show up as ``SEARCH``. Each test also names the composite indexes
+    its queries are expected to use, so a plan that drifts back to a
+    single-column index (and a sort that grows with the table) fails too.
+    """
+
+    hot_tables = (
+        'prophet_fixture', 'prophet_teamform', 'prophet_teamformsnapshot', 'prophet_headtohead',
+        'prophet_prediction', 'prophet_player', 'prophet_predictedresult',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(name='Kenya')
+        leagues = [League.objects.create(country=country, name=f'League {n}') for n in range(3)]
+        teams = [Team.objects.create(league=leagues[n % 3], name=f'Team {n}') for n in range(30)]
+        one_x_two = PredictionType.objects.create(name='1X2')
+        fixtures = Fixture.objects.bulk_create([
+            Fixture(
+                league=leagues[n % 3], home_team=teams[n % 30], away_team=teams[(n + 7) % 30],
+                date=date(2024, 1, 1) + timedelta(days=n % 300), time=time(15, 0),
+            )
+            for n in range(600)
+        ])
+        TeamForm.objects.bulk_create([
+            TeamForm(
+                team=fixture.home_team, fixture=fixture, game_number=g, result='WDL'[(fixture.pk + g) % 3],
+                over_under='Over', gg='gg',
+            )
+            for fixture in fixtures for g in range(1, 6)
+        ])
+        rolling.rebuild()
+        pairs = {(fixture.home_team_id, fixture.away_team_id) for fixture in fixtures}
+        HeadToHead.objects.bulk_create([
+            HeadToHead(**HeadToHead.fields_for(home, away, date(2023, 1, 1) + timedelta(days=7 * g), 2, 1))
+            for home, away in pairs for g in range(20)
+        ])
+        Prediction.objects.bulk_create([
+            Prediction(
+                fixture=fixture, prediction_type=one_x_two, value='1', prediction_site='site', site_accuracy=70,
+            )
+            for fixture in fixtures
+        ])
+        players = Player.objects.bulk_create([
+            Player(
+                player_code=f'P{n:04d}', team=teams[n % 30], name=f'Player {n}', position='ST',
+                effect=['threat', 'best', 'moderate', 'required'][n % 4],
+            )
+            for n in range(300)
+        ])
+        InjuredPlayer.objects.bulk_create([InjuredPlayer(player=player) for player in players[::10]])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.league = leagues[0]
+        cls.fixture = fixtures[450]
+
+    def capture_plans(self, run):
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            run()
+        plans = []
+        with connection.cursor() as cursor:
+            for sql, params in statements:
+                if sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                    plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        self.assertTrue(plans)
+        return plans
+
+    def assertIndexed(self, run, *expected_indexes):
+        used = set()
+        for sql, plan in self.capture_plans(run):
+            for step in plan:
+                words = step.split()
+                if words[0] == 'SCAN' and words[1] in self.hot_tables and 'INDEX' not in words:
+                    self.fail(f'Full scan of {words[1]}:\n{sql}\n' + '\n'.join(plan))
+                if 'INDEX' in words:
+                    used.add(words[words.index('INDEX') + 1])
+        self.assertLessEqual(set(expected_indexes), used)
+
+    def test_engine_evidence_queries(self):
+        self.assertIndexed(
+            lambda: PredictionEngine(self.fixture.pk).get_evidence(),
+            'sqlite_autoindex_prophet_teamformsnapshot_1', 'player_team_effect_idx',
+            'sqlite_autoindex_prophet_headtohead_1', 'prediction_fixture_type_idx',
+        )
+
+    def test_batch_evidence_queries(self):
+        self.assertIndexed(
+            lambda: build_evidence_batch(Fixture.objects.filter(league=self.league)),
+            'sqlite_autoindex_prophet_teamformsnapshot_1', 'player_team_effect_idx',
+            'sqlite_autoindex_prophet_headtohead_1', 'prediction_fixture_type_idx',
+        )
+
+    def test_league_fixture_window(self):
+        self.assertIndexed(
+            lambda: list(
+                Fixture.objects.filter(league=self.league, date__gte=date(2024, 6, 1)).order_by('date', 'time', 'pk')
+            ),
+            'fixture_league_date_idx',
+        )
+
+    def test_stored_prediction_reads(self):
+        self.assertIndexed(
+            lambda: load_predictions(Fixture.objects.filter(league=self.league)),
+            # SQLite builds unique_fixture_prediction_type as an inline table constraint.
+            'sqlite_autoindex_prophet_predictedresult_1',
+        )
+
+    def test_reset_token_lookup_and_purge(self):
+        user = System_User.objects.create(username='punter@gmail.com', password_hash='x' * 10)
+        token = PasswordResetToken.objects.issue(user)
+        self.hot_tables += ('prophet_passwordresettoken',)
+        self.assertIndexed(
+            lambda: (PasswordResetToken.objects.usable(token), PasswordResetToken.objects.purge_expired()),
+            'sqlite_autoindex_prophet_passwordresettoken_1', 'prophet_passwordresettoken_expires_at_15452a26',
+        )
+
+
+class PredictionAPITests(TestCase):
+    def setUp(self):
+        self.fixture = create_fixture()
+        add_history(self.fixture)
+        self.others = [
+            Fixture.objects.create(
+                league=self.fixture.league, home_team=self.fixture.away_team, away_team=self.fixture.home_team,
+                date=date(2025, 5, day), time=time(18, 0),
+            )
+            for day in range(11, 17)
+        ]
+        model_registry.get()
+
+    def test_fixture_predictions(self):
+        response = self.client.get(reverse('api-fixture-predictions', args=[self.fixture.pk]))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['fixtures'][0]
+        expected = PredictionEngine(self.fixture.pk).predict_all()
+        self.assertEqual(data['id'], self.fixture.pk)
+        self.assertEqual(data['markets']['1x2']['prediction'], expected.prediction_1x2)
+        self.assertEqual(data['markets']['correct_score']['probabilities'], expected.markets['CorrectScore'].probabilities)
+        self.assertEqual(set(data['markets']), {'1x2', 'over_under', 'gg', 'handicap', 'correct_score'})
+
+    def test_unknown_fixture(self):
+        response = self.client.get(reverse('api-fixture-predictions', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_unchanged_poll_is_not_modified(self):
+        url = reverse('api-fixture-predictions', args=[self.fixture.pk])
+        etag = self.client.get(url)['ETag']
+        # evidence only: no stored-prediction read and no inference
+        with mock.patch('prophet.views.load_predictions') as load, self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        load.assert_not_called()
+
+    def test_changed_evidence_changes_etag(self):
+        url = reverse('api-fixture-predictions', args=[self.fixture.pk])
+        etag = self.client.get(url)['ETag']
+        HeadToHead.objects.record(self.fixture.home_team, self.fixture.away_team, date(2024, 4, 1), 3, 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_bulk_query_count_does_not_grow_with_ids(self):
+        url = reverse('api-bulk-predictions')
+        few = ','.join(str(f.pk) for f in self.others[:2])
+        many = ','.join(str(f.pk) for f in [self.fixture] + self.others)
+        self.client.get(url, {'ids': many})
+        # evidence and stored predictions
+        with self.assertNumQueries(2):
+            self.client.get(url, {'ids': few})
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'ids': many})
+        self.assertEqual(len(response.json()['fixtures']), 7)
+
+    def test_bulk_reports_missing_ids(self):
+        response = self.client.get(reverse('api-bulk-predictions'), {'ids': f'{self.fixture.pk},999'})
+        self.assertEqual(response.json()['missing'], [999])
+        self.assertEqual(len(response.json()['fixtures']), 1)
+
+    def test_bulk_rejects_bad_ids(self):
+        url = reverse('api-bulk-predictions')
+        self.assertEqual(self.client.get(url, {'ids': '1,x'}).status_code, 400)
+        with mock.patch('prophet.views.BulkPredictionAPIView.max_ids', 2):
+            self.assertEqual(self.client.get(url, {'ids': '1,2,3'}).status_code, 400)
+
+    def test_league_pages(self):
+        url = reverse('api-league-predictions', args=[self.fixture.league.pk])
+        with mock.patch('prophet.views.LeaguePredictionAPIView.paginate_by', 4):
+            first = self.client.get(url, {'from': '2025-05-01'}).json()
+            second = self.client.get(url, {'from': '2025-05-01', 'after': first['next']}).json()
+        self.assertEqual(len(first['fixtures']), 4)
+        self.assertEqual(len(second['fixtures']), 3)
+        self.assertIsNone(second['next'])
+
+
+# Query-count tests measure database work. With the default database cache
+# every cache read is a query too; in memory they cost none, as with Redis.
+in_memory_cache = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+
+@contextmanager
+def in_other_worker():
+    """Run the block as another worker process would: whatever it changes in
+    this process's in-memory caches is undone afterwards."""
+    stores = [*locmem._caches.values(), *locmem._expire_info.values()]
+    saved = [(store, store.copy()) for store in stores]
+    yield
+    for store, copy in saved:
+        store.clear()
+        store.update(copy)
+
+
+def log_in(client, username='punter@gmail.com'):
+    """Create the gambler and system user for ``username`` and log ``client`` in."""
+    Gambler.objects.create(
+        email_address=username, username=username, first_name='Amani', last_name='Otieno', phone_number='0798073204',
+    )
+    System_User.objects.create(username=username, password_hash='x' * 10)
+    session = client.session
+    session['username'] = username
+    session.save()
+
+
+def log_in_staff(client):
+    client.force_login(User.objects.create_user('staff', 'staff@prophet.test', 'x', is_staff=True))
+
+
+def csv_upload(*lines, name='import.csv'):
+    return SimpleUploadedFile(name, ('\n'.join(lines) + '\n').encode('utf-8'), content_type='text/csv')
+
+
+class ImportTests(TestCase):
+    fixture_header = 'country,league,home_team,away_team,date,time'
+
+    def test_fixtures_resolve_names_once(self):
+        upload = csv_upload(
+            self.fixture_header,
+            'Kenya,Premier League,Gor Mahia,AFC Leopards,2025-05-10,15:00',
+            'Kenya,Premier League,Tusker,Gor Mahia,2025-05-17,16:00',
+            'Uganda,Premier League,Vipers,KCCA,2025-05-10,14:00',
+        )
+        report = import_file('fixtures', upload)
+        self.assertEqual((report.rows, report.created, report.updated, report.errors), (3, 3, 0, []))
+        self.assertEqual(Country.objects.count(), 2)
+        self.assertEqual(League.objects.count(), 2)
+        self.assertEqual(Team.objects.count(), 5)
+        self.assertGreater(report.rows_per_second, 0)
+
+    def test_fixtures_upsert_on_natural_key(self):
+        fixture = create_fixture()
+        report = import_file('fixtures', csv_upload(
+            self.fixture_header, 'Kenya,Premier League,Gor Mahia,AFC Leopards,2025-05-10,18:30',
+        ))
+        self.assertEqual((report.created, report.updated), (0, 1))
+        fixture.refresh_from_db()
+        self.assertEqual(fixture.time, time(18, 30))
+        self.assertEqual(Fixture.objects.count(), 1)
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        create_fixture()
+        key = 'Kenya,Premier League,Gor Mahia,AFC Leopards'
+        report = import_file('forms', csv_upload(
+            self.fixture_header[:-5] + ',team,game_number,result,over_under,gg',
+            f'{key},2025-05-10,Gor Mahia,1,W,Over,gg',
+            f'{key},2025-05-10,Gor Mahia,2,Q,Over,gg',
+            f'{key},2025-06-01,Gor Mahia,1,W,Over,gg',
+            f'{key},2025-05-10,Gor Mahia,,W,Over,gg',
+        ))
+        self.assertEqual(report.created, 1)
+        self.assertEqual([number for number, _ in report.errors], [3, 4, 5])
+        self.assertEqual(TeamForm.objects.get().result, 'W')
+
+    @in_memory_cache
+    def test_chunks_share_name_cache(self):
+        rows = [
+            {'country': 'Kenya', 'league': 'Premier League', 'home_team': f'Home {i}', 'away_team': 'Away',
+             'date': '2025-05-10', 'time': '15:00'}
+            for i in range(25)
+        ]
+        # Three cache loads, the country get_or_create (select, savepoint,
+        # insert, release) and its counter bump, one league, 26 team inserts
+        # with their bumps, five chunks of savepoint, fixture lookup, bulk
+        # insert and release, then the fixture counter reconcile.
+        with self.assertNumQueries(3 + 5 + 1 + 26 * 2 + 5 * 4 + 2):
+            report = import_rows('fixtures', iter(rows), chunk_size=5)
+        self.assertEqual(report.created, 25)
+
+    def test_players_and_injuries(self):
+        fixture = create_fixture()
+        header = 'country,league,team,player_code,name,position,effect,rating'
+        import_file('players', csv_upload(header, 'Kenya,Premier League,AFC Leopards,PLY001,Otieno,st,best,80'))
+        report = import_file('players', csv_upload(
+            header, 'Kenya,Premier League,AFC Leopards,PLY001,Otieno,ST,threat,85',
+        ))
+        self.assertEqual((report.created, report.updated), (0, 1))
+        player = Player.objects.get()
+        self.assertEqual((player.effect, player.rating, player.team_id), ('threat', 85, fixture.away_team_id))
+
+        report = import_file('injuries', csv_upload('player_code', 'PLY001', 'PLY404'))
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.errors, [(3, 'Unknown player code PLY404.')])
+        self.assertTrue(InjuredPlayer.objects.filter(player=player).exists())
+
+    def test_child_kinds_do_not_create_teams(self):
+        create_fixture()
+        report = import_file('forms', csv_upload(
+            self.fixture_header[:-5] + ',team,game_number,result,over_under,gg',
+            'Kenya,Premier League,Gor Mahia,Tusker,2025-05-10,Tusker,1,W,Over,gg',
+        ))
+        self.assertEqual(report.created, 0)
+        self.assertEqual(report.errors, [(2, "Unknown team 'Tusker' in Premier League (Kenya).")])
+        self.assertFalse(Team.objects.filter(name='Tusker').exists())
+
+    def test_failed_chunk_forgets_its_new_names(self):
+        rows = [
+            {'country': 'Kenya', 'league': 'Premier League', 'home_team': 'Gor Mahia', 'away_team': 'Tusker',
+             'date': '2025-05-10', 'time': '15:00'},
+        ]
+        bulk_create = Fixture.objects.bulk_create
+        with mock.patch.object(Fixture.objects, 'bulk_create', side_effect=DatabaseError('disk full')):
+            report = import_rows('fixtures', iter(rows))
+        self.assertEqual(report.created, 0)
+        self.assertFalse(Team.objects.exists())
+        # A retry must create the teams again rather than use the rolled-back ids.
+        with mock.patch.object(Fixture.objects, 'bulk_create', side_effect=bulk_create):
+            report = import_rows('fixtures', iter(rows))
+        self.assertEqual(report.created, 1)
+        self.assertEqual(Team.objects.count(), 2)
+
+    def test_upload_view(self):
+        log_in_staff(self.client)
+        upload = csv_upload(self.fixture_header, 'Kenya,Premier League,Gor Mahia,AFC Leopards,2025-05-10,15:00')
+        response = self.client.post(reverse('import'), {'kind': 'fixtures', 'file': upload})
+        self.assertContains(response, '1 created')
+        self.assertEqual(Fixture.objects.count(), 1)
+
+    def test_upload_view_rejects_other_files(self):
+        log_in_staff(self.client)
+        upload = SimpleUploadedFile('fixtures.txt', b'nothing')
+        response = self.client.post(reverse('import'), {'kind': 'fixtures', 'file': upload})
+        self.assertContains(response, 'Unsupported file type')
+
+    def test_upload_page_lists_optional_columns_and_file_types(self):
+        log_in_staff(self.client)
+        response = self.client.get(reverse('import'))
+        self.assertContains(response, 'result, over_under, gg; optional: venue')
+        self.assertContains(response, 'match_date, result; optional: neutral')
+        self.assertContains(response, 'accept=".csv,.xlsx,.xlsm"')
+
+    def test_upload_view_is_staff_only(self):
+        log_in(self.client)
+        upload = csv_upload(self.fixture_header, 'Kenya,Premier League,Gor Mahia,AFC Leopards,2025-05-10,15:00')
+        response = self.client.post(reverse('import'), {'kind': 'fixtures', 'file': upload})
+        self.assertRedirects(response, f"{reverse('admin:login')}?next={reverse('import')}", fetch_redirect_response=False)
+        self.assertFalse(Fixture.objects.exists())
+
+
+class HeadToHeadTests(TestCase):
+    def setUp(self):
+        self.fixture = create_fixture()
+        self.home, self.away = self.fixture.home_team, self.fixture.away_team
+        HeadToHead.objects.record(self.home, self.away, date(2024, 3, 1), 2, 1)
+        HeadToHead.objects.record(self.away, self.home, date(2024, 9, 1), 1, 1)
+        HeadToHead.objects.record(self.away, self.home, date(2025, 2, 1), 3, 0)
+
+    def test_pair_is_unordered(self):
+        meeting = HeadToHead.objects.between(self.away, self.home).get(match_date=date(2025, 2, 1))
+        self.assertEqual(meeting.goals(self.away), (3, 0))
+        self.assertEqual(HeadToHead.objects.between(self.home, self.away).count(), 3)
+
+    def test_summary_from_either_side(self):
+        meetings = HeadToHead.objects.between(self.home, self.away)
+        self.assertEqual(meetings.summary(self.home), {
+            'meetings': 3, 'wins': 1, 'draws': 1, 'losses': 1, 'goals_for': 3, 'goals_against': 5, 'gg_rate': 2 / 3,
+        })
+        self.assertEqual(meetings.before(date(2025, 1, 1), last=1).summary(self.away)['draws'], 1)
+
+    def test_history_is_shared_by_every_fixture_of_the_pair(self):
+        Fixture.objects.create(
+            league=self.fixture.league, home_team=self.away, away_team=self.home,
+            date=date(2025, 5, 17), time=time(18, 0),
+        )
+        batch = build_evidence_batch(Fixture.objects.all())
+        for fixture in Fixture.objects.all():
+            engine = PredictionEngine(fixture.pk)
+            with self.assertNumQueries(1):
+                h2h = engine.calculate_h2h()
+            self.assertEqual(batch.evidence(fixture.pk)['H2HResult'], h2h)
+
+    def test_import_upserts_meetings(self):
+        header = 'country,league,home_team,away_team,match_date,result'
+        report = import_file('head_to_head', csv_upload(
+            header,
+            'Kenya,Premier League,AFC Leopards,Gor Mahia,2025-02-01,0-0',
+            'Kenya,Premier League,Gor Mahia,AFC Leopards,2025-03-01,4-2',
+            'Kenya,Premier League,Gor Mahia,AFC Leopards,2025-03-08,4:2',
+        ))
+        self.assertEqual((report.created, report.updated), (1, 1))
+        self.assertEqual([number for number, _ in report.errors], [4])
+        self.assertEqual(HeadToHead.objects.get(match_date=date(2025, 2, 1)).goals(self.away), (0, 0))
+
+
+
+class HeadToHeadMigrationTests(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('prophet', target)])
+        return executor.loader.project_state(('prophet', target)).apps
+
+    def test_carried_over_meetings_have_unknown_venue(self):
+        apps = self.migrate('0005_rolling_team_form')
+        league = apps.get_model('prophet', 'League').objects.create(
+            name='Premier League', country=apps.get_model('prophet', 'Country').objects.create(name='Kenya'),
+        )
+        Team = apps.get_model('prophet', 'Team')
+        home, away = Team.objects.create(name='Gor Mahia', league=league), Team.objects.create(name='AFC Leopards', league=league)
+        fixture = apps.get_model('prophet', 'Fixture').objects.create(
+            league=league, home_team=away, away_team=home, date=date(2025, 5, 10), time=time(15, 0),
+        )
+        apps.get_model('prophet', 'HeadToHead').objects.create(fixture=fixture, match_date=date(2024, 3, 1), result='2-1')
+
+        self.migrate('0006_pair_indexed_head_to_head')
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('prophet')[0][1])
+        meeting = HeadToHead.objects.get()
+        self.assertEqual(meeting.venue, '')
+        self.assertEqual(meeting.goals(away), (2, 1))
+
+class RollingFormTests(TestCase):
+    def setUp(self):
+        self.fixture = create_fixture()
+        self.team = self.fixture.home_team
+        self.days = [
+            Fixture.objects.create(
+                league=self.fixture.league, home_team=self.team, away_team=self.fixture.away_team,
+                date=date(2025, 3, day), time=time(15, 0),
+            )
+            for day in range(1, 5)
+        ]
+
+    def add_form(self, fixture, game_number, result, over_under='Over', gg='gg', venue='H'):
+        return TeamForm.objects.create(
+            team=self.team, fixture=fixture, game_number=game_number, result=result,
+            over_under=over_under, gg=gg, venue=venue,
+        )
+
+    def snapshots(self, team=None):
+        return [
+            {field: getattr(snapshot, field) for field in ['as_of'] + rolling.SUMMARY_FIELDS}
+            for snapshot in TeamFormSnapshot.objects.filter(team=team or self.team).order_by('as_of')
+        ]
+
+    def test_migration_walk_matches_rolling(self):
+        migration = import_module('prophet.migrations.0005_rolling_team_form')
+        entries = [
+            (date(2025, 3, 1 + n // 3), [n % 5, n, 'WDL'[n % 3], 'Over' if n % 2 else 'Under', 'gg', 'HA'[n % 2]])
+            for n in range(14)
+        ]
+        self.assertEqual(list(migration.walk(entries)), list(rolling.walk(entries)))
+
+    def test_incremental_matches_rebuild(self):
+        forms = [
+            self.add_form(self.days[3], 1, 'W'),
+            self.add_form(self.days[0], 3, 'L', over_under='Under', venue='A'),
+            self.add_form(self.days[1], 2, 'D', gg='no gg'),
+        ]
+        forms += [self.add_form(self.days[2], n, 'WDL'[n % 3], venue='HA'[n % 2]) for n in range(4, 14)]
+        forms[1].result = 'W'
+        forms[1].save()
+        forms[5].delete()
+        incremental = self.snapshots()
+        rolling.rebuild([self.team.pk])
+        self.assertEqual(self.snapshots(), incremental)
+        self.assertEqual([snapshot['as_of'] for snapshot in incremental], [day.date for day in self.days])
+
+    def assert_matches_rebuild(self, *teams):
+        incremental = [self.snapshots(team) for team in teams]
+        rolling.rebuild([team.pk for team in teams])
+        self.assertEqual([self.snapshots(team) for team in teams], incremental)
+
+    def test_moving_form_to_later_fixture(self):
+        self.add_form(self.days[0], 1, 'L')
+        moved = self.add_form(self.days[1], 2, 'W')
+        self.add_form(self.days[3], 3, 'D')
+        moved = TeamForm.objects.get(pk=moved.pk)  # as an admin edit would load it
+        moved.fixture = self.days[2]
+        moved.save()
+        earlier = TeamFormSnapshot.objects.filter(team=self.team, as_of__lt=self.days[2].date)
+        self.assertFalse([snapshot for snapshot in earlier if moved.pk in [entry[1] for entry in snapshot.recent]])
+        self.assert_matches_rebuild(self.team)
+
+        moved.fixture = self.days[3]  # the same instance, saved again
+        moved.save()
+        self.assert_matches_rebuild(self.team)
+
+    def test_moving_form_to_another_team(self):
+        other = self.fixture.away_team
+        form = self.add_form(self.days[0], 1, 'W')
+        # Built rather than loaded, so the stored team is read before saving.
+        edited = TeamForm(pk=form.pk, team=other, fixture=self.days[0], game_number=1, result='W', over_under='Over', gg='gg')
+        edited.save()
+        self.assertFalse(TeamFormSnapshot.objects.filter(team=self.team).exists())
+        self.assertEqual(TeamFormSnapshot.objects.get(team=other).played, 1)
+        self.assert_matches_rebuild(self.team, other)
+
+    def test_windows_rates_and_splits(self):
+        self.add_form(self.days[0], 1, 'W', venue='H')
+        self.add_form(self.days[0], 2, 'W', over_under='Under', venue='A')
+        self.add_form(self.days[0], 3, 'D', gg='no gg', venue='H')
+        self.add_form(self.days[0], 4, 'L', venue='A')
+        snapshot = TeamFormSnapshot.objects.get(team=self.team)
+        self.assertEqual((snapshot.last5_wins, snapshot.last5_draws, snapshot.last5_losses), (2, 1, 1))
+        self.assertEqual((snapshot.over_rate, snapshot.gg_rate), (0.75, 0.75))
+        self.assertEqual((snapshot.home_wins, snapshot.home_played), (1, 2))
+        self.assertEqual((snapshot.away_wins, snapshot.away_played), (1, 2))
+
+    def test_removing_from_full_window_tops_up(self):
+        forms = [self.add_form(self.days[0], n, 'W' if n == 1 else 'L') for n in range(1, 13)]
+        self.assertEqual(TeamFormSnapshot.objects.get(team=self.team).last10_wins, 0)
+        forms[-1].delete()
+        forms[-2].delete()
+        snapshot = TeamFormSnapshot.objects.get(team=self.team)
+        self.assertEqual((snapshot.played, snapshot.last10_wins), (10, 1))
+
+    def test_engine_reads_one_snapshot(self):
+        for n, result in enumerate('WWDWL', start=1):
+            self.add_form(self.days[0], n, result)
+        engine = PredictionEngine(self.fixture.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(engine.calculate_form(self.team), 0)
+
+    def test_import_updates_snapshots(self):
+        key = 'Kenya,Premier League,Gor Mahia,AFC Leopards,2025-03-01'
+        header = ImportTests.fixture_header[:-5] + ',team,game_number,result,over_under,gg,venue'
+        import_file('forms', csv_upload(header, f'{key},Gor Mahia,1,W,Over,gg,H', f'{key},Gor Mahia,2,L,Over,gg,A'))
+        import_file('forms', csv_upload(header, f'{key},Gor Mahia,2,W,Over,gg,A'))
+        snapshot = TeamFormSnapshot.objects.get(team=self.team)
+        self.assertEqual((snapshot.last5_wins, snapshot.away_wins), (2, 1))
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        log_in(self.client)
+
+    def test_signals_keep_counters(self):
+        fixture = create_fixture()
+        self.assertEqual(counters(), {'countries': 1, 'teams': 2, 'fixtures': 1})
+        fixture.league.delete()
+        self.assertEqual(counters(), {'countries': 1, 'teams': 0, 'fixtures': 0})
+
+    def test_missing_counter_is_rebuilt(self):
+        create_fixture()
+        DashboardCounter.objects.all().delete()
+        self.assertEqual(counters()['fixtures'], 1)
+        self.assertEqual(DashboardCounter.objects.get(name='fixtures').value, 1)
+
+    def test_import_reconciles_bulk_writes(self):
+        create_fixture()
+        import_file('fixtures', csv_upload(
+            ImportTests.fixture_header,
+            'Kenya,Premier League,Tusker,Gor Mahia,2025-05-17,16:00',
+            'Kenya,Premier League,Gor Mahia,Tusker,2025-05-24,16:00',
+        ))
+        self.assertEqual(counters(), {'countries': 1, 'teams': 3, 'fixtures': 3})
+
+    def test_reconcile_repairs_drift(self):
+        create_fixture()
+        DashboardCounter.objects.filter(name='teams').update(value=42)
+        self.assertEqual(reconcile(['teams']), {'teams': 2})
+        self.assertEqual(counters()['teams'], 2)
+
+    @in_memory_cache
+    def test_warm_dashboard_costs_one_query(self):
+        create_fixture()
+        self.client.get(reverse('dashboard'))
+        with self.assertNumQueries(1):  # counters; session, profile and showcase come from memory
+            response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'Otieno')
+        self.assertContains(response, 'Total Teams: 2')
+        self.assertContains(response, 'AFC Leopards')
+
+    def test_warm_dashboard_on_the_database_cache(self):
+        # The shipped default (no PROPHET_REDIS_URL): every cache read is a
+        # query too, one each for the session, the profile version and the
+        # showcase, plus the counters. Still no Gambler, Team or session rows.
+        self.assertEqual(settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.db.DatabaseCache')
+        create_fixture()
+        self.client.get(reverse('dashboard'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'))
+        tables = [query['sql'].split(' FROM ')[1].split()[0].strip('"') for query in queries]
+        self.assertEqual(sorted(tables), ['prophet_cache'] * 3 + ['prophet_dashboardcounter'])
+        self.assertContains(response, 'Total Teams: 2')
+
+    def test_profile_and_team_changes_refresh_cached_context(self):
+        fixture = create_fixture()
+        self.client.get(reverse('dashboard'))
+        gambler = Gambler.objects.get(username='punter@gmail.com')
+        gambler.last_name = 'Wanjiru'
+        gambler.save()
+        fixture.home_team.name = 'Kogalo'
+        fixture.home_team.save()
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'Wanjiru')
+        self.assertContains(response, 'Kogalo')
+
+    def test_showcase_change_reaches_other_workers(self):
+        fixture = create_fixture()
+        self.client.get(reverse('dashboard'))
+        with in_other_worker():
+            fixture.home_team.name = 'Kogalo'
+            fixture.home_team.save()
+        self.assertContains(self.client.get(reverse('dashboard')), 'Kogalo')
+
+    def test_deletes_adjust_counters_in_bulk(self):
+        fixture = create_fixture()
+        for day in range(1, 4):
+            Fixture.objects.create(
+                league=fixture.league, home_team=fixture.away_team, away_team=fixture.home_team,
+                date=date(2025, 6, day), time=time(15, 0),
+            )
+        self.client.get(reverse('dashboard'))
+        self.assertIsNotNone(cache.get(SHOWCASE_CACHE_KEY))
+        # Fixtures go in one DELETE, not one per row with a counter UPDATE each.
+        with CaptureQueriesContext(connection) as queries:
+            Country.objects.filter(pk=fixture.league.country_id).delete()
+        self.assertEqual(sum(sql['sql'].startswith('DELETE FROM "prophet_fixture"') for sql in queries), 1)
+        self.assertEqual(counters(), {'countries': 0, 'teams': 0, 'fixtures': 0})
+        self.assertIsNone(cache.get(SHOWCASE_CACHE_KEY))
+
+
+class ProfileTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        Gambler.objects.create(
+            email_address='punter@gmail.com', username='punter@gmail.com',
+            first_name='Amani', last_name='Otieno', phone_number='0798073204',
+        )
+        user = System_User(username='punter@gmail.com')
+        user.set_password('s3cret-pass')
+        user.save()
+
+    @in_memory_cache
+    def test_login_stores_profile_snapshot(self):
+        response = self.client.post(reverse('login'), {'username': 'punter@gmail.com', 'password': 's3cret-pass'})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        profile = Profile(*self.client.session[SESSION_KEY])
+        self.assertEqual((profile.first_name, profile.last_name), ('Amani', 'Otieno'))
+        self.client.get(reverse('dashboard'))
+        with self.assertNumQueries(1):  # the dashboard counters; no identity queries
+            self.assertContains(self.client.get(reverse('dashboard')), 'Otieno')
+
+    def test_profile_edit_reaches_other_workers(self):
+        self.client.post(reverse('login'), {'username': 'punter@gmail.com', 'password': 's3cret-pass'})
+        gambler = Gambler.objects.get()
+        with in_other_worker():  # this worker keeps the session and its own memory
+            gambler.last_name = 'Wanjiru'
+            gambler.save()
+        self.assertContains(self.client.get(reverse('dashboard')), 'Wanjiru')
+        self.assertEqual(Profile(*self.client.session[SESSION_KEY]).last_name, 'Wanjiru')
+
+    def test_deleted_account_logs_out(self):
+        self.client.post(reverse('login'), {'username': 'punter@gmail.com', 'password': 's3cret-pass'})
+        System_User.objects.filter(username='punter@gmail.com').delete()
+        self.assertRedirects(self.client.get(reverse('dashboard')), reverse('login'), fetch_redirect_response=False)
+        self.assertNotIn(SESSION_KEY, self.client.session)
+
+    @in_memory_cache
+    def test_session_with_username_only_is_upgraded(self):
+        request = RequestFactory().get('/')
+        request.session = {'username': 'punter@gmail.com'}
+        profile = request_profile(request)
+        self.assertEqual(profile.email_address, 'punter@gmail.com')
+        self.assertEqual(request.session[SESSION_KEY], list(profile))
+        with self.assertNumQueries(0):
+            self.assertEqual(request_profile(request), profile)
+
+
+class ResetTokenTests(TestCase):
+    def setUp(self):
+        self.user = System_User(username='punter@gmail.com')
+        self.user.set_password('old-password')
+        self.user.save()
+
+    def expire(self, token):
+        PasswordResetToken.objects.filter(token_hash=hash_token(token)).update(expires_at=timezone.now())
+
+    def test_only_the_hash_is_stored(self):
+        token = PasswordResetToken.objects.issue(self.user)
+        stored = PasswordResetToken.objects.get()
+        self.assertNotEqual(stored.token_hash, token)
+        self.assertEqual(stored.token_hash, hash_token(token))
+        self.assertEqual(PasswordResetToken.objects.usable(token), stored)
+        self.assertIsNone(PasswordResetToken.objects.usable(stored.token_hash))
+
+    def test_reissue_replaces_and_expiry_rejects(self):
+        first = PasswordResetToken.objects.issue(self.user)
+        second = PasswordResetToken.objects.issue(self.user)
+        self.assertIsNone(PasswordResetToken.objects.usable(first))
+        self.expire(second)
+        self.assertIsNone(PasswordResetToken.objects.usable(second))
+        response = self.client.get(reverse('reset-password', args=[second]))
+        self.assertContains(response, 'Token is invalid or expired.')
+
+    def test_emailed_link_resets_password_once(self):
+        self.client.post(reverse('reset-password'), {'username': 'punter@gmail.com'})
+        self.assertEqual(mail.outbox, [])  # queued, not sent in the request
+        call_command('send_emails', '--once', stdout=StringIO())
+        token = mail.outbox[0].body.split('/reset-password/')[1].split('/')[0]
+        url = reverse('reset-password', args=[token])
+        self.assertNotContains(self.client.get(url), 'Token is invalid or expired.')
+        self.client.post(url, {'password': 'new-password-1', 'confirm_password': 'new-password-1'})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-password-1'))
+        self.assertFalse(PasswordResetToken.objects.exists())
+
+    def test_outbox_never_holds_the_token(self):
+        self.client.post(reverse('reset-password'), {'username': 'punter@gmail.com'})
+        self.assertFalse(PasswordResetToken.objects.exists())  # issued by the worker, not the request
+        call_command('send_emails', '--once', stdout=StringIO())
+        token = mail.outbox[0].body.split('/reset-password/')[1].split('/')[0]
+        self.assertIsNotNone(PasswordResetToken.objects.usable(token))
+        message = OutboundEmail.objects.get()
+        self.assertEqual(message.status, 'sent')
+        self.assertNotIn(token, message.body)
+        self.assertFalse(OutboundEmail.objects.filter(body__contains=token).exists())
+
+    def test_purge_deletes_expired_in_batches(self):
+        now = timezone.now()
+        others = [System_User.objects.create(username=f'user{n}@gmail.com', password_hash='x' * 10) for n in range(5)]
+        PasswordResetToken.objects.bulk_create([
+            PasswordResetToken(username=user, token_hash=hash_token(user.username), expires_at=now - timedelta(minutes=1))
+            for user in others
+        ])
+        live = PasswordResetToken.objects.issue(self.user)
+        # Three batches of a select and a delete, then an empty select.
+        with self.assertNumQueries(7):
+            self.assertEqual(PasswordResetToken.objects.purge_expired(batch_size=2, now=now), 5)
+        self.assertEqual(PasswordResetToken.objects.usable(live).username, self.user)
+
+    def test_purge_command(self):
+        PasswordResetToken.objects.issue(self.user)
+        self.expire(PasswordResetToken.objects.issue(System_User.objects.create(username='b@gmail.com', password_hash='x' * 10)))
+        out = StringIO()
+        call_command('purge_expired_tokens', '--batch-size', '1', stdout=out)
+        self.assertIn('Deleted 1 expired reset tokens.', out.getvalue())
+        self.assertEqual(PasswordResetToken.objects.count(), 1)
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """A local SMTP server for tests: accepts mail, refuses recipients
+    containing "bounce" and records every message and connection."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPStandInHandler)
+        self.connections = 0
+        self.messages = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 stand-in')
+        recipients = []
+        for line in self.rfile:
+            command = line.decode().strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 stand-in')
+            elif command.startswith('RCPT') and 'BOUNCE' in command:
+                self.reply('550 no such user')
+            elif command.startswith('RCPT'):
+                recipients.append(line.decode().strip()[8:].strip('<>'))
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 go ahead')
+                data = b''.join(iter(self.rfile.readline, b'.\r\n'))
+                self.server.messages.append((recipients, data.decode()))
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:  # MAIL, RSET, NOOP
+                if command.startswith('RSET'):
+                    recipients = []
+                self.reply('250 OK')
+
+
+class OutboxTests(TestCase):
+    def smtp(self, server):
+        return override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=server.server_address[1], EMAIL_TIMEOUT=5,
+        )
+
+    def test_batch_shares_one_smtp_connection(self):
+        enqueue('Hello', 'Body', ['a@gmail.com', 'bounce@gmail.com', 'c@gmail.com'], from_email='tips@prophet.test')
+        with SMTPStandIn() as server, self.smtp(server):
+            self.assertEqual(deliver(claim(10)), 2)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual([recipients for recipients, data in server.messages], [['a@gmail.com'], ['c@gmail.com']])
+        bounced = OutboundEmail.objects.get(to='bounce@gmail.com')
+        self.assertEqual((bounced.status, bounced.attempts, bounced.lease), ('pending', 1, ''))
+        self.assertIn('SMTPRecipientsRefused', bounced.last_error)
+        self.assertGreater(bounced.next_attempt_at, timezone.now())
+        self.assertEqual(OutboundEmail.objects.filter(status='sent').count(), 2)
+
+    @override_settings(PROPHET_EMAIL_MAX_ATTEMPTS=3, PROPHET_EMAIL_RETRY_SECONDS=10)
+    def test_unreachable_server_backs_off_then_gives_up(self):
+        enqueue('Hello', 'Body', ['a@gmail.com'])
+        with SMTPStandIn() as server:
+            port = server.server_address[1]
+        delays = []
+        with self.smtp(server), override_settings(EMAIL_PORT=port):
+            for attempt in range(3):
+                message = OutboundEmail.objects.get()
+                now = max(message.next_attempt_at, timezone.now())
+                messages = claim(10, now=now)
+                failed_at = timezone.now()
+                self.assertEqual(deliver(messages), 0)
+                message.refresh_from_db()
+                delays.append(round((message.next_attempt_at - failed_at).total_seconds()))
+        self.assertEqual(message.status, 'failed')
+        self.assertEqual(delays[:2], [10, 20])
+        self.assertEqual(claim(10, now=timezone.now() + timedelta(days=1)), [])
+
+    def test_claim_leases_each_message_once(self):
+        enqueue('Hello', 'Body', [f'{n}@gmail.com' for n in range(5)])
+        first, second = claim(3), claim(3)
+        self.assertEqual(len(first) + len(second), 5)
+        self.assertFalse({m.pk for m in first} & {m.pk for m in second})
+        self.assertEqual(claim(3), [])
+        # A worker that died keeps its lease only until it runs out.
+        self.assertEqual(len(claim(10, now=timezone.now() + timedelta(hours=1))), 5)
+
+    def test_send_emails_command_reports_rate(self):
+        enqueue('Hello', 'Body', ['a@gmail.com', 'b@gmail.com'])
+        out = StringIO()
+        call_command('send_emails', '--once', '--batch-size', '1', stdout=out)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertRegex(out.getvalue(), r'Sent 2 messages in [\d.]+s \([\d.]+ messages/sec\)')
+
+    def test_digest_for_every_gambler(self):
+        fixture = create_fixture()
+        add_history(fixture)
+        for n in range(2):
+            Gambler.objects.create(
+                email_address=f'punter{n}@gmail.com', username=f'punter{n}@gmail.com',
+                first_name='Amani', last_name='Otieno', phone_number='0798073204',
+            )
+        self.assertEqual(enqueue_digests(fixture.date), 2)
+        self.assertEqual(enqueue_digests(fixture.date + timedelta(days=1)), 0)
+        message = OutboundEmail.objects.get(to='punter0@gmail.com')
+        self.assertEqual(message.kind, 'digest')
+        self.assertIn(f'{fixture.home_team.name} vs {fixture.away_team.name}', message.body)
+        self.assertIn('1X2: ', message.body)
+
+    def test_digest_lists_fixtures_in_kickoff_order(self):
+        evening = create_fixture()
+        evening.time = time(18, 0)
+        evening.save()
+        Fixture.objects.create(
+            league=evening.league, home_team=evening.away_team, away_team=evening.home_team,
+            date=evening.date, time=time(12, 30),
+        )
+        subject, body = matchday_digest(evening.date)
+        self.assertLess(body.index('AFC Leopards vs Gor Mahia'), body.index('Gor Mahia vs AFC Leopards'))
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@prophet.test', 'x'))
+        self.fixture = create_fixture()
+        add_history(self.fixture)
+
+    def add_rows(self, n):
+        league = self.fixture.league
+        one_x_two = PredictionType.objects.get(name='1X2')
+        start = Fixture.objects.count()
+        for i in range(start, start + n):
+            league = League.objects.create(country=league.country, name=f'League {i}')
+            home = Team.objects.create(league=league, name=f'Home {i}')
+            away = Team.objects.create(league=league, name=f'Away {i}')
+            fixture = Fixture.objects.create(
+                league=league, home_team=home, away_team=away, date=date(2025, 6, 1) + timedelta(days=i), time=time(15, 0),
+            )
+            TeamStat.objects.create(fixture=fixture, team=home)
+            TeamForm.objects.create(team=home, fixture=fixture, game_number=1, result='W', over_under='Over', gg='gg')
+            HeadToHead.objects.record(home, away, date(2024, 3, 1), 1, 0)
+            Prediction.objects.create(
+                fixture=fixture, prediction_type=one_x_two, value='1', prediction_site='site', site_accuracy=70,
+            )
+            PredictedResult.objects.create(
+                fixture=fixture, home_team=home, away_team=away, prediction_type=one_x_two, predicted_result='1',
+            )
+            player = Player.objects.create(player_code=f'A{i:03d}', team=away, name=f'Player {i}', position='ST', effect='best')
+            SuspendedPlayer.objects.create(player=player)
+            user = System_User.objects.create(username=f'user{i}@gmail.com', password_hash='x' * 10)
+            PasswordResetToken.objects.issue(user)
+            enqueue('Hello', 'Body', [user.username])
+
+    def changelist_queries(self):
+        counts = {}
+        for model in admin.site._registry:
+            if model._meta.app_label != 'prophet':
+                continue
+            url = reverse(f'admin:prophet_{model._meta.model_name}_changelist')
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            counts[model._meta.model_name] = len(queries)
+        return counts
+
+    def test_changelists_run_a_bounded_number_of_queries(self):
+        self.add_rows(1)
+        few = self.changelist_queries()
+        self.add_rows(5)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_large_unfiltered_changelist_uses_the_estimate(self):
+        self.add_rows(1)  # a second league, or the admin drops the league filter
+        url = reverse('admin:prophet_fixture_changelist')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute("UPDATE sqlite_stat1 SET stat = '5000000 1' WHERE tbl = 'prophet_fixture'")
+        with override_settings(PROPHET_ADMIN_EXACT_COUNT_LIMIT=1000):
+            self.assertEqual(self.client.get(url).context['cl'].result_count, 5000000)
+            filtered = self.client.get(url, {'league__id__exact': self.fixture.league_id})
+            self.assertEqual(filtered.context['cl'].result_count, 2)
+        with override_settings(PROPHET_ADMIN_EXACT_COUNT_LIMIT=10 ** 7):
+            self.assertEqual(self.client.get(url).context['cl'].result_count, 3)
+
+    def test_fixture_autocomplete(self):
+        self.add_rows(5)
+        url = reverse('admin:autocomplete')
+        params = {'app_label': 'prophet', 'model_name': 'prediction', 'field_name': 'fixture', 'term': 'Home'}
+        with CaptureQueriesContext(connection) as queries:
+            results = self.client.get(url, params).json()['results']
+        self.assertEqual(len(results), 5)
+        self.assertIn('Home 2 vs Away 2', {result['text'].split(' - ')[0] for result in results})
+        self.assertLess(len(queries), 6)
+
+    def test_mark_predictions_stale(self):
+        self.add_rows(2)
+        PredictedResult.objects.update(evidence_fingerprint='0' * 16)
+        response = self.client.post(reverse('admin:prophet_predictedresult_changelist'), {
+            'action': 'mark_stale', 'select_across': '1', 'index': '0',
+            '_selected_action': PredictedResult.objects.values_list('pk', flat=True)[:1],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(PredictedResult.objects.exclude(evidence_fingerprint='').exists())
+
+    def test_rebuild_form_snapshots(self):
+        TeamFormSnapshot.objects.all().delete()
+        self.client.post(reverse('admin:prophet_team_changelist'), {
+            'action': 'rebuild_form_snapshots', '_selected_action': [self.fixture.home_team_id],
+        })
+        self.assertTrue(TeamFormSnapshot.objects.filter(team=self.fixture.home_team).exists())
+        self.assertFalse(TeamFormSnapshot.objects.filter(team=self.fixture.away_team).exists())
+
+
+class AsyncViewTests(TransactionTestCase):
+    # The async views read from worker threads, which only see committed rows.
+
+    def setUp(self):
+        cache.clear()
+        self.fixture = create_fixture()
+        self.factory = AsyncRequestFactory()
+
+    async def league_request(self):
+        request = self.factory.get('/league/fixtures/', {'from': '2025-01-01'})
+        return await AsyncLeagueFixturesPredictionView.as_view()(request, pk=self.fixture.league_id)
+
+    async def test_league_page(self):
+        response = await self.league_request()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Gor Mahia')
+
+    async def test_stream_falls_back_to_sync_view(self):
+        request = self.factory.get('/league/fixtures/', {'from': '2025-01-01', 'stream': '1'})
+        response = await AsyncLeagueFixturesPredictionView.as_view()(request, pk=self.fixture.league_id)
+        self.assertTrue(response.streaming)
+        body = await sync_to_async(lambda: b''.join(response.streaming_content).decode())()
+        self.assertIn('Gor Mahia', body)
+        self.assertIn('</table>', body)
+
+    async def test_concurrent_league_requests_overlap(self):
+        spans = []
+
+        def slow_load(fixtures):
+            started = monotonic()
+            sleep(0.3)
+            spans.append((started, monotonic()))
+            return []
+
+        with mock.patch('prophet.views.load_predictions', slow_load), \
+                mock.patch('prophet.views.inference_executor', BoundedExecutor(4, 4)):
+            responses = await asyncio.gather(*(self.league_request() for _ in range(3)))
+
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+        self.assertEqual(len(spans), 3)
+        self.assertLess(max(start for start, _ in spans), min(end for _, end in spans))
+
+    async def test_full_queue_sheds_load(self):
+        def slow_load(fixtures):
+            sleep(0.2)
+            return []
+
+        with mock.patch('prophet.views.load_predictions', slow_load), \
+                mock.patch('prophet.views.inference_executor', BoundedExecutor(1, 1)):
+            responses = await asyncio.gather(*(self.league_request() for _ in range(3)))
+
+        statuses = sorted(response.status_code for response in responses)
+        self.assertEqual(statuses, [200, 503, 503])
+
+    async def test_dashboard(self):
+        await Gambler.objects.acreate(
+            email_address='punter@gmail.com', username='punter@gmail.com',
+            first_name='Amani', last_name='Otieno', phone_number='0798073204',
+        )
+        await System_User.objects.acreate(username='punter@gmail.com', password_hash='x' * 10)
+        request = self.factory.get('/dashboard/')
+        request.session = {'username': 'punter@gmail.com'}
+        response = await AsyncDashboardView.as_view()(request)
+        self.assertContains(response, 'Otieno')
+
+    async def test_dashboard_requires_login(self):
+        request = self.factory.get('/dashboard/')
+        request.session = {}
+        response = await AsyncDashboardView.as_view()(request)
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,179 @@
+import numpy as np
+from django.db import transaction
+
+from .models import Fixture, ParameterSet, TrainingCount, TrainingRecord
+from .utils import (
+    EVIDENCE_VARIABLES, MARKETS, build_evidence_batch, build_model, market_outcomes, model_fingerprint,
+)
+
+VARIABLES = EVIDENCE_VARIABLES + MARKETS
+MISSING = '-'
+
+
+def factor_layout():
+    """{variable: [variable, *parents]} and {variable: cardinality} from the network structure."""
+    scopes, cards = {}, {}
+    for cpd in build_model().get_cpds():
+        scopes[cpd.variable] = list(cpd.variables)
+        for variable, card in zip(cpd.variables, cpd.cardinality):
+            cards[variable] = int(card)
+    return scopes, cards
+
+
+def encode_states(evidence_row, outcomes):
+    states = [str(int(value)) for value in evidence_row]
+    states += [MISSING if outcomes[variable] is None else str(outcomes[variable]) for variable in MARKETS]
+    return ''.join(states)
+
+
+def decode_states(rows):
+    """(N x len(VARIABLES)) int matrix from state strings, -1 where missing."""
+    return np.array(
+        [[-1 if state == MISSING else int(state) for state in row] for row in rows], dtype=np.int64,
+    ).reshape(-1, len(VARIABLES))
+
+
+def load_counts(scopes, cards):
+    stored = dict(TrainingCount.objects.values_list('variable', 'counts'))
+    counts = {}
+    for variable, scope in scopes.items():
+        shape = tuple(cards[name] for name in scope)
+        values = np.asarray(stored.get(variable) or np.zeros(shape), dtype=np.int64)
+        counts[variable] = values if values.shape == shape else np.zeros(shape, dtype=np.int64)
+    return counts
+
+
+def save_counts(counts):
+    TrainingCount.objects.bulk_create(
+        [TrainingCount(variable=variable, counts=values.tolist()) for variable, values in counts.items()],
+        update_conflicts=True,
+        unique_fields=['variable'],
+        update_fields=['counts', 'updated_at'],
+    )
+
+
+def accumulate(counts, scopes, states, sign=1):
+    """Add (or with ``sign=-1`` remove) rows of ``states`` to every count table."""
+    for variable, scope in scopes.items():
+        columns = states[:, [VARIABLES.index(name) for name in scope]]
+        observed = columns[(columns >= 0).all(axis=1)]
+        np.add.at(counts[variable], tuple(observed.T), sign)
+
+
+def update_counts(fixtures=None, chunk_size=2000):
+    """Fold finished fixtures that are not counted yet into TrainingCount.
+
+    Only the new fixtures are read, so the cost follows the number of new
+    results, not the size of the history. Evidence is gathered as of kickoff
+    (form and head-to-head before the fixture date). Returns the number of
+    fixtures added.
+    """
+    scopes, cards = factor_layout()
+    finished = Fixture.objects.filter(home_goals__isnull=False, away_goals__isnull=False)
+    if fixtures is not None:
+        finished = finished.filter(pk__in=fixtures.values('pk'))
+    pending = list(finished.filter(training_record__isnull=True).order_by('pk').values_list('pk', flat=True))
+
+    added = 0
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        batch = build_evidence_batch(Fixture.objects.filter(pk__in=chunk))
+        records = [
+            TrainingRecord(
+                fixture_id=fixture.pk,
+                states=encode_states(batch.matrix[row], market_outcomes(fixture.home_goals, fixture.away_goals)),
+            )
+            for row, fixture in enumerate(batch.fixtures)
+        ]
+        with transaction.atomic():
+            counts = load_counts(scopes, cards)
+            accumulate(counts, scopes, decode_states(record.states for record in records))
+            save_counts(counts)
+            TrainingRecord.objects.bulk_create(records)
+        added += len(records)
+    return added
+
+
+def retract(fixture_ids):
+    """Take fixtures back out of the counts, e.g. after a corrected result;
+    the next update_counts adds them again with their current data."""
+    scopes, cards = factor_layout()
+    with transaction.atomic():
+        records = TrainingRecord.objects.filter(fixture_id__in=fixture_ids)
+        states = decode_states(records.values_list('states', flat=True))
+        if len(states):
+            counts = load_counts(scopes, cards)
+            accumulate(counts, scopes, states, sign=-1)
+            save_counts(counts)
+        return records.delete()[0]
+
+
+def reset_counts():
+    with transaction.atomic():
+        TrainingRecord.objects.all().delete()
+        TrainingCount.objects.all().delete()
+
+
+def fit(alpha=1.0, activate=False):
+    """Maximum-likelihood CPDs with a symmetric Dirichlet(alpha) prior, from the stored counts.
+
+    Each column of a CPD is (counts + alpha) / (column total + card * alpha),
+    so parent configurations never seen in training fall back to uniform.
+    Returns the ParameterSet, reusing an existing one with the same values.
+    """
+    scopes, cards = factor_layout()
+    cpds = cpd_values(load_counts(scopes, cards), alpha)
+    model = build_model(cpds)
+    model.check_model()
+    parameters, _ = ParameterSet.objects.get_or_create(
+        version=model_fingerprint(model),
+        defaults={'alpha': alpha, 'fixtures': TrainingRecord.objects.count(), 'cpds': cpds},
+    )
+    if activate:
+        activate_parameters(parameters)
+    return parameters
+
+
+def cpd_values(counts, alpha):
+    if alpha <= 0:
+        raise ValueError('alpha must be positive.')
+    cpds = {}
+    for variable, values in counts.items():
+        smoothed = values.reshape(values.shape[0], -1) + alpha
+        cpds[variable] = (smoothed / smoothed.sum(axis=0, keepdims=True)).tolist()
+    return cpds
+
+
+def counts_before(day, injuries=True):
+    """Count tables from the recorded fixtures played before ``day``, for walk-forward fits.
+    Without ``injuries`` both injury variables are counted as "no critical injury"."""
+    scopes, cards = factor_layout()
+    counts = {
+        variable: np.zeros(tuple(cards[name] for name in scope), dtype=np.int64)
+        for variable, scope in scopes.items()
+    }
+    states = TrainingRecord.objects.filter(fixture__date__lt=day).values_list('states', flat=True)
+    states = decode_states(states.iterator())
+    if not injuries:
+        states[:, [VARIABLES.index('HomeInjuries'), VARIABLES.index('AwayInjuries')]] = 0
+    accumulate(counts, scopes, states)
+    return counts
+
+
+def activate_parameters(parameters):
+    with transaction.atomic():
+        ParameterSet.objects.filter(is_active=True).exclude(pk=parameters.pk).update(is_active=False)
+        ParameterSet.objects.filter(pk=parameters.pk).update(is_active=True)
+    parameters.is_active = True
+
+
+def load_model(version=None):
+    """The network with a stored parameter set: ``version``, or the active one.
+    Falls back to the placeholder CPDs when nothing has been activated."""
+    parameters = ParameterSet.objects.filter(version=version) if version else ParameterSet.objects.filter(is_active=True)
+    parameters = parameters.first()
+    if parameters is None:
+        if version:
+            raise ParameterSet.DoesNotExist(f'No parameter set {version}.')
+        return build_model()
+    return build_model(parameters.cpds)
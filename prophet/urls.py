@@ -1,20 +1,37 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
-    SignUpView, LoginView, DashboardView, LogoutView, ResetPasswordView, ResetPasswordConfirmView , LeagueFixturesPredictionView
+    SignUpView, LoginView, DashboardView, LogoutView, ResetPasswordView, ResetPasswordConfirmView , LeagueFixturesPredictionView,
+    FixturePredictionAPIView, LeaguePredictionAPIView, BulkPredictionAPIView,
+    AsyncDashboardView, AsyncLeagueFixturesPredictionView, ImportView,
 )
+from .instrumentation import metrics_view
+
+async_views = getattr(settings, 'PROPHET_ASYNC_VIEWS', False)
 
 urlpatterns = [
     path('register/',SignUpView.as_view(), name='signup'),
     path('login/',LoginView.as_view(), name='login'),
     
-    path('dashboard/',DashboardView.as_view(), name='dashboard'),
+    path('dashboard/', (AsyncDashboardView if async_views else DashboardView).as_view(), name='dashboard'),
     
     path('logout/', LogoutView.as_view(), name='logout'),
     
     path('reset-password/', ResetPasswordView.as_view(), name='reset-password'),
     path('reset-password/<str:token>/', ResetPasswordConfirmView.as_view(), name='reset-password'),
     
-    path('league/<int:pk>/fixtures/', LeagueFixturesPredictionView.as_view(), name='league-fixtures'),
+    path('import/', ImportView.as_view(), name='import'),
+
+    path(
+        'league/<int:pk>/fixtures/',
+        (AsyncLeagueFixturesPredictionView if async_views else LeagueFixturesPredictionView).as_view(),
+        name='league-fixtures',
+    ),
+
+    path('api/fixtures/<int:pk>/predictions/', FixturePredictionAPIView.as_view(), name='api-fixture-predictions'),
+    path('api/leagues/<int:pk>/predictions/', LeaguePredictionAPIView.as_view(), name='api-league-predictions'),
+    path('api/predictions/', BulkPredictionAPIView.as_view(), name='api-bulk-predictions'),
 
+    path('metrics', metrics_view, name='metrics'),
     
 ]
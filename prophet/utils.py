@@ -1,98 +1,472 @@
-from pgmpy.models import BayesianNetwork
-from pgmpy.inference import VariableElimination
-from pgmpy.factors.discrete import TabularCPD
+import hashlib
+import multiprocessing
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
-from .models import Fixture, Player, TeamForm, HeadToHead, Prediction
+import numpy as np
 
-class PredictionEngine:
-    def __init__(self, fixture_id):
-        self.fixture = Fixture.objects.get(pk=fixture_id)
-        self.home_team = self.fixture.home_team
-        self.away_team = self.fixture.away_team
-        self.model = self.build_model()
-
-    def build_model(self):
-        model = BayesianNetwork([
-            ('HomeForm', 'MatchResult'),
-            ('AwayForm', 'MatchResult'),
-            ('HomeInjuries', 'MatchResult'),
-            ('AwayInjuries', 'MatchResult'),
-            ('H2HResult', 'MatchResult'),
-            ('ExternalPrediction', 'MatchResult'),
-            # Over/Under
-            ('HomeForm', 'OverUnderResult'),
-            ('AwayForm', 'OverUnderResult'),
-            ('H2HResult', 'OverUnderResult'),
-            # GG
-            ('HomeForm', 'GGResult'),
-            ('AwayForm', 'GGResult'),
-            ('H2HResult', 'GGResult'),
-            # Handicap
-            ('HomeForm', 'HandicapResult'),
-            ('AwayForm', 'HandicapResult'),
-            # ✅ CorrectScore dependencies
-            ('MatchResult', 'CorrectScore'),
-            ('OverUnderResult', 'CorrectScore'),
-            ('GGResult', 'CorrectScore'),
-        ])
-
-        # CPDs
-        cpd_homeform = TabularCPD(variable='HomeForm', variable_card=2, values=[[0.7], [0.3]])
-        cpd_awayform = TabularCPD(variable='AwayForm', variable_card=2, values=[[0.4], [0.6]])
-        cpd_homeinj = TabularCPD(variable='HomeInjuries', variable_card=2, values=[[0.9], [0.1]])
-        cpd_awayinj = TabularCPD(variable='AwayInjuries', variable_card=2, values=[[0.8], [0.2]])
-        cpd_h2h = TabularCPD(variable='H2HResult', variable_card=2, values=[[0.6], [0.4]])
-        cpd_extpred = TabularCPD(variable='ExternalPrediction', variable_card=3, values=[[0.5], [0.3], [0.2]])
-
-        cpd_matchresult = TabularCPD(
-            variable='MatchResult', variable_card=3,
-            values=[[0.5], [0.3], [0.2]],
-            evidence=['HomeForm', 'AwayForm', 'HomeInjuries', 'AwayInjuries', 'H2HResult', 'ExternalPrediction'],
-            evidence_card=[2, 2, 2, 2, 2, 3]
-        )
+from django.conf import settings
+from django.db import connections
+from django.db.models import Exists, F, Func, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest, Least
 
-        cpd_ou = TabularCPD(
-            variable='OverUnderResult', variable_card=2,
-            values=[[0.6], [0.4]],
-            evidence=['HomeForm', 'AwayForm', 'H2HResult'],
-            evidence_card=[2, 2, 2]
-        )
+from .instrumentation import timed
+from .models import Fixture, Player, TeamFormSnapshot, HeadToHead, Prediction
+from .rolling import latest_snapshot
 
-        cpd_gg = TabularCPD(
-            variable='GGResult', variable_card=2,
-            values=[[0.55], [0.45]],
-            evidence=['HomeForm', 'AwayForm', 'H2HResult'],
-            evidence_card=[2, 2, 2]
-        )
 
-        cpd_handicap = TabularCPD(
-            variable='HandicapResult', variable_card=3,
-            values=[[0.4], [0.3], [0.3]],
-            evidence=['HomeForm', 'AwayForm'],
-            evidence_card=[2, 2]
-        )
+def _repeat(column, evidence_card):
+    # TabularCPD wants one column per parent configuration; the placeholder
+    # CPDs use the same distribution for all of them.
+    return np.tile(column, (1, int(np.prod(evidence_card))))
 
-        # ✅ CorrectScore CPD (example with 4 possible scores)
-        cpd_correctscore = TabularCPD(
-            variable='CorrectScore', variable_card=4,
-            values=[
-                [0.4],  # '1-0'
-                [0.3],  # '2-1'
-                [0.2],  # '1-1'
-                [0.1],  # '0-2'
-            ],
-            evidence=['MatchResult', 'OverUnderResult', 'GGResult'],
-            evidence_card=[3, 2, 2]
-        )
 
-        model.add_cpds(
-            cpd_homeform, cpd_awayform, cpd_homeinj, cpd_awayinj, cpd_h2h, cpd_extpred,
-            cpd_matchresult, cpd_ou, cpd_gg, cpd_handicap,
-            cpd_correctscore
-        )
+def build_model(cpd_values=None):
+    """The network; ``cpd_values`` ({variable: 2-D values}) replaces the placeholder CPDs."""
+    # pgmpy pulls in torch, pandas and networkx; importing it here keeps it
+    # out of start-up for every process that never builds the network.
+    from pgmpy.factors.discrete import TabularCPD
+    from pgmpy.models import BayesianNetwork
+
+    model = BayesianNetwork([
+        ('HomeForm', 'MatchResult'),
+        ('AwayForm', 'MatchResult'),
+        ('HomeInjuries', 'MatchResult'),
+        ('AwayInjuries', 'MatchResult'),
+        ('H2HResult', 'MatchResult'),
+        ('ExternalPrediction', 'MatchResult'),
+        # Over/Under
+        ('HomeForm', 'OverUnderResult'),
+        ('AwayForm', 'OverUnderResult'),
+        ('H2HResult', 'OverUnderResult'),
+        # GG
+        ('HomeForm', 'GGResult'),
+        ('AwayForm', 'GGResult'),
+        ('H2HResult', 'GGResult'),
+        # Handicap
+        ('HomeForm', 'HandicapResult'),
+        ('AwayForm', 'HandicapResult'),
+        # ✅ CorrectScore dependencies
+        ('MatchResult', 'CorrectScore'),
+        ('OverUnderResult', 'CorrectScore'),
+        ('GGResult', 'CorrectScore'),
+    ])
+
+    # CPDs
+    cpd_homeform = TabularCPD(variable='HomeForm', variable_card=2, values=[[0.7], [0.3]])
+    cpd_awayform = TabularCPD(variable='AwayForm', variable_card=2, values=[[0.4], [0.6]])
+    cpd_homeinj = TabularCPD(variable='HomeInjuries', variable_card=2, values=[[0.9], [0.1]])
+    cpd_awayinj = TabularCPD(variable='AwayInjuries', variable_card=2, values=[[0.8], [0.2]])
+    cpd_h2h = TabularCPD(variable='H2HResult', variable_card=2, values=[[0.6], [0.4]])
+    cpd_extpred = TabularCPD(variable='ExternalPrediction', variable_card=3, values=[[0.5], [0.3], [0.2]])
+
+    cpd_matchresult = TabularCPD(
+        variable='MatchResult', variable_card=3,
+        values=_repeat([[0.5], [0.3], [0.2]], [2, 2, 2, 2, 2, 3]),
+        evidence=['HomeForm', 'AwayForm', 'HomeInjuries', 'AwayInjuries', 'H2HResult', 'ExternalPrediction'],
+        evidence_card=[2, 2, 2, 2, 2, 3]
+    )
+
+    cpd_ou = TabularCPD(
+        variable='OverUnderResult', variable_card=2,
+        values=_repeat([[0.6], [0.4]], [2, 2, 2]),
+        evidence=['HomeForm', 'AwayForm', 'H2HResult'],
+        evidence_card=[2, 2, 2]
+    )
+
+    cpd_gg = TabularCPD(
+        variable='GGResult', variable_card=2,
+        values=_repeat([[0.55], [0.45]], [2, 2, 2]),
+        evidence=['HomeForm', 'AwayForm', 'H2HResult'],
+        evidence_card=[2, 2, 2]
+    )
+
+    cpd_handicap = TabularCPD(
+        variable='HandicapResult', variable_card=3,
+        values=_repeat([[0.4], [0.3], [0.3]], [2, 2]),
+        evidence=['HomeForm', 'AwayForm'],
+        evidence_card=[2, 2]
+    )
+
+    # ✅ CorrectScore CPD (example with 4 possible scores)
+    cpd_correctscore = TabularCPD(
+        variable='CorrectScore', variable_card=4,
+        values=_repeat([
+            [0.4],  # '1-0'
+            [0.3],  # '2-1'
+            [0.2],  # '1-1'
+            [0.1],  # '0-2'
+        ], [3, 2, 2]),
+        evidence=['MatchResult', 'OverUnderResult', 'GGResult'],
+        evidence_card=[3, 2, 2]
+    )
+
+    model.add_cpds(
+        cpd_homeform, cpd_awayform, cpd_homeinj, cpd_awayinj, cpd_h2h, cpd_extpred,
+        cpd_matchresult, cpd_ou, cpd_gg, cpd_handicap,
+        cpd_correctscore
+    )
+    for variable, values in (cpd_values or {}).items():
+        cpd = model.get_cpds(variable)
+        cpd.values = np.asarray(values, dtype=float).reshape(cpd.cardinality)
+    return model
+
+
+def configured_model():
+    """build_model with the parameter set named by PROPHET_PARAMETER_SET, if any."""
+    version = getattr(settings, 'PROPHET_PARAMETER_SET', None)
+    if not version:
+        return build_model()
+    from .training import load_model
+    return load_model(None if version == 'active' else version)
+
+
+def model_fingerprint(model):
+    # Changes whenever the structure or any CPD value changes, so it doubles
+    # as the version key of the compiled network.
+    digest = hashlib.sha1()
+    for parent, child in sorted(model.edges()):
+        digest.update(f'{parent}->{child};'.encode())
+    for cpd in sorted(model.get_cpds(), key=lambda c: c.variable):
+        digest.update(f'{cpd.variable}:{list(cpd.cardinality)};'.encode())
+        digest.update(np.ascontiguousarray(cpd.get_values(), dtype=float).tobytes())
+    return digest.hexdigest()[:12]
+
+
+EVIDENCE_VARIABLES = ['HomeForm', 'AwayForm', 'HomeInjuries', 'AwayInjuries', 'H2HResult', 'ExternalPrediction']
+EVIDENCE_CARD = (2, 2, 2, 2, 2, 3)
+
+CRITICAL_EFFECTS = ['threat', 'best', 'required']
+EXTERNAL_PREDICTION_STATES = {'1': 0, 'X': 1, '2': 2}
+
+MARKET_LABELS = {
+    'MatchResult': {0: '1', 1: 'X', 2: '2'},
+    'OverUnderResult': {0: 'Over', 1: 'Under'},
+    'GGResult': {0: 'GG', 1: 'No GG'},
+    'HandicapResult': {0: 'Home Handicap Win', 1: 'Draw Handicap', 2: 'Away Handicap Win'},
+    'CorrectScore': {0: '1-0', 1: '2-1', 2: '1-1', 3: '0-2'},
+}
+MARKETS = list(MARKET_LABELS)
+CORRECT_SCORE_PARENTS = ['MatchResult', 'OverUnderResult', 'GGResult']
+OVER_UNDER_LINE = 2.5
+HANDICAP_LINE = -1  # goals given to the home side
+
+
+def market_outcomes(home_goals, away_goals):
+    """Settled state of every market for a final score; CorrectScore is None
+    when the score is not one of its states."""
+    handicap = home_goals + HANDICAP_LINE - away_goals
+    score = f'{home_goals}-{away_goals}'
+    score_states = {label: state for state, label in MARKET_LABELS['CorrectScore'].items()}
+    return {
+        'MatchResult': 0 if home_goals > away_goals else 1 if home_goals == away_goals else 2,
+        'OverUnderResult': 0 if home_goals + away_goals > OVER_UNDER_LINE else 1,
+        'GGResult': 0 if home_goals and away_goals else 1,
+        'HandicapResult': 0 if handicap > 0 else 1 if handicap == 0 else 2,
+        'CorrectScore': score_states.get(score),
+    }
+
+
+def evidence_key(evidence):
+    return tuple(evidence[variable] for variable in EVIDENCE_VARIABLES)
+
+
+@timed('inference')
+def infer_markets(inference, evidence):
+    """Answer every market from a single joint query.
+
+    Returns ``(answers, probabilities)``: the MAP state and the posterior
+    marginal of each market. CorrectScore follows map_answer and is answered
+    given the jointly most likely state of its parents.
+    """
+    joint = inference.query(MARKETS, evidence=evidence, joint=True, show_progress=False)
+    values = joint.values.transpose([joint.variables.index(variable) for variable in MARKETS])
+    values = values / values.sum()
+
+    answers = {}
+    probabilities = {}
+    for axis, variable in enumerate(MARKETS):
+        others = tuple(other for other in range(len(MARKETS)) if other != axis)
+        probabilities[variable] = values.sum(axis=others)
+        answers[variable] = int(np.argmax(probabilities[variable]))
+
+    parent_axes = tuple(MARKETS.index(variable) for variable in CORRECT_SCORE_PARENTS)
+    parents = values.sum(axis=tuple(axis for axis in range(len(MARKETS)) if axis not in parent_axes))
+    parent_states = np.unravel_index(np.argmax(parents), parents.shape)
+    given_parents = values[parent_states].sum(axis=0)  # remaining axes: HandicapResult, CorrectScore
+    answers['CorrectScore'] = int(np.argmax(given_parents))
+    return answers, probabilities
+
+
+@timed('inference')
+def map_answer(inference, variable, evidence):
+    if variable == 'CorrectScore':
+        # CorrectScore is answered given the most likely state of its parents.
+        parents = inference.map_query(CORRECT_SCORE_PARENTS, evidence=evidence, show_progress=False)
+        evidence = dict(evidence, **parents)
+    return inference.map_query([variable], evidence=evidence, show_progress=False)[variable]
+
+
+class AnswerTable:
+    """MAP answers for every market, for every possible evidence combination.
+
+    All evidence variables are discrete, so the table is a dense array of
+    shape EVIDENCE_CARD + (len(MARKETS),) and a prediction is one index.
+    """
+
+    def __init__(self, answers, probabilities):
+        answers.setflags(write=False)
+        for values in probabilities.values():
+            values.setflags(write=False)
+        self.answers = answers
+        self.probabilities = probabilities
+
+    @classmethod
+    def build(cls, inference):
+        answers = np.zeros(EVIDENCE_CARD + (len(MARKETS),), dtype=np.int8)
+        probabilities = {
+            variable: np.zeros(EVIDENCE_CARD + (len(MARKET_LABELS[variable]),))
+            for variable in MARKETS
+        }
+        for key in np.ndindex(*EVIDENCE_CARD):
+            key_answers, key_probabilities = infer_markets(inference, dict(zip(EVIDENCE_VARIABLES, key)))
+            for position, variable in enumerate(MARKETS):
+                answers[key + (position,)] = key_answers[variable]
+                probabilities[variable][key] = key_probabilities[variable]
+        return cls(answers, probabilities)
+
+    @timed('inference')
+    def lookup(self, evidence, variable):
+        return int(self.answers[evidence_key(evidence) + (MARKETS.index(variable),)])
+
+    @timed('inference')
+    def lookup_all(self, evidence):
+        key = evidence_key(evidence)
+        answers = {variable: int(state) for variable, state in zip(MARKETS, self.answers[key])}
+        probabilities = {variable: self.probabilities[variable][key] for variable in MARKETS}
+        return answers, probabilities
+
+    def verify(self, inference):
+        """Return (evidence, variable, table, live) for every disagreement with live inference."""
+        mismatches = []
+        for key in np.ndindex(*EVIDENCE_CARD):
+            evidence = dict(zip(EVIDENCE_VARIABLES, key))
+            for position, variable in enumerate(MARKETS):
+                live = map_answer(inference, variable, evidence)
+                if self.answers[key + (position,)] != live:
+                    mismatches.append((key, variable, int(self.answers[key + (position,)]), live))
+        return mismatches
+
+
+class TensorInference:
+    """Exact inference for whole evidence matrices with NumPy.
+
+    The CPDs are multiplied into one dense joint over every variable (hidden
+    ones summed out), normalised per evidence combination, and reduced to a
+    posterior tensor of shape EVIDENCE_CARD + (card,) per market plus the
+    MAP answers infer_markets would give. Answering N fixtures is then a
+    gather on an (N x 6) evidence matrix.
+    """
+
+    def __init__(self, model):
+        joint = self.contract(model)
+        market_axes = tuple(range(len(EVIDENCE_CARD), joint.ndim))
+        total = joint.sum(axis=market_axes, keepdims=True)
+        posterior = np.divide(joint, total, out=np.zeros_like(joint), where=total > 0)
+
+        self.posteriors = {}
+        for position, variable in enumerate(MARKETS):
+            axis = len(EVIDENCE_CARD) + position
+            self.posteriors[variable] = posterior.sum(axis=tuple(a for a in market_axes if a != axis))
+
+        answers = np.stack(
+            [np.argmax(self.posteriors[variable], axis=-1) for variable in MARKETS], axis=-1,
+        ).astype(np.int8)
+        answers[..., MARKETS.index('CorrectScore')] = self.correct_score_answers(posterior)
+        self.answers = answers
+
+    @staticmethod
+    def contract(model):
+        """Joint over EVIDENCE_VARIABLES + MARKETS as one einsum over the CPD tensors."""
+        kept = EVIDENCE_VARIABLES + MARKETS
+        hidden = sorted(set(model.nodes()) - set(kept))
+        letters = {variable: chr(ord('a') + n) for n, variable in enumerate(kept + hidden)}
+        operands, subscripts = [], []
+        for cpd in model.get_cpds():
+            operands.append(np.asarray(cpd.values, dtype=float))
+            subscripts.append(''.join(letters[variable] for variable in cpd.variables))
+        expression = ','.join(subscripts) + '->' + ''.join(letters[variable] for variable in kept)
+        return np.einsum(expression, *operands, optimize=True)
+
+    @staticmethod
+    def correct_score_answers(posterior):
+        # As infer_markets: CorrectScore given the jointly most likely parents.
+        evidence_cells = int(np.prod(EVIDENCE_CARD))
+        flat = posterior.reshape((evidence_cells,) + posterior.shape[len(EVIDENCE_CARD):])
+        parent_axes = [MARKETS.index(variable) + 1 for variable in CORRECT_SCORE_PARENTS]
+        score_axis = MARKETS.index('CorrectScore') + 1
+        other_axes = [axis for axis in range(1, flat.ndim) if axis not in parent_axes]
+        ordered = flat.transpose([0] + parent_axes + other_axes)
+        parents = ordered.sum(axis=tuple(range(1 + len(parent_axes), ordered.ndim)))
+        best = parents.reshape(evidence_cells, -1).argmax(axis=1)
+        given = ordered.reshape((evidence_cells, -1) + ordered.shape[1 + len(parent_axes):])
+        given = given[np.arange(evidence_cells), best]
+        score_position = other_axes.index(score_axis)
+        given = given.sum(axis=tuple(axis + 1 for axis in range(given.ndim - 1) if axis != score_position))
+        return given.argmax(axis=1).reshape(EVIDENCE_CARD)
+
+    @staticmethod
+    def cells(matrix):
+        matrix = np.asarray(matrix)
+        return np.ravel_multi_index(tuple(matrix.T), EVIDENCE_CARD)
+
+    @timed('inference')
+    def posterior_matrices(self, matrix):
+        """{variable: (N x card) posterior} for an (N x 6) evidence matrix."""
+        cells = self.cells(matrix)
+        return {
+            variable: values.reshape(-1, values.shape[-1])[cells]
+            for variable, values in self.posteriors.items()
+        }
+
+    @timed('inference')
+    def answer_matrix(self, matrix):
+        """(N x len(MARKETS)) MAP states for an (N x 6) evidence matrix."""
+        return self.answers.reshape(-1, len(MARKETS))[self.cells(matrix)]
+
+    def table(self):
+        return AnswerTable(self.answers.copy(), {variable: values.copy() for variable, values in self.posteriors.items()})
+
+
+MarketPrediction = namedtuple('MarketPrediction', ['answer', 'probabilities'])
+
+
+class FixturePrediction(namedtuple('FixturePrediction', ['fixture', 'evidence', 'markets'])):
+    """All five markets for one fixture; ``markets`` maps variable -> MarketPrediction."""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_states(cls, fixture, evidence, answers, probabilities):
+        markets = {}
+        for variable in MARKETS:
+            labels = MARKET_LABELS[variable]
+            markets[variable] = MarketPrediction(
+                labels[answers[variable]],
+                {labels[state]: float(p) for state, p in enumerate(probabilities[variable])},
+            )
+        return cls(fixture, evidence, markets)
+
+    @property
+    def prediction_1x2(self):
+        return self.markets['MatchResult'].answer
+
+    @property
+    def prediction_over_under(self):
+        return self.markets['OverUnderResult'].answer
+
+    @property
+    def prediction_gg(self):
+        return self.markets['GGResult'].answer
+
+    @property
+    def prediction_handicap(self):
+        return self.markets['HandicapResult'].answer
+
+    @property
+    def prediction_correct_score(self):
+        return self.markets['CorrectScore'].answer
+
+
+CompiledModel = namedtuple('CompiledModel', ['version', 'model', 'inference', 'table', 'tensor'])
+
+
+class ModelRegistry:
+    """Builds, validates and compiles the network once per process.
+
+    Every PredictionEngine shares the same CompiledModel. Installing a new
+    network replaces the whole tuple in one assignment, so readers see either
+    the old version or the new one, never a mix. With ``with_table`` the
+    answer table is filled from the tensor backend as part of compiling.
+    """
+
+    def __init__(self, builder=configured_model, with_table=False):
+        self.builder = builder
+        self.with_table = with_table
+        self._lock = threading.Lock()
+        self._compiled = None
+
+    def get(self):
+        compiled = self._compiled
+        if compiled is None:
+            with self._lock:
+                if self._compiled is None:
+                    self._compiled = self.compile(self.builder())
+                compiled = self._compiled
+        return compiled
+
+    def install(self, model):
+        compiled = self.compile(model)
+        with self._lock:
+            if self._compiled is None or self._compiled.version != compiled.version:
+                self._compiled = compiled
+            return self._compiled
+
+    def reset(self):
+        with self._lock:
+            self._compiled = None
+
+    @timed('inference')
+    def compile(self, model):
+        from pgmpy.inference import VariableElimination
 
         model.check_model()
-        return model
+        for cpd in model.get_cpds():
+            cpd.values.setflags(write=False)
+        inference = VariableElimination(model)
+        tensor = TensorInference(model)
+        table = tensor.table() if self.with_table else None
+        return CompiledModel(model_fingerprint(model), model, inference, table, tensor)
+
+
+model_registry = ModelRegistry(with_table=getattr(settings, 'PROPHET_ANSWER_TABLE', True))
+
+
+def warm_up():
+    """Import the inference stack and compile the served model now rather
+    than on the first prediction request; returns the CompiledModel."""
+    return model_registry.get()
+
+
+def init_worker():
+    # Forked workers must not share the parent's database connections;
+    # closing them makes each worker open its own on first use.
+    connections.close_all()
+
+
+def worker_pool(workers):
+    """Forked process pool for the management commands' parallel work.
+
+    The parent closes its connections first so no worker inherits one open.
+    """
+    connections.close_all()
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('fork'), initializer=init_worker,
+    )
+
+
+class PredictionEngine:
+    def __init__(self, fixture_id=None, compiled=None, use_table=True, fixture=None):
+        if fixture is None:
+            fixture = Fixture.objects.select_related('home_team', 'away_team').get(pk=fixture_id)
+        self.fixture = fixture
+        self.home_team = self.fixture.home_team
+        self.away_team = self.fixture.away_team
+        self.compiled = compiled or model_registry.get()
+        self.model = self.compiled.model
+        self.inference = self.compiled.inference
+        self.table = self.compiled.table if use_table else None
 
     def get_evidence(self):
         return {
@@ -105,59 +479,176 @@ class PredictionEngine:
         }
 
     def calculate_form(self, team):
-        forms = team.forms.filter(fixture__date__lt=self.fixture.date).order_by('-game_number')[:5]
-        wins = forms.filter(result='W').count()
+        snapshot = latest_snapshot(team, self.fixture.date)
+        wins = snapshot.last5_wins if snapshot else 0
         return 0 if wins >= 3 else 1  # 0=good, 1=bad
 
     def calculate_injuries(self, team):
-        critical = Player.objects.filter(team=team, injury__isnull=False, effect__in=['threat', 'best', 'required'])
+        critical = Player.objects.filter(team=team, injury__isnull=False, effect__in=CRITICAL_EFFECTS)
         return 0 if not critical.exists() else 1
 
     def calculate_h2h(self):
-        h2h = self.fixture.head_to_heads.order_by('-match_date')[:5]
-        home_wins = [h for h in h2h if int(h.result.split('-')[0]) > int(h.result.split('-')[1])]
-        return 0 if len(home_wins) >= 3 else 1
+        meetings = HeadToHead.objects.between(self.home_team, self.away_team).before(self.fixture.date, last=5)
+        home_wins = meetings.summary(self.home_team)['wins']
+        return 0 if home_wins >= 3 else 1
 
     def calculate_external_pred(self):
-        preds = self.fixture.predictions.filter(prediction_type__name='1X2')
-        if not preds.exists():
+        preds = list(self.fixture.predictions.filter(prediction_type__name='1X2'))
+        if not preds:
             return 0
         best = max(preds, key=lambda p: p.site_accuracy)
-        return {'1': 0, 'X': 1, '2': 2}.get(best.value, 0)
+        return EXTERNAL_PREDICTION_STATES.get(best.value, 0)
+
+    def answer(self, variable):
+        evidence = self.get_evidence()
+        if self.table is not None:
+            state = self.table.lookup(evidence, variable)
+        else:
+            state = map_answer(self.inference, variable, evidence)
+        return MARKET_LABELS[variable][state]
+
+    def predict_all(self):
+        evidence = self.get_evidence()
+        if self.table is not None:
+            answers, probabilities = self.table.lookup_all(evidence)
+        else:
+            answers, probabilities = infer_markets(self.inference, evidence)
+        return FixturePrediction.from_states(self.fixture, evidence, answers, probabilities)
 
     def predict_1x2(self):
-        infer = VariableElimination(self.model)
-        result = infer.map_query(['MatchResult'], evidence=self.get_evidence())
-        return {0: '1', 1: 'X', 2: '2'}[result['MatchResult']]
+        return self.answer('MatchResult')
 
     def predict_over_under(self):
-        infer = VariableElimination(self.model)
-        result = infer.map_query(['OverUnderResult'], evidence=self.get_evidence())
-        return {0: 'Over', 1: 'Under'}[result['OverUnderResult']]
+        return self.answer('OverUnderResult')
 
     def predict_gg(self):
-        infer = VariableElimination(self.model)
-        result = infer.map_query(['GGResult'], evidence=self.get_evidence())
-        return {0: 'GG', 1: 'No GG'}[result['GGResult']]
+        return self.answer('GGResult')
 
     def predict_handicap(self):
-        infer = VariableElimination(self.model)
-        result = infer.map_query(['HandicapResult'], evidence=self.get_evidence())
-        return {0: 'Home Handicap Win', 1: 'Draw Handicap', 2: 'Away Handicap Win'}[result['HandicapResult']]
+        return self.answer('HandicapResult')
 
     def predict_correct_score(self):
-        infer = VariableElimination(self.model)
-        # Include evidence for parent nodes
-        evidence = self.get_evidence()
+        return self.answer('CorrectScore')
+
+
+class EvidenceBatch(namedtuple('EvidenceBatch', ['fixtures', 'fixture_ids', 'matrix'])):
+    """Evidence for many fixtures: ``matrix[i]`` holds EVIDENCE_VARIABLES for ``fixture_ids[i]``."""
+
+    __slots__ = ()
+
+    def row(self, fixture_id):
+        row = int(np.searchsorted(self.fixture_ids, fixture_id))
+        if row == len(self.fixture_ids) or self.fixture_ids[row] != fixture_id:
+            raise KeyError(fixture_id)
+        return row
+
+    def evidence(self, fixture_id):
+        return dict(zip(EVIDENCE_VARIABLES, (int(value) for value in self.matrix[self.row(fixture_id)])))
+
 
-        # Also infer parent nodes since CorrectScore depends on them
-        # First predict MatchResult, OverUnderResult, GGResult
-        intermediate_infer = infer.map_query(['MatchResult', 'OverUnderResult', 'GGResult'], evidence=evidence)
-        
-        # Combine parent predictions into evidence for CorrectScore
-        evidence.update(intermediate_infer)
+def _form_wins(team_field):
+    wins = TeamFormSnapshot.objects.filter(
+        team=OuterRef(team_field), as_of__lt=OuterRef('date'),
+    ).order_by('-as_of').values('last5_wins')[:1]
+    return Coalesce(Subquery(wins), 0)
+
+
+def _h2h_home_wins():
+    # A pair meets at most once a day, so the last five meetings are those on
+    # or after the fifth most recent date: a range on the pair index rather
+    # than pk IN (... LIMIT 5), which MySQL does not support.
+    fifth_latest = HeadToHead.objects.filter(
+        team_a=OuterRef('team_a'), team_b=OuterRef('team_b'), match_date__lt=OuterRef(OuterRef('date')),
+    ).order_by('-match_date').values('match_date')[4:5]
+    home_won = (
+        Q(team_a=OuterRef('home_team'), team_a_goals__gt=F('team_b_goals'))
+        | Q(team_b=OuterRef('home_team'), team_b_goals__gt=F('team_a_goals'))
+    )
+    wins = HeadToHead.objects.filter(
+        home_won,
+        team_a=Least(OuterRef('home_team'), OuterRef('away_team')),
+        team_b=Greatest(OuterRef('home_team'), OuterRef('away_team')),
+        match_date__lt=OuterRef('date'),
+        match_date__gte=Coalesce(Subquery(fifth_latest), F('match_date')),  # fewer than five: all of them
+    ).order_by().annotate(
+        wins=Func(F('pk'), function='COUNT')
+    ).values('wins')
+    return Coalesce(Subquery(wins), 0)
+
+
+def _critical_injuries(team_field):
+    return Exists(Player.objects.filter(
+        team=OuterRef(team_field), injury__isnull=False, effect__in=CRITICAL_EFFECTS,
+    ))
+
+
+def build_evidence_batch(fixtures):
+    """Evidence for every fixture in ``fixtures`` in one query.
+
+    Matches PredictionEngine.get_evidence fixture by fixture: the fixture
+    query carries form, injury, head-to-head and external-prediction
+    subqueries, each an indexed lookup per fixture.
+    """
+    best_external = Prediction.objects.filter(
+        fixture=OuterRef('pk'), prediction_type__name='1X2',
+    ).order_by('-site_accuracy', 'pk').values('value')[:1]
+    annotated = list(fixtures.select_related('home_team', 'away_team').annotate(
+        home_form_wins=_form_wins('home_team'),
+        away_form_wins=_form_wins('away_team'),
+        home_critical_injuries=_critical_injuries('home_team'),
+        away_critical_injuries=_critical_injuries('away_team'),
+        h2h_home_wins=_h2h_home_wins(),
+        best_external_prediction=Subquery(best_external),
+    ).order_by('pk'))
+
+    matrix = np.empty((len(annotated), len(EVIDENCE_VARIABLES)), dtype=np.int8)
+    for row, fixture in enumerate(annotated):
+        matrix[row] = (
+            0 if fixture.home_form_wins >= 3 else 1,
+            0 if fixture.away_form_wins >= 3 else 1,
+            1 if fixture.home_critical_injuries else 0,
+            1 if fixture.away_critical_injuries else 0,
+            0 if fixture.h2h_home_wins >= 3 else 1,
+            EXTERNAL_PREDICTION_STATES.get(fixture.best_external_prediction, 0),
+        )
+    fixture_ids = np.array([fixture.pk for fixture in annotated], dtype=np.int64)
+    return EvidenceBatch(annotated, fixture_ids, matrix)
+
+
+def predict_batch(fixtures, compiled=None, use_table=True):
+    """FixturePrediction for every fixture in ``fixtures``, in fixture id order.
+
+    With ``use_table`` all fixtures are answered in one pass of the tensor
+    backend; otherwise each distinct evidence vector is a live pgmpy query.
+    """
+    compiled = compiled or model_registry.get()
+    batch = build_evidence_batch(fixtures)
+    if not use_table:
+        answered = {}
+        return [
+            predict_evidence(fixture, batch.evidence(fixture.pk), compiled, use_table, answered)
+            for fixture in batch.fixtures
+        ]
+
+    answers = compiled.tensor.answer_matrix(batch.matrix)
+    posteriors = compiled.tensor.posterior_matrices(batch.matrix)
+    return [
+        FixturePrediction.from_states(
+            fixture, batch.evidence(fixture.pk),
+            dict(zip(MARKETS, answers[row])),
+            {variable: posteriors[variable][row] for variable in MARKETS},
+        )
+        for row, fixture in enumerate(batch.fixtures)
+    ]
 
-        result = infer.map_query(['CorrectScore'], evidence=evidence)
 
-        score_mapping = {0: '1-0', 1: '2-1', 2: '1-1', 3: '0-2'}
-        return score_mapping[result['CorrectScore']]
+def predict_evidence(fixture, evidence, compiled, use_table=True, answered=None):
+    """FixturePrediction for already gathered evidence; ``answered`` memoises by evidence key."""
+    answered = {} if answered is None else answered
+    key = evidence_key(evidence)
+    if key not in answered:
+        if use_table and compiled.table is not None:
+            answered[key] = compiled.table.lookup_all(evidence)
+        else:
+            answered[key] = infer_markets(compiled.inference, evidence)
+    return FixturePrediction.from_states(fixture, evidence, *answered[key])
@@ -1,16 +1,37 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.core.exceptions import BadRequest, ValidationError
+from django.db.models import Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import close_old_connections
+from asgiref.sync import sync_to_async
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import logout
-from django.core.mail import send_mail
-from django.utils.crypto import get_random_string
 from django.conf import settings
 from django.contrib import messages
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time
 
 from .models import Gambler, PasswordResetToken, System_User, Country, Team, Fixture, League
 from .forms import SignUpForm, LoginForm, UploadFileForm, ResetForm, PasswordResetForm
 
-from .utils import PredictionEngine
+from .importers import FILE_EXTENSIONS, IMPORTERS, import_file
+from .outbox import RESET_TOKEN, enqueue
+from .profiles import load_profile, remember, request_profile
+from .stats import dashboard_context
+from .store import load_predictions, predictions_etag
+from .utils import build_evidence_batch, model_registry
 
 from django.views.generic import TemplateView
 
@@ -55,10 +76,10 @@ class LoginView(View):
             if self.is_username(username):
                 user = System_User.objects.filter(username=username).first()
                 if user and user.check_password(password):
-                    gambler = Gambler.objects.filter(username=username).first()
-                    if gambler:
-                        request.session['username'] = user.username
-                        request.session['email_address'] = gambler.email_address
+                    profile = load_profile(user.username)
+                    if profile:
+                        request.session.cycle_key()
+                        remember(request.session, profile)
                         return redirect('dashboard')  # Added redirect after successful login
         return render(request, self.template_name, {'form': form})
 
@@ -83,15 +104,15 @@ class ResetPasswordView(View):
             user = System_User.objects.filter(username=username).first()
             if user:
                 try:
-                    token = get_random_string(length=32)
-                    PasswordResetToken.objects.create(username=user, token=token)
-                    reset_link = request.build_absolute_uri(f'/reset-password/{token}/')
-                    send_mail(
+                    # Queued for the send_emails worker so a slow mail server never holds up the request.
+                    # The worker issues the token as it sends, so the queue never holds a usable link.
+                    reset_link = request.build_absolute_uri('/reset-password/') + RESET_TOKEN + '/'
+                    enqueue(
                         'Reset Your Password',
                         f'Click the link to reset your password: {reset_link}',
-                        settings.EMAIL_HOST_USER,
                         [user.username],
-                        fail_silently=False,
+                        from_email=settings.EMAIL_HOST_USER,
+                        kind='reset',
                     )
                     success_message = f"A password reset link has been sent to {user.username}."
                     return render(request, self.template_name, {'form': form, 'success_message': success_message})
@@ -107,18 +128,18 @@ class ResetPasswordConfirmView(View):
 
     def get(self, request, token):
         form = ResetForm()
-        token_obj = PasswordResetToken.objects.filter(token=token).first()
+        token_obj = PasswordResetToken.objects.usable(token)
 
-        if not token_obj or token_obj.is_expired():
+        if not token_obj:
             error_message = "Token is invalid or expired."
             return render(request, self.template_name, {'form': form, 'token': token, 'error_message': error_message})
         return render(request, self.template_name, {'form': form, 'token': token})
 
     def post(self, request, token):
         form = ResetForm(request.POST)
-        token_obj = PasswordResetToken.objects.filter(token=token).first()
+        token_obj = PasswordResetToken.objects.usable(token)
 
-        if not token_obj or token_obj.is_expired():
+        if not token_obj:
             error_message = "Token is invalid or expired."
             return render(request, self.template_name, {'form': form, 'token': token, 'error_message': error_message})
 
@@ -133,57 +154,363 @@ class ResetPasswordConfirmView(View):
 
 class DashboardView(View):
     def get(self, request):
-        username = request.session.get('username')
-        if not username:
+        if not request.gambler:
             return redirect('login')
+        return render(request, 'dashboard.html', dashboard_context(request.gambler))
 
-        gambler = Gambler.objects.filter(username=username).first()
-        if not gambler:
-            return redirect('login')
-
-        user = System_User.objects.get(username=username)
+@method_decorator(staff_member_required, name='dispatch')
+class ImportView(View):
+    """Upload a CSV or Excel file of fixtures, forms, H2H, players or injuries.
 
-        total_countries = Country.objects.count()
-        total_teams = Team.objects.count()
-        total_fixtures = Fixture.objects.count()
+    Imports overwrite fixtures, results (which feed training), players and
+    injuries, so only staff may run them.
+    """
+    template_name = 'import.html'
+    chunk_size = getattr(settings, 'PROPHET_IMPORT_CHUNK_SIZE', 2000)
 
-        teams = Team.objects.all()[:5]
-        leagues = League.objects.all()[:5]
+    def get(self, request):
+        return render(request, self.template_name, self.get_context(UploadFileForm()))
 
-        context = {
-            'last_name': gambler.last_name,
-            'user': user,
-            'total_countries': total_countries,
-            'total_teams': total_teams,
-            'total_fixtures': total_fixtures,
-            'teams': teams,
-            'leagues': leagues,
+    def post(self, request):
+        form = UploadFileForm(request.POST, request.FILES)
+        report = None
+        if form.is_valid():
+            try:
+                report = import_file(form.cleaned_data['kind'], request.FILES['file'], chunk_size=self.chunk_size)
+            except ValidationError as exc:
+                form.add_error('file', exc)
+        return render(request, self.template_name, self.get_context(form, report))
+
+    def get_context(self, form, report=None):
+        return {
+            'form': form,
+            'report': report,
+            'columns': {kind: (', '.join(importer.columns), ', '.join(importer.optional_columns))
+                        for kind, importer in IMPORTERS.items()},
+            'extensions': ', '.join(FILE_EXTENSIONS),
         }
-        return render(request, 'dashboard.html', context)
 
-class LeagueFixturesPredictionView(TemplateView):
+
+def fixture_cursor(fixture):
+    return f'{fixture.date.isoformat()}_{fixture.time.isoformat()}_{fixture.pk}'
+
+
+def parse_fixture_cursor(cursor):
+    fixture_date, fixture_time, pk = cursor.split('_')
+    return date.fromisoformat(fixture_date), time.fromisoformat(fixture_time), int(pk)
+
+
+def fixtures_after(fixtures, cursor):
+    """Keyset filter on (date, time, id), matching fixture_order."""
+    fixture_date, fixture_time, pk = cursor
+    return fixtures.filter(
+        Q(date__gt=fixture_date)
+        | Q(date=fixture_date, time__gt=fixture_time)
+        | Q(date=fixture_date, time=fixture_time, pk__gt=pk)
+    )
+
+
+def fixture_order(prediction):
+    return prediction.fixture.date, prediction.fixture.time, prediction.fixture.pk
+
+
+class LeagueWindowMixin:
+    paginate_by = getattr(settings, 'PROPHET_FIXTURES_PER_PAGE', 50)
+
+    def get_window(self):
+        """Fixtures of the league inside the requested date window, in keyset order."""
+        self.league = get_object_or_404(League, pk=self.kwargs.get('pk'))
+        self.parse_window()
+        return self.window_fixtures(self.league.pk)
+
+    def parse_window(self):
+        params = self.request.GET
+        try:
+            self.date_from = date.fromisoformat(params['from']) if params.get('from') else timezone.localdate()
+            self.date_to = date.fromisoformat(params['to']) if params.get('to') else None
+            self.after = parse_fixture_cursor(params['after']) if params.get('after') else None
+        except ValueError:
+            raise BadRequest('Invalid date range or cursor.')
+
+    def window_fixtures(self, league_id):
+        fixtures = Fixture.objects.filter(league_id=league_id, date__gte=self.date_from)
+        if self.date_to:
+            fixtures = fixtures.filter(date__lte=self.date_to)
+        return fixtures.order_by('date', 'time', 'pk')
+
+    def page_ids(self, fixtures, after, size):
+        """Ids of the next ``size`` fixtures after ``after`` and whether more follow."""
+        if after:
+            fixtures = fixtures_after(fixtures, after)
+        page_ids = list(fixtures.values_list('pk', flat=True)[:size + 1])
+        return page_ids[:size], len(page_ids) > size
+
+
+class LeagueFixturesPredictionView(LeagueWindowMixin, TemplateView):
     template_name = 'league_fixtures.html'
+    row_template_name = 'league_fixtures_row.html'
+    empty_row_template_name = 'league_fixtures_empty_row.html'
+    stream_chunk_size = 500
+    stream_marker = '<!-- fixture rows -->'
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('stream'):
+            return self.stream()
+        return super().get(request, *args, **kwargs)
+
+    def predict_page(self, fixtures, after, size):
+        """Predictions for the next ``size`` fixtures after ``after`` and whether more follow."""
+        page_ids, has_next = self.page_ids(fixtures, after, size)
+        predictions = load_predictions(Fixture.objects.filter(pk__in=page_ids))
+        return sorted(predictions, key=fixture_order), has_next
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        league_id = self.kwargs.get('pk')
-        league = get_object_or_404(League, pk=league_id)
-        fixtures = Fixture.objects.filter(league=league)
-
-        fixtures_with_predictions = []
-        for fixture in fixtures:
-            engine = PredictionEngine(fixture_id=fixture.pk)
-            fixture_data = {
-                'fixture': fixture,
-                'prediction_1x2': engine.predict_1x2(),
-                'prediction_over_under': engine.predict_over_under(),
-                'prediction_gg': engine.predict_gg(),
-                'prediction_handicap': engine.predict_handicap(),
-                'prediction_correct_score': engine.predict_correct_score(),
-            }
-            fixtures_with_predictions.append(fixture_data)
+        fixtures = self.get_window()
+        fixtures_with_predictions, has_next = self.predict_page(fixtures, self.after, self.paginate_by)
+
+        next_query = None
+        if has_next:
+            next_query = self.request.GET.copy()
+            next_query['after'] = fixture_cursor(fixtures_with_predictions[-1].fixture)
+            next_query = next_query.urlencode()
 
-        context['league'] = league
+        context['league'] = self.league
         context['fixtures_with_predictions'] = fixtures_with_predictions
+        context['next_query'] = next_query
         return context
 
+    def stream(self):
+        """Render the whole window, writing table rows as each chunk is predicted."""
+        fixtures = self.get_window()
+        page = render_to_string(self.template_name, {
+            'league': self.league, 'streaming': True, 'stream_marker': self.stream_marker,
+        }, request=self.request)
+        head, tail = page.split(self.stream_marker, 1)
+        row_template = get_template(self.row_template_name)
+
+        def rows():
+            yield head
+            after = self.after
+            written = 0
+            while True:
+                predictions, has_next = self.predict_page(fixtures, after, self.stream_chunk_size)
+                for item in predictions:
+                    yield row_template.render({'item': item})
+                written += len(predictions)
+                if not has_next:
+                    break
+                after = fixture_order(predictions[-1])
+            if not written:
+                yield get_template(self.empty_row_template_name).render()
+            yield tail
+
+        return StreamingHttpResponse(rows())
+
+
+API_MARKETS = {
+    'MatchResult': '1x2',
+    'OverUnderResult': 'over_under',
+    'GGResult': 'gg',
+    'HandicapResult': 'handicap',
+    'CorrectScore': 'correct_score',
+}
+
+
+def prediction_as_json(prediction):
+    fixture = prediction.fixture
+    return {
+        'id': fixture.pk,
+        'league': fixture.league_id,
+        'date': fixture.date.isoformat(),
+        'time': fixture.time.isoformat(),
+        'home_team': fixture.home_team.name,
+        'away_team': fixture.away_team.name,
+        'markets': {
+            key: {
+                'prediction': prediction.markets[market].answer,
+                'probabilities': prediction.markets[market].probabilities,
+            }
+            for market, key in API_MARKETS.items()
+        },
+    }
+
+
+class PredictionAPIView(View):
+    """Base for the JSON prediction endpoints.
+
+    The ETag is computed from the bulk evidence and the model version before
+    any stored prediction is read, so an unchanged poll is answered with 304
+    after the evidence queries alone. The source tables carry no modification
+    times, so no Last-Modified is sent.
+    """
+
+    def extra_data(self, batch):
+        return {}
+
+    def respond(self, fixtures, require_fixture=False):
+        compiled = model_registry.get()
+        batch = build_evidence_batch(fixtures)
+        if require_fixture and not batch.fixtures:
+            raise Http404('No fixture matches the given query.')
+
+        data = self.extra_data(batch)
+        digest = hashlib.sha1(predictions_etag(batch, compiled.version).encode())
+        digest.update(json.dumps(data, sort_keys=True).encode())
+        etag = f'"{digest.hexdigest()}"'
+        response = get_conditional_response(self.request, etag=etag)
+        if response is None:
+            predictions = load_predictions(fixtures, compiled=compiled, batch=batch)
+            data['fixtures'] = [
+                prediction_as_json(prediction) for prediction in sorted(predictions, key=fixture_order)
+            ]
+            response = JsonResponse(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+class FixturePredictionAPIView(PredictionAPIView):
+    def get(self, request, pk):
+        return self.respond(Fixture.objects.filter(pk=pk), require_fixture=True)
+
+
+class LeaguePredictionAPIView(LeagueWindowMixin, PredictionAPIView):
+    def get(self, request, pk):
+        fixtures = self.get_window()
+        page_ids, self.has_next = self.page_ids(fixtures, self.after, self.paginate_by)
+        return self.respond(Fixture.objects.filter(pk__in=page_ids))
+
+    def extra_data(self, batch):
+        next_cursor = None
+        if self.has_next:
+            next_cursor = fixture_cursor(max(batch.fixtures, key=lambda f: (f.date, f.time, f.pk)))
+        return {'league': self.league.pk, 'next': next_cursor}
+
+
+class BulkPredictionAPIView(PredictionAPIView):
+    max_ids = getattr(settings, 'PROPHET_API_MAX_IDS', 500)
+
+    def get(self, request):
+        try:
+            ids = sorted({int(value) for value in request.GET.get('ids', '').split(',') if value.strip()})
+        except ValueError:
+            return JsonResponse({'error': 'ids must be a comma-separated list of fixture ids.'}, status=400)
+        if not ids:
+            return JsonResponse({'error': 'ids is required.'}, status=400)
+        if len(ids) > self.max_ids:
+            return JsonResponse({'error': f'At most {self.max_ids} ids per request.'}, status=400)
+        return self.respond(Fixture.objects.filter(pk__in=ids))
+
+    def extra_data(self, batch):
+        found = {int(fixture_id) for fixture_id in batch.fixture_ids}
+        ids = {int(value) for value in self.request.GET['ids'].split(',') if value.strip()}
+        return {'missing': sorted(ids - found)}
+
+
+class InferenceQueueFull(Exception):
+    pass
+
+
+class BoundedExecutor:
+    """Thread pool for blocking prediction work called from async views.
+
+    At most ``max_pending`` jobs may be running or queued; past that
+    ``run`` raises InferenceQueueFull instead of letting requests pile up.
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.pending = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise InferenceQueueFull()
+            self.pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='prophet-inference')
+        try:
+            # Run in a copy of the request's context so per-request instrumentation follows the job.
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, context.run, closing_connections(func), *args,
+            )
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+
+inference_executor = BoundedExecutor(
+    getattr(settings, 'PROPHET_INFERENCE_WORKERS', 4),
+    getattr(settings, 'PROPHET_INFERENCE_QUEUE', 16),
+)
+
+
+def closing_connections(func):
+    # Worker threads live outside the request cycle, so they release their
+    # database connections the way request_finished would.
+    @functools.wraps(func)
+    def wrapper(*args):
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return wrapper
+
+
+def concurrent_read(func):
+    """Await ``func`` on its own thread so independent reads overlap."""
+    return sync_to_async(closing_connections(func), thread_sensitive=False)()
+
+
+def overloaded():
+    response = HttpResponse('Prediction service is busy, please retry shortly.', status=503)
+    response['Retry-After'] = '5'
+    return response
+
+
+class AsyncDashboardView(View):
+    async def get(self, request):
+        profile = await sync_to_async(request_profile)(request)
+        if not profile:
+            return redirect('login')
+
+        context = await concurrent_read(lambda: dashboard_context(profile))
+        return await sync_to_async(render)(request, 'dashboard.html', context)
+
+
+class AsyncLeagueFixturesPredictionView(LeagueWindowMixin, View):
+    template_name = 'league_fixtures.html'
+
+    async def get(self, request, pk):
+        if request.GET.get('stream'):
+            # A streamed window is predicted chunk by chunk as it is written,
+            # which the synchronous view already does.
+            return await sync_to_async(LeagueFixturesPredictionView.as_view())(request, pk=pk)
+        self.parse_window()
+        fixtures = self.window_fixtures(pk)
+        league, (page_ids, has_next) = await asyncio.gather(
+            concurrent_read(lambda: League.objects.filter(pk=pk).first()),
+            concurrent_read(lambda: self.page_ids(fixtures, self.after, self.paginate_by)),
+        )
+        if league is None:
+            raise Http404('No League matches the given query.')
+
+        try:
+            predictions = await inference_executor.run(load_predictions, Fixture.objects.filter(pk__in=page_ids))
+        except InferenceQueueFull:
+            return overloaded()
+        predictions.sort(key=fixture_order)
+
+        next_query = None
+        if has_next:
+            next_query = request.GET.copy()
+            next_query['after'] = fixture_cursor(predictions[-1].fixture)
+            next_query = next_query.urlencode()
+
+        context = {'league': league, 'fixtures_with_predictions': predictions, 'next_query': next_query}
+        return await sync_to_async(render)(request, self.template_name, context)
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'soccer.settings')
 
 application = get_asgi_application()
+
+if getattr(settings, 'PROPHET_WARM_UP', False):
+    # Pay for pgmpy and model compilation at worker boot, not on the first prediction.
+    from prophet.utils import warm_up
+    warm_up()
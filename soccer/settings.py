@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -59,6 +60,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'prophet.profiles.GamblerMiddleware',
     'allauth.account.middleware.AccountMiddleware',  # ✅ ADD THIS LINE
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -136,3 +138,119 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Prediction engine
+# Enumerate every evidence combination when the network is compiled so
+# predictions are array lookups instead of pgmpy queries.
+PROPHET_ANSWER_TABLE = True
+
+# Fixtures per page on the league predictions page.
+PROPHET_FIXTURES_PER_PAGE = 50
+
+# Largest ?ids= list accepted by the bulk prediction API.
+PROPHET_API_MAX_IDS = 500
+
+# Serve the dashboard and league pages from the async views (for the ASGI
+# entry point). Prediction work then runs on a bounded thread pool and
+# requests beyond PROPHET_INFERENCE_QUEUE running or queued jobs get a 503.
+PROPHET_ASYNC_VIEWS = False
+PROPHET_INFERENCE_WORKERS = 4
+PROPHET_INFERENCE_QUEUE = 16
+
+# Rows per transaction for the CSV/Excel importer at /import/.
+PROPHET_IMPORT_CHUNK_SIZE = 2000
+
+# Learned CPDs to serve: None keeps the built-in placeholder CPDs, 'active'
+# loads the parameter set activated by `manage.py train_model --activate`,
+# any other value is a parameter set version.
+PROPHET_PARAMETER_SET = None
+
+# First month of a season, used by `manage.py backtest` to group fixtures
+# into seasons ('2024/25'); 1 makes seasons calendar years.
+PROPHET_SEASON_START_MONTH = 7
+
+# Import pgmpy and compile the model when a WSGI/ASGI worker boots. Off in
+# development so the autoreloader and manage.py commands stay fast; pgmpy is
+# otherwise loaded on the first prediction.
+PROPHET_WARM_UP = not DEBUG
+
+# Per-request SQL, inference and render timings as a Server-Timing header,
+# aggregated into histograms at /metrics (Prometheus text, per process).
+# Off unless PROPHET_INSTRUMENTATION=1 is set: the header exposes server
+# internals. When off the middleware removes itself and /metrics answers 404.
+# When on, /metrics is open to staff and to the scraper addresses listed in
+# PROPHET_METRICS_ALLOWED_IPS (comma-separated).
+PROPHET_INSTRUMENTATION = os.environ.get('PROPHET_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+PROPHET_METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('PROPHET_METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+MIDDLEWARE.insert(0, 'prophet.instrumentation.ServerTimingMiddleware')
+
+# Per-connection SQLite settings, applied by prophet.database when a
+# connection opens. WAL lets readers run alongside the writer, but it is
+# stored in the database file and leaves -wal/-shm files next to it, so it
+# is only switched on for deployments (PROPHET_SQLITE_WAL=1), never for the
+# checked-in db.sqlite3.
+PROPHET_SQLITE_PRAGMAS = {
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+}
+if os.environ.get('PROPHET_SQLITE_WAL', '').lower() in ('1', 'true', 'yes'):
+    PROPHET_SQLITE_PRAGMAS['journal_mode'] = 'wal'
+
+# Database aliases that serve prediction and dashboard reads during requests
+# (prophet.database.ReplicaRouter). Writes always go to 'default', and a
+# client that wrote is kept on it for PROPHET_REPLICA_PIN_SECONDS. To try it
+# locally, copy db.sqlite3 and point PROPHET_SQLITE_REPLICA at the copy.
+PROPHET_READ_REPLICAS = []
+PROPHET_REPLICA_PIN_SECONDS = 15
+if os.environ.get('PROPHET_SQLITE_REPLICA'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['PROPHET_SQLITE_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    PROPHET_READ_REPLICAS = ['replica']
+if PROPHET_READ_REPLICAS:
+    DATABASE_ROUTERS = ['prophet.database.ReplicaRouter']
+    MIDDLEWARE.insert(0, 'prophet.database.ReplicaPinningMiddleware')
+
+# One cache shared by every worker process. Profile versions (prophet.profiles)
+# and the dashboard showcase (prophet.stats) are invalidated by writing to it,
+# so a per-process cache would keep serving other workers stale copies. Set
+# PROPHET_REDIS_URL in production; the database cache needs no extra service
+# (its table is created by migrate) but turns every cache read into a query:
+# a warm dashboard view costs four (session, profile version, showcase and
+# the counters) instead of the one it costs with Redis.
+if os.environ.get('PROPHET_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['PROPHET_REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'prophet_cache',
+        },
+    }
+
+# Sessions are read from the cache and written through to the database, so
+# a logged-in page view never reads django_session. The gambler's profile
+# snapshot lives in the session as request.gambler (prophet.profiles).
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Minutes a password reset link stays valid. Expired tokens are removed by
+# `manage.py purge_expired_tokens` (run it from cron).
+PROPHET_RESET_TOKEN_MINUTES = 5
+
+# Outbound email queue (prophet.outbox): views enqueue, `manage.py send_emails` sends.
+PROPHET_EMAIL_BATCH_SIZE = 100  # messages per SMTP connection
+PROPHET_EMAIL_MAX_ATTEMPTS = 5
+PROPHET_EMAIL_RETRY_SECONDS = 60  # first retry delay, doubled per attempt
+PROPHET_EMAIL_RETRY_MAX_SECONDS = 3600
+PROPHET_EMAIL_LEASE_SECONDS = 300  # after this a dead worker's batch is sent again
+
+# Admin changelists of unfiltered tables the database estimates above this many
+# rows show that estimate instead of running COUNT(*).
+PROPHET_ADMIN_EXACT_COUNT_LIMIT = 100000
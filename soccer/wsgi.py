@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'soccer.settings')
 
 application = get_wsgi_application()
+
+if getattr(settings, 'PROPHET_WARM_UP', False):
+    # Pay for pgmpy and model compilation at worker boot, not on the first prediction.
+    from prophet.utils import warm_up
+    warm_up()